@@ -1,7 +1,10 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, m2m_changed
 from django.dispatch import receiver
 from .models import FriendRequest
+from Profile import graph
 from Profile.models import Profile
+from Posts import timeline
 
 @receiver(post_save, sender=FriendRequest)
 def update_friends_on_accept(sender, instance, **kwargs):
@@ -9,7 +12,44 @@ def update_friends_on_accept(sender, instance, **kwargs):
         from_profile = instance.from_user.profile
         to_profile = instance.to_user.profile
 
-        if to_profile not in from_profile.friends.all():
+        if not graph.are_friends(from_profile.user_id, to_profile.user_id):
             from_profile.friends.add(to_profile)
-        if from_profile not in to_profile.friends.all():
-            to_profile.friends.add(from_profile)
+
+@receiver(m2m_changed, sender=Profile.friends.through)
+def invalidate_timelines_on_friends_change(sender, instance, action, pk_set, **kwargs):
+    if action in ("post_add", "post_remove"):
+        user_ids = Profile.objects.filter(pk__in=pk_set).values_list("user_id", flat=True)
+    elif action == "pre_clear":
+        user_ids = instance.friends.values_list("user_id", flat=True)
+    else:
+        return
+    user_ids = list(user_ids)
+    timeline.invalidate_users([instance.user_id, *user_ids])
+
+    if action == "post_add":
+        transaction.on_commit(lambda: graph.add_friends(instance.user_id, user_ids))
+    elif action == "post_remove":
+        transaction.on_commit(lambda: graph.remove_friends(instance.user_id, user_ids))
+    else:
+        transaction.on_commit(lambda: graph.forget(graph.FRIENDS, [instance.user_id, *user_ids]))
+
+@receiver(m2m_changed, sender=Profile.blocked_users.through)
+def update_graph_on_blocks_change(sender, instance, action, pk_set, reverse, **kwargs):
+    if reverse:
+        # Changed from the User.blocked_by side: pk_set holds blocking profiles.
+        if action in ("post_add", "post_remove"):
+            owners = list(Profile.objects.filter(pk__in=pk_set).values_list("user_id", flat=True))
+        elif action == "pre_clear":
+            owners = list(instance.blocked_by.values_list("user_id", flat=True))
+        else:
+            return
+        transaction.on_commit(lambda: graph.forget(graph.BLOCKS, owners))
+        return
+    if action == "post_add":
+        blocked = list(pk_set)
+        transaction.on_commit(lambda: graph.add_blocks(instance.user_id, blocked))
+    elif action == "post_remove":
+        blocked = list(pk_set)
+        transaction.on_commit(lambda: graph.remove_blocks(instance.user_id, blocked))
+    elif action == "post_clear":
+        transaction.on_commit(lambda: graph.forget(graph.BLOCKS, [instance.user_id]))
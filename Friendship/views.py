@@ -6,21 +6,17 @@ from django.db.models import Q
 from .models import FriendRequest
 from Profile.models import Profile
 from .serializers import FriendRequestSerializer
-from events.utils import send_real_time
+from events.utils import send_real_time_many, user_group
 from django.contrib.auth.models import User
 
 def broadcast_friend_request(instance: FriendRequest, event_type: str, request=None):
-    for user in [instance.from_user, instance.to_user]:
-        context = {"request": request}
-        data = FriendRequestSerializer(instance, context=context).data
-        data["type"] = event_type
-        
-
-        send_real_time(
-            event_type="friend_request",
-            recipient_group=f"user_{user.id}",
-            data=data
-        )
+    data = FriendRequestSerializer(instance, context={"request": request}).data
+    data["type"] = event_type
+    send_real_time_many(
+        event_type="friend_request",
+        recipient_groups=[user_group(instance.from_user_id), user_group(instance.to_user_id)],
+        data=data
+    )
 
 class FriendRequestViewSet(viewsets.ModelViewSet):
     queryset = FriendRequest.objects.all()
@@ -115,8 +111,8 @@ class FriendRequestViewSet(viewsets.ModelViewSet):
         from_profile = request.user.profile
         to_profile = target_user.profile
 
+        # Symmetrical, so one remove drops both rows and updates the graph cache.
         from_profile.friends.remove(to_profile)
-        to_profile.friends.remove(from_profile)
 
         FriendRequest.objects.filter(
             Q(from_user=request.user, to_user=target_user) |
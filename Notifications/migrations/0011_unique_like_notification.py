@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Notifications', '0010_alter_notifications_notification_type'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # get_or_create could race into duplicate like notifications; keep the oldest.
+        migrations.RunSQL(
+            """
+            DELETE FROM "Notifications_notifications" dup
+            USING "Notifications_notifications" kept
+            WHERE dup.notification_type IN ('post_like', 'comment_like')
+              AND dup.notification_type = kept.notification_type
+              AND dup.to_user_id = kept.to_user_id
+              AND dup.actor_id = kept.actor_id
+              AND dup.target_content_type_id = kept.target_content_type_id
+              AND dup.target_object_id = kept.target_object_id
+              AND dup.id > kept.id
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='notifications',
+            constraint=models.UniqueConstraint(condition=models.Q(('notification_type__in', ['post_like', 'comment_like'])), fields=('to_user', 'actor', 'notification_type', 'target_content_type', 'target_object_id'), name='notif_unique_like'),
+        ),
+    ]
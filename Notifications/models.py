@@ -55,4 +55,12 @@ class Notifications(models.Model):  # renamed to singular
         indexes = [
             models.Index(fields=['to_user', 'is_read', '-created_at']),
             models.Index(fields=['to_user', 'active', '-created_at']),
+        ]
+        constraints = [
+            # One like notification per liker and post; the like fast path upserts it.
+            models.UniqueConstraint(
+                fields=['to_user', 'actor', 'notification_type', 'target_content_type', 'target_object_id'],
+                condition=models.Q(notification_type__in=['post_like', 'comment_like']),
+                name='notif_unique_like',
+            ),
         ]
\ No newline at end of file
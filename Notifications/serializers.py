@@ -32,6 +32,8 @@ class NotificationsSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(avatar.url)
         return None
     def get_parent_post_id(self, obj):
+        if "parent_post_id" in self.context:
+            return self.context["parent_post_id"]
         if obj.target_content_type.model == "post":
             try:
                 post = Post.objects.get(id=obj.target_object_id)
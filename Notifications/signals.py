@@ -5,10 +5,11 @@ from django.dispatch import receiver
 from django.contrib.contenttypes.models import ContentType
 
 from Notifications.serializers import NotificationsSerializer
-from Profile.models import Profile
+from Profile import graph
 from Posts.models import Post, Like
+from . import stamps
 from .models import Notifications
-from events.utils import send_real_time
+from events.utils import send_real_time, send_real_time_each, user_group
 
 
 
@@ -28,29 +29,36 @@ def notify_friends_new_post(sender, instance, created, **kwargs):
         return
     post_ct = ContentType.objects.get_for_model(Post)
     author  = instance.author
-    friends = Profile.objects.get(user=author).friends.all()
+    friend_ids = graph.friend_ids(author.id)
 
     notifs = [
-        make_notification(
-            recipient=f.user,
+        Notifications(
+            to_user_id=friend_id,
             actor=author,
-            n_type=Notifications.NEW_POST,
-            ct=post_ct,
-            obj_id=instance.pk
+            notification_type=Notifications.NEW_POST,
+            target_content_type=post_ct,
+            target_object_id=instance.pk,
         )
-        for f in friends
+        for friend_id in friend_ids
     ]
     with transaction.atomic():
         Notifications.objects.bulk_create(notifs)
-        for notif in notifs:
-            try:
-                send_real_time(
-                    event_type="notification_message",
-                    recipient_group=f"user_{notif.to_user.id}",
-                    data=NotificationsSerializer(notif).data
+        stamps.touch(friend_ids)
+        if not notifs:
+            return
+        # The payloads only differ in id and timestamp, so serialize once.
+        payload = NotificationsSerializer(notifs[0], context={"parent_post_id": instance.pk}).data
+        created_at = NotificationsSerializer().fields["created_at"]
+        send_real_time_each(
+            "notification_message",
+            [
+                (
+                    user_group(notif.to_user_id),
+                    {**payload, "id": notif.id, "created_at": created_at.to_representation(notif.created_at)},
                 )
-            except Exception:
-                pass
+                for notif in notifs
+            ],
+        )
         
 @receiver(post_save, sender=Post, dispatch_uid="notif_post_quote")
 def notify_post_quote(sender, instance, created, **kwargs):
@@ -69,14 +77,11 @@ def notify_post_quote(sender, instance, created, **kwargs):
     )
     with transaction.atomic():
         notif.save()
-        try:
-            send_real_time(
-                event_type="notification_message",
-                recipient_group=f"user_{notif.to_user.id}",
-                data=NotificationsSerializer(notif).data
-            )
-        except Exception:
-            pass
+        send_real_time(
+            event_type="notification_message",
+            recipient_group=f"user_{notif.to_user.id}",
+            data=NotificationsSerializer(notif).data
+        )
 
 @receiver(post_save, sender=Post, dispatch_uid="notif_post_comment")
 def notify_post_comment(sender, instance, created, **kwargs):
@@ -95,14 +100,11 @@ def notify_post_comment(sender, instance, created, **kwargs):
     )
     with transaction.atomic():
         notif.save()
-        try:
-            send_real_time(
-                event_type="notification_message",
-                recipient_group=f"user_{notif.to_user.id}",
-                data=NotificationsSerializer(notif).data
-            )
-        except Exception:
-            pass
+        send_real_time(
+            event_type="notification_message",
+            recipient_group=f"user_{notif.to_user.id}",
+            data=NotificationsSerializer(notif).data
+        )
         
 @receiver(post_save, sender=Post, dispatch_uid="notif_comment_reply")
 def notify_comment_reply(sender, instance, created, **kwargs):
@@ -122,14 +124,11 @@ def notify_comment_reply(sender, instance, created, **kwargs):
     )
     with transaction.atomic():
         notif.save()
-        try:
-            send_real_time(
-                event_type="notification_message",
-                recipient_group=f"user_{notif.to_user.id}",
-                data=NotificationsSerializer(notif).data
-            )
-        except Exception:
-            pass
+        send_real_time(
+            event_type="notification_message",
+            recipient_group=f"user_{notif.to_user.id}",
+            data=NotificationsSerializer(notif).data
+        )
         
 @receiver(post_delete, sender=Post, dispatch_uid="notif_delete_post")
 def delete_notifications_for_post(sender, instance, **kwargs):
@@ -138,13 +137,13 @@ def delete_notifications_for_post(sender, instance, **kwargs):
         target_content_type=post_ct,
         target_object_id=instance.pk
     )
-    for notif in notifs:
-        try:
-            send_real_time(
-                event_type="notification_delete",
-                recipient_group=f"user_{notif.to_user.id}",
-                data={"id": notif.id}
-            )
-        except Exception:
-            pass
-    notifs.delete()
\ No newline at end of file
+    send_real_time_each(
+        "notification_delete",
+        [(user_group(to_user_id), {"id": notif_id}) for notif_id, to_user_id in notifs.values_list("id", "to_user_id")],
+    )
+    notifs.delete()
+
+@receiver(post_save, sender=Notifications, dispatch_uid="notif_touch_stamp_on_save")
+@receiver(post_delete, sender=Notifications, dispatch_uid="notif_touch_stamp_on_delete")
+def touch_notification_stamp(sender, instance, **kwargs):
+    stamps.touch([instance.to_user_id])
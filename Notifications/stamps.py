@@ -0,0 +1,37 @@
+"""
+Per-user change stamps for the notification list.
+
+Every change to a user's notifications stores the current time under their
+key (after the transaction commits), which gives the list endpoint an ETag
+and Last-Modified without touching the database.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+STAMP_TIMEOUT = 30 * 24 * 60 * 60
+
+
+def stamp_key(user_id):
+    return f"notifications:stamp:{user_id}"
+
+
+def touch(user_ids):
+    user_ids = set(user_ids)
+
+    def store():
+        now = time.time()
+        cache.set_many({stamp_key(uid): now for uid in user_ids}, STAMP_TIMEOUT)
+
+    if user_ids:
+        transaction.on_commit(store)
+
+
+def current(user_id):
+    stamp = cache.get(stamp_key(user_id))
+    if stamp is None:
+        stamp = time.time()
+        if not cache.add(stamp_key(user_id), stamp, STAMP_TIMEOUT):
+            stamp = cache.get(stamp_key(user_id), stamp)
+    return stamp
@@ -3,6 +3,8 @@ from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from core import conditional
+from . import stamps
 from .models import Notifications
 from .serializers import NotificationsSerializer
 
@@ -21,12 +23,18 @@ class NotificationsViewSet(
         ).order_by('-created_at')
 
     def list(self, request, *args, **kwargs):
+        stamp = stamps.current(request.user.id)
+        etag = conditional.make_etag(request.user.id, request.get_full_path(), stamp)
+        unchanged = conditional.not_modified(request, etag, stamp)
+        if unchanged is not None:
+            return unchanged
+
         queryset = self.filter_queryset(self.get_queryset())
         page = self.paginate_queryset(queryset)
         serializer = self.get_serializer(page, many=True) if page is not None else self.get_serializer(queryset, many=True)
         response = self.get_paginated_response(serializer.data)
         response.data['unread_count'] = self.get_queryset().filter(is_read=False).count()
-        return response
+        return conditional.set_validators(response, etag, stamp)
 
     @action(detail=False, methods=['get'])
     def unread(self, request):
@@ -43,6 +51,7 @@ class NotificationsViewSet(
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
         marked = self.get_queryset().filter(is_read=False).update(is_read=True)
+        stamps.touch([request.user.id])
         return Response({'marked': marked}, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'], url_path='toggle_read')
@@ -0,0 +1,50 @@
+"""
+Denormalized engagement counters stored on Post.
+
+The views bump them with F-expressions in the same transaction as the row
+that changes them; ``recount`` rebuilds them from the source tables.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Now
+
+from . import fragments
+from .models import Post, Like
+
+COUNTER_FIELDS = ["likes_count", "replies_count", "reposts_count", "quotes_count"]
+
+COUNTER_FOR_TYPE = {
+    Post.REPLY:  "replies_count",
+    Post.REPOST: "reposts_count",
+    Post.QUOTE:  "quotes_count",
+}
+
+
+def bump(post_id, **deltas):
+    Post.objects.filter(pk=post_id).update(
+        updated_at=Now(),
+        **{field: F(field) + delta for field, delta in deltas.items()},
+    )
+    fragments.invalidate_on_commit([post_id])
+
+
+def bump_parent(post, delta):
+    """Count (or uncount) ``post`` on the post it replies to, reposts or quotes."""
+    field = COUNTER_FOR_TYPE.get(post.type)
+    if field and post.parent_id:
+        bump(post.parent_id, **{field: delta})
+
+
+def _count(queryset, key):
+    counts = queryset.order_by().values(key).annotate(total=Count("*")).values("total")
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def recount(queryset):
+    """Recompute every counter for the posts in ``queryset`` with one UPDATE."""
+    children = Post.objects.filter(parent=OuterRef("pk"))
+    return queryset.update(
+        likes_count=_count(Like.objects.filter(post=OuterRef("pk")), "post"),
+        replies_count=_count(children.filter(type=Post.REPLY), "parent"),
+        reposts_count=_count(children.filter(type=Post.REPOST), "parent"),
+        quotes_count=_count(children.filter(type=Post.QUOTE), "parent"),
+    )
@@ -0,0 +1,109 @@
+"""
+Viewer-independent post payloads cached in Redis.
+
+Everything PostSerializer returns except the viewer's own state is the same
+for every reader, so it is cached per post and fetched for a whole page with
+one MGET.  URLs are cached relative and made absolute per request.
+
+Each fragment is stored with the ``updated_at`` of the row it was built
+from and only served for a row with the same ``updated_at``.  A reader that
+loaded the post before a concurrent write committed may still write its
+fragment back after the invalidation, but readers of the new row treat it
+as a miss instead of serving the old counts until POST_FRAGMENT_TTL.
+Changes that don't move ``updated_at`` (an author's avatar) rely on
+``invalidate``, which writers call once they have committed.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+
+from core import metrics
+from .models import Post
+
+VIEWER_FIELDS = ("liked_by_user", "reposted_by_user")
+
+
+def fragment_key(post_id):
+    return f"post:fragment:{post_id}"
+
+
+def fragment_version(post):
+    return post.updated_at.isoformat() if post.updated_at else None
+
+
+def get_many(posts, build):
+    """
+    Return ``{post_id: fragment}`` for ``posts``; misses, and fragments built
+    from another version of the row, are rendered with ``build(posts)`` and
+    written back in one round trip.
+    """
+    keys = {fragment_key(post.id): post for post in posts}
+    cached = cache.get_many(list(keys))
+    fragments = {}
+    for key, entry in cached.items():
+        post = keys[key]
+        if isinstance(entry, tuple) and entry[0] == fragment_version(post):
+            fragments[post.id] = entry[1]
+
+    missing = [post for post in keys.values() if post.id not in fragments]
+    if missing:
+        prefetch_related_objects(missing, "posted_media__variants")
+        built = build(missing)
+        versions = {post.id: fragment_version(post) for post in missing}
+        cache.set_many(
+            {
+                fragment_key(post_id): (versions[post_id], fragment)
+                for post_id, fragment in built.items()
+            },
+            settings.POST_FRAGMENT_TTL,
+        )
+        fragments.update(built)
+
+    metrics.incr_many({
+        "post_fragments.hits": len(posts) - len(missing),
+        "post_fragments.misses": len(missing),
+    })
+    return fragments
+
+
+def absolutize(data, request):
+    """Turn the cached relative media URLs into absolute ones for this request."""
+    if request is None:
+        return data
+
+    def absolute(url):
+        return request.build_absolute_uri(url) if url else url
+
+    data["avatar_url"] = absolute(data.get("avatar_url"))
+    data["posted_media"] = [
+        {
+            **media,
+            "file": absolute(media.get("file")),
+            "poster": absolute(media.get("poster")),
+            "variants": [
+                {**variant, "file": absolute(variant["file"])}
+                for variant in media.get("variants", [])
+            ],
+        }
+        for media in data.get("posted_media", [])
+    ]
+    return data
+
+
+def invalidate(post_ids):
+    keys = [fragment_key(post_id) for post_id in post_ids]
+    if keys:
+        cache.delete_many(keys)
+
+
+def invalidate_on_commit(post_ids):
+    post_ids = list(post_ids)
+    transaction.on_commit(lambda: invalidate(post_ids))
+
+
+def invalidate_author(user_id, batch_size=1000):
+    """Drop every cached post by ``user_id``, e.g. after an avatar or name change."""
+    post_ids = list(Post.objects.filter(author_id=user_id).values_list("id", flat=True))
+    for start in range(0, len(post_ids), batch_size):
+        invalidate(post_ids[start:start + batch_size])
@@ -0,0 +1,275 @@
+"""
+Write-behind likes for posts that are being liked faster than the database
+can take them one row at a time.
+
+Every like first bumps a per-second rate counter for its post.  Once a post
+passes ``LIKE_BUFFER_HOT_THRESHOLD`` likes a second it is marked hot for
+``LIKE_BUFFER_HOT_TTL`` seconds, and its toggles are recorded in Redis
+instead of the database:
+
+``likes:pending:<post>``   hash of user id -> "1" (like) / "0" (unlike)
+``likes:delta:<post>``     how much those pending toggles move likes_count
+``likes:buffered``         set of posts with anything pending
+
+The ``flush_like_buffers`` worker moves each pending hash aside
+(``likes:flushing:<post>`` and its delta) and applies it with one statement
+(``likes.apply_batch``).  Until that commits, reads add both deltas to the
+stored count and let the buffered state win over the Like table, so a
+liker sees their own like straight away and counts never step backwards.
+
+The flush is also when the post's ``updated_at`` moves and when the author
+hears about the likes: the notifications it activated or deactivated and
+the new counters go to the outbox in the same transaction.  Until then a
+buffered like leaves the post's ETag as it was.
+"""
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+from django_redis import get_redis_connection
+
+from core import metrics
+from events.utils import post_topic, send_real_time_batch, user_group
+from Notifications.models import Notifications
+from Notifications.serializers import NotificationsSerializer
+from . import fragments, likes
+from .models import Like, Post
+
+BUFFERED_KEY = "likes:buffered"
+
+LIKED = "1"
+UNLIKED = "0"
+
+# Count this like and say whether the post goes through the buffer: it is
+# hot, or still has buffered toggles that a direct write would race with.
+_NOTE_SCRIPT = """
+local rate = redis.call('INCR', KEYS[1])
+if rate == 1 then
+    redis.call('EXPIRE', KEYS[1], 2)
+end
+if rate >= tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[2], '1', 'EX', ARGV[2])
+    return 1
+end
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return 1
+end
+return redis.call('SISMEMBER', KEYS[3], ARGV[3])
+"""
+
+# The user's current state is the pending toggle, else the one being
+# flushed, else what the database said.  A toggle back to that base state
+# just drops the pending entry.
+_TOGGLE_SCRIPT = """
+local base = redis.call('HGET', KEYS[2], ARGV[1]) or ARGV[3]
+local current = redis.call('HGET', KEYS[1], ARGV[1]) or base
+local changed = 0
+if current ~= ARGV[2] then
+    if ARGV[2] == base then
+        redis.call('HDEL', KEYS[1], ARGV[1])
+    else
+        redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+    end
+    redis.call('INCRBY', KEYS[3], ARGV[2] == '1' and 1 or -1)
+    redis.call('SADD', KEYS[5], ARGV[4])
+    changed = 1
+end
+local delta = tonumber(redis.call('GET', KEYS[3]) or '0') + tonumber(redis.call('GET', KEYS[4]) or '0')
+return {changed, delta}
+"""
+
+# Move the pending toggles aside for flushing, unless an earlier flush
+# never finished, in which case that one is retried first.
+_SNAPSHOT_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        redis.call('DEL', KEYS[3])
+        redis.call('SREM', KEYS[5], ARGV[1])
+        return {}
+    end
+    redis.call('RENAME', KEYS[1], KEYS[2])
+    redis.call('SET', KEYS[4], redis.call('GET', KEYS[3]) or '0')
+    redis.call('DEL', KEYS[3])
+end
+return redis.call('HGETALL', KEYS[2])
+"""
+
+_FINISH_SCRIPT = """
+redis.call('DEL', KEYS[1], KEYS[2])
+if redis.call('EXISTS', KEYS[3]) == 0 then
+    redis.call('SREM', KEYS[4], ARGV[1])
+end
+return 0
+"""
+
+
+def _redis():
+    return get_redis_connection("default")
+
+
+def _keys(post_id):
+    return {
+        "pending": f"likes:pending:{post_id}",
+        "flushing": f"likes:flushing:{post_id}",
+        "delta": f"likes:delta:{post_id}",
+        "flushing_delta": f"likes:flushing_delta:{post_id}",
+    }
+
+
+def is_hot(post_id):
+    """Record a like on ``post_id`` and say whether it should be buffered."""
+    conn = _redis()
+    rate_key = f"likes:rate:{post_id}:{int(time.time())}"
+    hot = conn.register_script(_NOTE_SCRIPT)(
+        keys=[rate_key, f"likes:hot:{post_id}", BUFFERED_KEY],
+        args=[settings.LIKE_BUFFER_HOT_THRESHOLD, settings.LIKE_BUFFER_HOT_TTL, post_id],
+    )
+    return bool(hot)
+
+
+def toggle(post, user, liked):
+    """
+    Buffer a like or unlike of ``post`` by ``user``.  Returns the same dict
+    as ``likes.toggle``; ``post.likes_count`` is left at the stored value and
+    the buffered delta is returned under ``pending``.
+    """
+    liked_in_db, reposted = (
+        Post.objects.filter(pk=post.id)
+        .annotate(
+            liked=Exists(Like.objects.filter(post_id=OuterRef("pk"), user_id=user.id)),
+            reposted=Exists(Post.objects.filter(author_id=user.id, type=Post.REPOST, parent_id=OuterRef("pk"))),
+        )
+        .values_list("liked", "reposted")
+        .get()
+    )
+    keys = _keys(post.id)
+    changed, pending = _redis().register_script(_TOGGLE_SCRIPT)(
+        keys=[keys["pending"], keys["flushing"], keys["delta"], keys["flushing_delta"], BUFFERED_KEY],
+        args=[user.id, LIKED if liked else UNLIKED, LIKED if liked_in_db else UNLIKED, post.id],
+    )
+    if changed:
+        metrics.incr("likes.buffered")
+    return {
+        "changed": bool(changed),
+        "liked": liked,
+        "reposted": reposted,
+        "notification": None,
+        "pending": int(pending),
+    }
+
+
+def pending(post_ids, user_id=None):
+    """
+    Buffered state for whichever of ``post_ids`` have any, as
+    ``{post_id: (delta, liked)}``; ``liked`` is None when ``user_id`` has
+    nothing buffered on that post.
+    """
+    post_ids = list(post_ids)
+    if not post_ids:
+        return {}
+    conn = _redis()
+    flags = conn.smismember(BUFFERED_KEY, post_ids)
+    buffered = [post_id for post_id, flag in zip(post_ids, flags) if flag]
+    if not buffered:
+        return {}
+
+    with conn.pipeline(transaction=False) as pipe:
+        for post_id in buffered:
+            keys = _keys(post_id)
+            pipe.mget(keys["delta"], keys["flushing_delta"])
+            if user_id is not None:
+                pipe.hget(keys["pending"], user_id)
+                pipe.hget(keys["flushing"], user_id)
+        replies = iter(pipe.execute())
+
+    state = {}
+    for post_id in buffered:
+        delta = sum(int(value or 0) for value in next(replies))
+        liked = None
+        if user_id is not None:
+            own = next(replies)
+            flushing = next(replies)
+            own = own if own is not None else flushing
+            if own is not None:
+                liked = own.decode() == LIKED
+        state[post_id] = (delta, liked)
+    return state
+
+
+def buffered_post_ids():
+    return [int(post_id) for post_id in _redis().smembers(BUFFERED_KEY)]
+
+
+def flush(post_id):
+    """
+    Write one post's buffered toggles to the database and publish its new
+    counters.  Returns how many toggles were applied.
+    """
+    conn = _redis()
+    keys = _keys(post_id)
+    entries = conn.register_script(_SNAPSHOT_SCRIPT)(
+        keys=[keys["pending"], keys["flushing"], keys["delta"], keys["flushing_delta"], BUFFERED_KEY],
+        args=[post_id],
+    )
+    if not entries:
+        return 0
+
+    added, removed = [], []
+    for user_id, state in zip(entries[::2], entries[1::2]):
+        (added if state.decode() == LIKED else removed).append(int(user_id))
+
+    post = Post.objects.filter(pk=post_id).only("id", "author_id", "type", "parent_id").first()
+    result = None
+    if post is not None:
+        try:
+            with transaction.atomic():
+                result = likes.apply_batch(post, added, removed)
+                if result is not None:
+                    send_real_time_batch(flush_events(post, result))
+        except IntegrityError:
+            # The post went away between the read and the write.
+            result = None
+
+    conn.register_script(_FINISH_SCRIPT)(
+        keys=[keys["flushing"], keys["flushing_delta"], keys["pending"], BUFFERED_KEY],
+        args=[post_id],
+    )
+    if result is None:
+        metrics.incr("likes.buffer.dropped", len(entries) // 2)
+        return 0
+
+    fragments.invalidate_on_commit([post_id])
+    metrics.incr_many({
+        "likes.buffer.flushes": 1,
+        "likes.buffer.flushed": len(entries) // 2,
+    })
+    return len(entries) // 2
+
+
+def flush_events(post, result):
+    """The author's notification events and the new counters after a flush."""
+    author = user_group(post.author_id)
+    notifications = (
+        Notifications.objects.filter(id__in=result["activated"])
+        .select_related("actor__profile", "target_content_type")
+    )
+    context = {"parent_post_id": post.parent_id or post.id}
+    return [
+        *[
+            ("notification_message", author, NotificationsSerializer(notif, context=context).data)
+            for notif in notifications
+        ],
+        *[("notification_delete", author, {"id": notif_id}) for notif_id in result["deactivated"]],
+        ("post_update", post_topic(post.id), {
+            "id":             post.id,
+            "likes_count":    result["likes_count"],
+            "comments_count": result["comments_count"],
+            "reposts_count":  result["reposts_count"],
+        }),
+    ]
+
+
+def flush_all():
+    """Flush every post with buffered toggles; returns the number of toggles written."""
+    return sum(flush(post_id) for post_id in buffered_post_ids())
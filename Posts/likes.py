@@ -0,0 +1,208 @@
+"""
+Like and unlike in a single statement.
+
+Each toggle is one SQL statement built from data-modifying CTEs.  It
+inserts or deletes the Like, adjusts ``likes_count`` and ``updated_at``
+only when the row really changed, and activates or deactivates the like
+notification.  It then returns everything the response and the broadcasts
+need, so nothing has to be read back afterwards.
+
+``updated_at`` uses ``statement_timestamp()`` like Django's ``Now()``, not
+the transaction start time, so every write gives the post a new version
+for its ETag and cached fragment (Posts/fragments.py).
+"""
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+
+from Notifications import stamps
+from Notifications.models import Notifications
+from . import fragments
+from .models import Like, Post
+
+LIKE_TYPES = (Notifications.POST_LIKE, Notifications.COMMENT_LIKE)
+
+_RESULT = """
+SELECT
+    EXISTS (SELECT 1 FROM changed),
+    COALESCE((SELECT likes_count FROM counted), (SELECT likes_count FROM {post} WHERE id = %(post)s)),
+    (SELECT updated_at FROM counted),
+    EXISTS (
+        SELECT 1 FROM {post}
+        WHERE author_id = %(user)s AND type = %(repost)s AND parent_id = %(post)s
+    ),
+    notified.id, notified.created_at, notified.is_read
+FROM (SELECT 1) AS one LEFT JOIN notified ON true
+"""
+
+LIKE_SQL = """
+WITH changed AS (
+    INSERT INTO {like} (post_id, user_id, liked_at)
+    VALUES (%(post)s, %(user)s, now())
+    ON CONFLICT (post_id, user_id) DO NOTHING
+    RETURNING post_id
+), counted AS (
+    UPDATE {post} SET likes_count = likes_count + 1, updated_at = statement_timestamp()
+    WHERE id IN (SELECT post_id FROM changed)
+    RETURNING likes_count, updated_at
+), notified AS (
+    INSERT INTO {notif} (to_user_id, actor_id, notification_type, target_content_type_id,
+                         target_object_id, created_at, is_read, active)
+    SELECT %(author)s, %(user)s, %(notif_type)s, %(ct)s, post_id, now(), false, true
+    FROM changed WHERE %(author)s <> %(user)s
+    ON CONFLICT (to_user_id, actor_id, notification_type, target_content_type_id, target_object_id)
+        WHERE notification_type IN ({like_types})
+    DO UPDATE SET active = true
+    RETURNING id, created_at, is_read
+)
+""" + _RESULT
+
+UNLIKE_SQL = """
+WITH changed AS (
+    DELETE FROM {like} WHERE post_id = %(post)s AND user_id = %(user)s
+    RETURNING post_id
+), counted AS (
+    UPDATE {post} SET likes_count = likes_count - 1, updated_at = statement_timestamp()
+    WHERE id IN (SELECT post_id FROM changed)
+    RETURNING likes_count, updated_at
+), notified AS (
+    UPDATE {notif} SET active = false
+    WHERE to_user_id = %(author)s AND actor_id = %(user)s AND notification_type = %(notif_type)s
+      AND target_content_type_id = %(ct)s AND target_object_id = %(post)s
+      AND active AND EXISTS (SELECT 1 FROM changed)
+    RETURNING id, created_at, is_read
+)
+""" + _RESULT
+
+
+# A batch of buffered toggles (Posts/likebuffer.py) for one post.  Only the
+# rows that really changed move the counter and the notifications; likers
+# whose account is gone by now are skipped.
+BATCH_SQL = """
+WITH added AS (
+    INSERT INTO {like} (post_id, user_id, liked_at)
+    SELECT %(post)s, liker.id, now() FROM unnest(%(added)s::bigint[]) AS liker (id)
+    WHERE EXISTS (SELECT 1 FROM {user} WHERE {user}.id = liker.id)
+    ON CONFLICT (post_id, user_id) DO NOTHING
+    RETURNING user_id
+), removed AS (
+    DELETE FROM {like} WHERE post_id = %(post)s AND user_id = ANY(%(removed)s::bigint[])
+    RETURNING user_id
+), counted AS (
+    UPDATE {post}
+    SET likes_count = likes_count + (SELECT count(*) FROM added) - (SELECT count(*) FROM removed),
+        updated_at = statement_timestamp()
+    WHERE id = %(post)s
+    RETURNING likes_count, replies_count, reposts_count + quotes_count AS reposts_count
+), activated AS (
+    INSERT INTO {notif} (to_user_id, actor_id, notification_type, target_content_type_id,
+                         target_object_id, created_at, is_read, active)
+    SELECT %(author)s, user_id, %(notif_type)s, %(ct)s, %(post)s, now(), false, true
+    FROM added WHERE user_id <> %(author)s
+    ON CONFLICT (to_user_id, actor_id, notification_type, target_content_type_id, target_object_id)
+        WHERE notification_type IN ({like_types})
+    DO UPDATE SET active = true
+    RETURNING id
+), deactivated AS (
+    UPDATE {notif} SET active = false
+    WHERE to_user_id = %(author)s AND actor_id IN (SELECT user_id FROM removed)
+      AND notification_type = %(notif_type)s AND target_content_type_id = %(ct)s
+      AND target_object_id = %(post)s AND active
+    RETURNING id
+)
+SELECT
+    counted.likes_count, counted.replies_count, counted.reposts_count,
+    ARRAY(SELECT id FROM activated), ARRAY(SELECT id FROM deactivated)
+FROM counted
+"""
+
+
+def _sql(template):
+    quote = connection.ops.quote_name
+    return template.format(
+        like=quote(Like._meta.db_table),
+        post=quote(Post._meta.db_table),
+        user=quote(User._meta.db_table),
+        notif=quote(Notifications._meta.db_table),
+        like_types=", ".join(f"'{notif_type}'" for notif_type in LIKE_TYPES),
+    )
+
+
+def notification_type_for(post):
+    return Notifications.COMMENT_LIKE if post.type == Post.REPLY else Notifications.POST_LIKE
+
+
+def toggle(post, user, liked):
+    """
+    Like (``liked=True``) or unlike ``post`` for ``user``.  ``post`` is
+    updated in place with the new count.  Returns a dict with ``changed``,
+    ``liked``, ``reposted`` and ``notification`` (a Notifications instance
+    whose state changed, or None).
+    """
+    post_ct = ContentType.objects.get_for_model(Post)
+    params = {
+        "post": post.id,
+        "user": user.id,
+        "author": post.author_id,
+        "notif_type": notification_type_for(post),
+        "ct": post_ct.id,
+        "repost": Post.REPOST,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(_sql(LIKE_SQL if liked else UNLIKE_SQL), params)
+        changed, likes_count, updated_at, reposted, notif_id, notif_created_at, notif_is_read = cursor.fetchone()
+
+    post.likes_count = likes_count
+    notification = None
+    if changed:
+        post.updated_at = updated_at
+        fragments.invalidate_on_commit([post.id])
+        if notif_id is not None:
+            notification = Notifications(
+                id=notif_id,
+                to_user_id=post.author_id,
+                actor=user,
+                notification_type=params["notif_type"],
+                target_content_type=post_ct,
+                target_object_id=post.id,
+                created_at=notif_created_at,
+                is_read=notif_is_read,
+                active=liked,
+            )
+            stamps.touch([post.author_id])
+
+    return {"changed": changed, "liked": liked, "reposted": reposted, "notification": notification}
+
+
+def apply_batch(post, added, removed):
+    """
+    Apply many users' likes (``added``) and unlikes (``removed``) of
+    ``post`` at once.  Returns the post's new ``likes_count``,
+    ``comments_count`` and ``reposts_count`` and the ids of the author's
+    notifications it ``activated`` and ``deactivated``, or None if the
+    post no longer exists.
+    """
+    params = {
+        "post": post.id,
+        "added": added,
+        "removed": removed,
+        "author": post.author_id,
+        "notif_type": notification_type_for(post),
+        "ct": ContentType.objects.get_for_model(Post).id,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(_sql(BATCH_SQL), params)
+        row = cursor.fetchone()
+    if row is None:
+        return None
+
+    likes_count, comments_count, reposts_count, activated, deactivated = row
+    if activated or deactivated:
+        stamps.touch([post.author_id])
+    return {
+        "likes_count": likes_count,
+        "comments_count": comments_count,
+        "reposts_count": reposts_count,
+        "activated": activated,
+        "deactivated": deactivated,
+    }
@@ -0,0 +1,125 @@
+import statistics
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from Posts import likebuffer, likes
+from Posts.models import Like, Post
+from Profile.models import Profile
+
+
+class Command(BaseCommand):
+    help = (
+        "Like one post from many users at once, first straight into the database "
+        "and then through the write-behind buffer, and report the throughput."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--likes", dest="count", type=int, default=10000, help="Distinct users liking the post per run.")
+        parser.add_argument("--rate", type=int, default=10000, help="Target likes per second to compare against.")
+        parser.add_argument("--threads", type=int, default=32)
+        parser.add_argument("--modes", nargs="+", choices=["direct", "buffered"], default=["direct", "buffered"])
+
+    def handle(self, *args, count, rate, threads, modes, **options):
+        user_ids = self.seed(count)
+        post = Post.objects.create(author_id=user_ids[0], description="bench_like_buffer")
+        self.stdout.write(f"Post {post.id}, {count} likers, {threads} threads, target {rate}/s")
+
+        try:
+            for mode in modes:
+                self.reset(post)
+                self.run(mode, post, user_ids, threads, rate)
+        finally:
+            self.reset(post)
+            post.delete()
+
+    def run(self, mode, post, user_ids, threads, rate):
+        post = Post.objects.get(pk=post.pk)
+        latencies = []
+        lock = threading.Lock()
+        flusher_stop = threading.Event()
+
+        def like(user_id):
+            user = User(id=user_id)
+            if mode == "buffered":
+                likebuffer.is_hot(post.id)
+                likebuffer.toggle(post, user, liked=True)
+            else:
+                likes.toggle(Post(id=post.id, author_id=post.author_id, type=post.type), user, liked=True)
+
+        def worker(chunk):
+            own = []
+            try:
+                for user_id in chunk:
+                    start = time.perf_counter()
+                    like(user_id)
+                    own.append(time.perf_counter() - start)
+            finally:
+                connections.close_all()
+            with lock:
+                latencies.extend(own)
+
+        def flusher():
+            try:
+                while not flusher_stop.wait(0.25):
+                    likebuffer.flush(post.id)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker, args=(user_ids[i::threads],)) for i in range(threads)]
+        flush_thread = threading.Thread(target=flusher) if mode == "buffered" else None
+
+        start = time.perf_counter()
+        if flush_thread:
+            flush_thread.start()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        accepted = time.perf_counter() - start
+
+        if flush_thread:
+            flusher_stop.set()
+            flush_thread.join()
+            while likebuffer.flush(post.id):
+                pass
+        durable = time.perf_counter() - start
+
+        post.refresh_from_db(fields=["likes_count"])
+        stored = Like.objects.filter(post=post).count()
+        samples = sorted(latencies)
+        throughput = len(samples) / accepted
+        self.stdout.write(
+            f"{mode:>9}: {throughput:9.0f} likes/s accepted, {len(samples) / durable:9.0f} likes/s durable  "
+            f"p50 {statistics.median(samples) * 1000:6.2f} ms  p99 {samples[int(len(samples) * 0.99) - 1] * 1000:6.2f} ms  "
+            f"{'meets' if throughput >= rate else 'misses'} {rate}/s"
+        )
+        if post.likes_count != len(user_ids) or stored != len(user_ids):
+            self.stderr.write(f"Inconsistent: likes_count={post.likes_count}, Like rows={stored}, expected {len(user_ids)}")
+
+    def reset(self, post):
+        likebuffer.flush(post.id)
+        Like.objects.filter(post=post).delete()
+        Post.objects.filter(pk=post.pk).update(likes_count=0)
+
+    def seed(self, count):
+        # bulk_create skips the welcome-mail signal on User.
+        existing = set(User.objects.filter(username__startswith="bench_liker_").values_list("username", flat=True))
+        User.objects.bulk_create(
+            [
+                User(username=f"bench_liker_{i}", email=f"bench_liker_{i}@example.com")
+                for i in range(count) if f"bench_liker_{i}" not in existing
+            ],
+            batch_size=1000,
+        )
+        user_ids = list(
+            User.objects.filter(username__startswith="bench_liker_").order_by("id").values_list("id", flat=True)[:count]
+        )
+        with_profile = set(Profile.objects.filter(user_id__in=user_ids).values_list("user_id", flat=True))
+        Profile.objects.bulk_create(
+            [Profile(user_id=uid) for uid in user_ids if uid not in with_profile], batch_size=1000
+        )
+        return user_ids
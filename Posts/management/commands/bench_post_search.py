@@ -0,0 +1,85 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+
+from Posts.models import Post
+from Posts.search import ranked_search
+from Profile.models import Profile
+
+WORDS = (
+    "sunset coffee travel music concert weekend football city mountain beach "
+    "recipe pizza garden photo family friends holiday rain winter summer "
+    "project release bug deploy server python django review meeting book"
+).split()
+
+
+class Command(BaseCommand):
+    help = "Compare the full-text search against the old icontains SearchFilter on a seeded dataset."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=0, help="Create this many posts before benchmarking (e.g. 1000000).")
+        parser.add_argument("--authors", type=int, default=1000, help="Number of authors the seeded posts are spread over.")
+        parser.add_argument("--terms", nargs="+", default=["sunset", "django deploy", "bench_user_42"])
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--explain", action="store_true", help="Print the plan of each full-text query.")
+
+    def handle(self, *args, seed, authors, terms, repeat, explain, **options):
+        if seed:
+            self.seed(seed, authors)
+
+        self.stdout.write(f"{Post.objects.count()} posts")
+        for term in terms:
+            old = self.time(repeat, lambda: list(
+                Post.objects.filter(Q(description__icontains=term) | Q(author__username__icontains=term))
+                .distinct().order_by("-created_at")[:20]
+            ))
+            new = self.time(repeat, lambda: list(ranked_search(Post.objects.all(), term)[:20]))
+            self.stdout.write(
+                f"{term!r:>20}  icontains {old:8.1f} ms   full-text {new:8.1f} ms   x{old / max(new, 0.001):.1f}"
+            )
+            if explain:
+                # Both halves should be index scans; a Seq Scan on Posts_post
+                # means the search no longer uses its indexes.
+                self.stdout.write(ranked_search(Post.objects.all(), term)[:20].explain(analyze=True))
+
+    def time(self, repeat, run):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            samples.append((time.perf_counter() - start) * 1000)
+        return statistics.median(samples)
+
+    def seed(self, count, authors):
+        # bulk_create skips the welcome-mail signal on User.
+        existing = set(User.objects.filter(username__startswith="bench_user_").values_list("username", flat=True))
+        new_users = [
+            User(username=f"bench_user_{i}", email=f"bench_user_{i}@example.com")
+            for i in range(authors) if f"bench_user_{i}" not in existing
+        ]
+        User.objects.bulk_create(new_users, batch_size=1000)
+        user_ids = list(User.objects.filter(username__startswith="bench_user_").values_list("id", flat=True))
+        with_profile = set(Profile.objects.filter(user_id__in=user_ids).values_list("user_id", flat=True))
+        Profile.objects.bulk_create(
+            [Profile(user_id=uid) for uid in user_ids if uid not in with_profile], batch_size=1000
+        )
+
+        batch_size = 10000
+        for start in range(0, count, batch_size):
+            Post.objects.bulk_create([
+                Post(
+                    author_id=random.choice(user_ids),
+                    description=" ".join(random.choices(WORDS, k=random.randint(5, 30))),
+                )
+                for _ in range(min(batch_size, count - start))
+            ])
+            self.stdout.write(f"Seeded {min(start + batch_size, count)}/{count} posts")
+
+        # Fresh statistics, or the planner guesses and may skip the indexes.
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE "{User._meta.db_table}", "{Post._meta.db_table}"')
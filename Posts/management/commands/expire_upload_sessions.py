@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from Posts import uploads
+from Posts.models import UploadSession
+
+
+class Command(BaseCommand):
+    help = "Delete upload sessions (and their partial files) untouched for UPLOAD_SESSION_TTL."
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+        expired = 0
+        for session in UploadSession.objects.filter(updated_at__lt=cutoff).iterator():
+            uploads.discard(session)
+            expired += 1
+        self.stdout.write(self.style.SUCCESS(f"Expired {expired} upload sessions."))
@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from Posts import likebuffer
+
+
+class Command(BaseCommand):
+    help = "Write the likes buffered in Redis for hot posts to the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval", type=int, default=None,
+            help="Milliseconds between flushes (default: LIKE_BUFFER_FLUSH_INTERVAL_MS).",
+        )
+        parser.add_argument("--once", action="store_true", help="Flush once and exit instead of polling.")
+
+    def handle(self, *args, interval, once, **options):
+        interval = (interval or settings.LIKE_BUFFER_FLUSH_INTERVAL_MS) / 1000
+        while True:
+            started = time.monotonic()
+            flushed = likebuffer.flush_all()
+            if flushed and options["verbosity"] > 1:
+                self.stdout.write(f"Flushed {flushed} likes")
+            if once:
+                break
+            time.sleep(max(0, interval - (time.monotonic() - started)))
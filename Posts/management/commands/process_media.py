@@ -0,0 +1,25 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from Posts import media
+
+
+class Command(BaseCommand):
+    help = "Build variants, posters and metadata for uploaded post media."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=10)
+        parser.add_argument("--once", action="store_true", help="Drain the queue and exit instead of polling.")
+
+    def handle(self, *args, batch_size, once, **options):
+        while True:
+            batch = media.claim(batch_size)
+            for item in batch:
+                media.process(item)
+                self.stdout.write(f"Media {item.pk} ({item.media_type}): {item.status}")
+            if not batch:
+                if once:
+                    break
+                time.sleep(settings.MEDIA_PROCESSING_POLL_INTERVAL)
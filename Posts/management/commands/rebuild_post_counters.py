@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from Posts import fragments
+from Posts.counters import recount
+from Posts.models import Post
+
+
+class Command(BaseCommand):
+    help = "Rebuild likes/replies/reposts/quotes counters on every post from the source tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=10000,
+            help="Number of post ids updated per statement.",
+        )
+
+    def handle(self, *args, batch_size, **options):
+        max_id = Post.objects.aggregate(max_id=Max("id"))["max_id"] or 0
+        updated = 0
+        for start in range(0, max_id + 1, batch_size):
+            with transaction.atomic():
+                updated += recount(Post.objects.filter(id__gte=start, id__lt=start + batch_size))
+                # recount leaves updated_at alone, so cached fragments have to go.
+                fragments.invalidate_on_commit(range(start, start + batch_size))
+            self.stdout.write(f"Recounted posts up to id {min(start + batch_size, max_id + 1) - 1}")
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt counters for {updated} posts."))
@@ -0,0 +1,120 @@
+"""
+Background processing for uploaded post media.
+
+Uploads are stored untouched and left ``pending``.  The ``process_media``
+worker claims them, records dimensions (and duration for videos), grabs a
+poster frame from videos and writes downscaled WebP variants.  Once a row
+is finished its post's cached payload is dropped so readers see the result.
+"""
+import io
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Now
+from django.utils import timezone
+from moviepy import VideoFileClip
+from PIL import Image, ImageOps
+
+from core import metrics
+from . import fragments
+from .models import Media, MediaVariant, Post
+
+logger = logging.getLogger(__name__)
+
+
+def claim(batch_size):
+    """
+    Mark up to ``batch_size`` pending rows as processing and return them.
+    Rows a crashed worker left in processing are picked up again after
+    MEDIA_PROCESSING_TIMEOUT.
+    """
+    stale = timezone.now() - timedelta(seconds=settings.MEDIA_PROCESSING_TIMEOUT)
+    with transaction.atomic():
+        ids = list(
+            Media.objects.filter(
+                Q(status=Media.PENDING) |
+                Q(status=Media.PROCESSING, claimed_at__lt=stale)
+            )
+            .order_by("id")
+            .select_for_update(skip_locked=True)
+            .values_list("id", flat=True)[:batch_size]
+        )
+        Media.objects.filter(id__in=ids).update(status=Media.PROCESSING, claimed_at=Now())
+    return list(Media.objects.filter(id__in=ids).order_by("id"))
+
+
+def process(media):
+    try:
+        if media.media_type == "video":
+            source = _process_video(media)
+        else:
+            source = _open_image(media.file)
+            media.width, media.height = source.size
+        _write_variants(media, source)
+        media.status = Media.READY
+    except Exception:
+        logger.exception("Processing media %s failed", media.pk)
+        media.status = Media.FAILED
+
+    # The post (and the row with it) may have been deleted meanwhile.
+    updated = Media.objects.filter(pk=media.pk).update(
+        status=media.status,
+        width=media.width,
+        height=media.height,
+        duration=media.duration,
+        poster=media.poster,
+    )
+    if not updated:
+        logger.info("Media %s was deleted while it was processed", media.pk)
+        metrics.incr("media.gone")
+        return
+    Post.objects.filter(pk=media.post_id).update(updated_at=Now())
+    fragments.invalidate_on_commit([media.post_id])
+    metrics.incr(f"media.{media.status}")
+
+
+def _open_image(field_file):
+    with field_file.open("rb") as fh:
+        image = ImageOps.exif_transpose(Image.open(fh))
+        image.load()
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+    return image
+
+
+def _process_video(media):
+    with VideoFileClip(media.file.path, audio=False) as clip:
+        media.width, media.height = clip.size
+        media.duration = clip.duration
+        frame = clip.get_frame(min(settings.MEDIA_POSTER_AT, clip.duration / 2))
+
+    poster = Image.fromarray(frame)
+    media.poster.save(f"{media.pk}.jpg", _encode(poster, "JPEG"), save=False)
+    return poster
+
+
+def _write_variants(media, image):
+    # Blob refcounts drop with the rows; gc_blobs removes unused files.
+    MediaVariant.objects.filter(media=media).delete()
+
+    # Never upscale: anything narrower than a variant is served as uploaded.
+    for name, width in settings.MEDIA_VARIANT_WIDTHS.items():
+        if width >= image.width:
+            continue
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS)
+        variant = MediaVariant(media=media, name=name, width=width, height=height)
+        variant.file.save(f"{media.pk}_{name}.webp", _encode(resized, "WEBP"), save=False)
+        variant.save()
+
+
+def _encode(image, format):
+    buffer = io.BytesIO()
+    if format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    image.save(buffer, format=format, quality=settings.MEDIA_VARIANT_QUALITY)
+    return ContentFile(buffer.getvalue())
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:21
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Post = apps.get_model('Posts', 'Post')
+    Like = apps.get_model('Posts', 'Like')
+
+    def count(queryset, key):
+        counts = queryset.order_by().values(key).annotate(total=Count('*')).values('total')
+        return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+    children = Post.objects.filter(parent=OuterRef('pk'))
+    Post.objects.update(
+        likes_count=count(Like.objects.filter(post=OuterRef('pk')), 'post'),
+        replies_count=count(children.filter(type='reply'), 'parent'),
+        reposts_count=count(children.filter(type='repost'), 'parent'),
+        quotes_count=count(children.filter(type='quote'), 'parent'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Posts', '0007_alter_post_type_delete_comment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='quotes_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='replies_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='reposts_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
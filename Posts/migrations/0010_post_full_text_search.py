@@ -0,0 +1,49 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:23
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+SEARCH_VECTOR_TRIGGER = """
+CREATE TRIGGER posts_post_search_vector_update
+BEFORE INSERT OR UPDATE OF description ON "Posts_post"
+FOR EACH ROW EXECUTE FUNCTION
+tsvector_update_trigger(search_vector, 'pg_catalog.simple', description);
+
+UPDATE "Posts_post"
+SET search_vector = to_tsvector('pg_catalog.simple', coalesce(description, ''));
+"""
+
+DROP_SEARCH_VECTOR_TRIGGER = 'DROP TRIGGER IF EXISTS posts_post_search_vector_update ON "Posts_post";'
+
+USERNAME_TRIGRAM_INDEX = (
+    "CREATE INDEX IF NOT EXISTS auth_user_username_trgm_idx "
+    "ON auth_user USING gin (username gin_trgm_ops);"
+)
+
+DROP_USERNAME_TRIGRAM_INDEX = "DROP INDEX IF EXISTS auth_user_username_trgm_idx;"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Posts', '0009_post_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='post_search_vector_idx'),
+        ),
+        migrations.RunSQL(SEARCH_VECTOR_TRIGGER, DROP_SEARCH_VECTOR_TRIGGER),
+        migrations.RunSQL(USERNAME_TRIGRAM_INDEX, DROP_USERNAME_TRIGRAM_INDEX),
+    ]
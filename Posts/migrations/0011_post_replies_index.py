@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Posts', '0010_post_full_text_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['parent', 'type', '-created_at', '-id'], name='post_replies_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Posts', '0012_post_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='like',
+            index=models.Index(fields=['user', '-liked_at', '-id'], name='like_user_liked_at_id_idx'),
+        ),
+    ]
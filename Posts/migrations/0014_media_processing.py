@@ -0,0 +1,59 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Posts', '0013_like_user_liked_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='media',
+            name='duration',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='media',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='media',
+            name='poster',
+            field=models.ImageField(blank=True, null=True, upload_to='post_media/posters/'),
+        ),
+        migrations.AddField(
+            model_name='media',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='media',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='MediaVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=20)),
+                ('file', models.ImageField(upload_to='post_media/variants/')),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('media', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='Posts.media')),
+            ],
+            options={
+                'ordering': ['width'],
+                'unique_together': {('media', 'name')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Posts', '0015_upload_session'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='media',
+            name='file',
+            field=models.FileField(db_index=True, upload_to='post_media/'),
+        ),
+        migrations.AlterField(
+            model_name='media',
+            name='poster',
+            field=models.ImageField(blank=True, db_index=True, null=True, upload_to='post_media/posters/'),
+        ),
+        migrations.AlterField(
+            model_name='mediavariant',
+            name='file',
+            field=models.ImageField(db_index=True, upload_to='post_media/variants/'),
+        ),
+    ]
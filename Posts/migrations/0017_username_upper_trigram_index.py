@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-18 14:30
+
+from django.conf import settings
+from django.db import migrations
+
+# ``username__icontains`` compiles to UPPER("username"::text) LIKE UPPER(...),
+# which only an index on that same expression can serve.
+USERNAME_TRIGRAM_INDEX = (
+    "CREATE INDEX IF NOT EXISTS auth_user_username_upper_trgm_idx "
+    "ON auth_user USING gin (UPPER(username::text) gin_trgm_ops);"
+)
+
+DROP_USERNAME_TRIGRAM_INDEX = "DROP INDEX IF EXISTS auth_user_username_upper_trgm_idx;"
+
+OLD_USERNAME_TRIGRAM_INDEX = (
+    "CREATE INDEX IF NOT EXISTS auth_user_username_trgm_idx "
+    "ON auth_user USING gin (username gin_trgm_ops);"
+)
+
+DROP_OLD_USERNAME_TRIGRAM_INDEX = "DROP INDEX IF EXISTS auth_user_username_trgm_idx;"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Posts', '0016_media_file_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunSQL(USERNAME_TRIGRAM_INDEX, DROP_USERNAME_TRIGRAM_INDEX),
+        migrations.RunSQL(DROP_OLD_USERNAME_TRIGRAM_INDEX, OLD_USERNAME_TRIGRAM_INDEX),
+    ]
@@ -1,3 +1,7 @@
+import uuid
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import User
@@ -20,6 +24,7 @@ class Post(models.Model):
         )
     description = models.TextField(max_length=1000, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     parent      = models.ForeignKey(
         'self',
         null=True,
@@ -32,6 +37,12 @@ class Post(models.Model):
         choices=TYPE_CHOICES,
         default=POST,
     )
+    likes_count   = models.IntegerField(default=0)
+    replies_count = models.IntegerField(default=0)
+    reposts_count = models.IntegerField(default=0)
+    quotes_count  = models.IntegerField(default=0)
+    search_vector = SearchVectorField(null=True, editable=False)
+
     def clean (self):
         super().clean()
         if self.type ==Post.REPOST and self.parent is None:
@@ -56,6 +67,12 @@ class Post(models.Model):
         return f"{user} posted on {self.created_at:%Y-%m-%d %H:%M}"
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='post_created_id_idx'),
+            models.Index(fields=['author', '-created_at', '-id'], name='post_author_created_id_idx'),
+            models.Index(fields=['parent', 'type', '-created_at', '-id'], name='post_replies_idx'),
+            GinIndex(fields=['search_vector'], name='post_search_vector_idx'),
+        ]
         
 
 class Media(models.Model):
@@ -63,16 +80,37 @@ class Media(models.Model):
         ('photo', 'Photo'),
         ('video', 'Video'),
     ]
+    PENDING    = 'pending'
+    PROCESSING = 'processing'
+    READY      = 'ready'
+    FAILED     = 'failed'
+    STATUS_CHOICES = [
+        (PENDING,    'Pending'),
+        (PROCESSING, 'Processing'),
+        (READY,      'Ready'),
+        (FAILED,     'Failed'),
+    ]
     post=models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
         related_name='posted_media'
         )
-    file = models.FileField(upload_to='post_media/')
+    file = models.FileField(upload_to='post_media/', db_index=True)
     media_type = models.CharField(
         max_length=5, 
         choices=MEDIA_TYPE_CHOICES
         )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        db_index=True
+        )
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    duration = models.FloatField(null=True, blank=True)
+    poster = models.ImageField(upload_to='post_media/posters/', null=True, blank=True, db_index=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
     
     def clean(self):
         super().clean()
@@ -81,6 +119,21 @@ class Media(models.Model):
         if len(self.file)>4:
             raise ValidationError("You can upload up to 4 media items (photos or videos).")
         
+class MediaVariant(models.Model):
+    media = models.ForeignKey(
+        Media,
+        on_delete=models.CASCADE,
+        related_name='variants'
+        )
+    name = models.CharField(max_length=20)
+    file = models.ImageField(upload_to='post_media/variants/', db_index=True)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = (('media', 'name'),)
+        ordering = ['width']
+
 class Like(models.Model):
     post = models.ForeignKey(
         Post,
@@ -96,6 +149,39 @@ class Like(models.Model):
     class Meta:
         unique_together = (('post', 'user'))
         ordering = ['liked_at']
+        indexes = [
+            models.Index(fields=['user', '-liked_at', '-id'], name='like_user_liked_at_id_idx'),
+        ]
         
     def __str__(self):
         return f"{self.user.username} liked Post {self.post.pk}"
+
+
+class UploadSession(models.Model):
+    UPLOADING = 'uploading'
+    COMPLETE  = 'complete'
+    STATUS_CHOICES = [
+        (UPLOADING, 'Uploading'),
+        (COMPLETE,  'Complete'),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='upload_sessions'
+        )
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    media_type = models.CharField(
+        max_length=5,
+        choices=Media.MEDIA_TYPE_CHOICES
+        )
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=UPLOADING
+        )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
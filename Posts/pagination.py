@@ -0,0 +1,109 @@
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a unique, index-backed ordering such as
+    ``(-created_at, -id)``.  Each page is a range scan that starts right after
+    the last row of the previous page, so deep pages cost the same as the
+    first one and rows inserted meanwhile don't shift pages.  There is no
+    total count and the cursor is opaque to clients.
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = "cursor"
+    ordering = ("-created_at", "-id")
+    invalid_cursor_message = "Invalid cursor"
+
+    def get_ordering(self, queryset):
+        # Honour an ascending ?ordering= on the leading key from OrderingFilter.
+        requested = queryset.query.order_by
+        if requested and requested[0] == self.ordering[0].lstrip("-"):
+            return tuple(field.lstrip("-") for field in self.ordering)
+        return self.ordering
+
+    def encode_cursor(self, position):
+        values = [value.isoformat() if hasattr(value, "isoformat") else value for value in position]
+        raw = json.dumps(values, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def decode_cursor(self, request, model, ordering):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            values = json.loads(raw)
+            if len(values) != len(ordering):
+                raise ValueError
+            return tuple(
+                model._meta.get_field(field.lstrip("-")).to_python(value)
+                for field, value in zip(ordering, values)
+            )
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def keyset_filter(self, ordering, position):
+        """``(a, b) < (x, y)`` spelled so Postgres can range-scan the index on ``a``."""
+        lead = ordering[0].lstrip("-")
+        op = "lt" if ordering[0].startswith("-") else "gt"
+        condition = Q()
+        for index in reversed(range(len(ordering))):
+            field = ordering[index].lstrip("-")
+            step = Q(**{f"{field}__{op}": position[index]})
+            for prev in range(index):
+                step &= Q(**{ordering[prev].lstrip("-"): position[prev]})
+            condition |= step
+        return Q(**{f"{lead}__{op}e": position[0]}) & condition
+
+    def position_for(self, obj, ordering):
+        return tuple(getattr(obj, field.lstrip("-")) for field in ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        ordering = self.get_ordering(queryset)
+        position = self.decode_cursor(request, queryset.model, ordering)
+
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(ordering, position))
+
+        rows = list(queryset[:self.page_size + 1])
+        page = rows[:self.page_size]
+        self.set_next(self.position_for(page[-1], ordering) if len(rows) > self.page_size else None)
+        return page
+
+    def set_next(self, position):
+        """Views that page something other than a queryset report the last row here."""
+        self.next_position = position
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+class LikedPostsPagination(KeysetPagination):
+    """Pages a user's ``Like`` rows newest first, i.e. in the order they liked."""
+    ordering = ("-liked_at", "-id")
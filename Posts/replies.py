@@ -0,0 +1,106 @@
+"""
+Bounded reply trees for the post detail endpoint.
+
+The whole tree under a post is selected by one recursive CTE that takes at
+most ``per_level`` replies (newest first) under every node and stops at
+``max_depth``; the posts are hydrated in the same statement and wired
+together in memory.  Branches that were cut short get a "load more" link
+to the replies endpoint.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models.expressions import RawSQL
+from rest_framework.reverse import reverse
+from rest_framework.utils.urls import replace_query_param
+
+from .models import Post
+from .pagination import KeysetPagination
+
+# Every level asks for one reply more than it keeps, to learn whether the
+# branch goes on; that extra reply is never expanded (rn <= per_level).
+REPLY_TREE_SQL = """
+WITH RECURSIVE tree (id, rn, depth) AS (
+    SELECT id, rn, 1 FROM (
+        SELECT id, row_number() OVER (ORDER BY created_at DESC, id DESC) AS rn
+        FROM {table}
+        WHERE parent_id = %s AND type = %s {after}
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    ) first_level
+  UNION ALL
+    SELECT child.id, child.rn, tree.depth + 1
+    FROM tree
+    CROSS JOIN LATERAL (
+        SELECT id, row_number() OVER (ORDER BY created_at DESC, id DESC) AS rn
+        FROM {table}
+        WHERE parent_id = tree.id AND type = %s
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    ) child
+    WHERE tree.depth < %s AND tree.rn <= %s
+)
+SELECT id FROM tree
+"""
+
+
+class ReplyTree:
+    def __init__(self, root, max_depth=None, per_level=None, after=None):
+        self.root = root
+        self.max_depth = max_depth or settings.REPLY_TREE_MAX_DEPTH
+        self.per_level = per_level or settings.REPLY_TREE_PAGE_SIZE
+        self.children = {}
+        self.cursors = {}
+        self.depths = {root.id: 0}
+        self._load(after)
+
+    def _load(self, after):
+        after_sql, after_params = "", []
+        if after is not None:
+            after_sql = "AND (created_at, id) < (%s, %s)"
+            after_params = list(after)
+
+        sql = REPLY_TREE_SQL.format(table=f'"{Post._meta.db_table}"', after=after_sql)
+        params = [
+            self.root.id, Post.REPLY, *after_params, self.per_level + 1,
+            Post.REPLY, self.per_level + 1,
+            self.max_depth, self.per_level,
+        ]
+        posts = (
+            Post.objects.filter(id__in=RawSQL(sql, params))
+            .select_related("author", "author__profile")
+            .prefetch_related("posted_media__variants")
+        )
+
+        grouped = defaultdict(list)
+        for post in posts:
+            grouped[post.parent_id].append(post)
+
+        pending = [self.root.id]
+        while pending:
+            parent_id = pending.pop()
+            replies = sorted(grouped.get(parent_id, []), key=lambda p: (p.created_at, p.id), reverse=True)
+            kept = replies[:self.per_level]
+            self.children[parent_id] = kept
+            if len(replies) > self.per_level:
+                self.cursors[parent_id] = (kept[-1].created_at, kept[-1].id)
+            for reply in kept:
+                self.depths[reply.id] = self.depths[parent_id] + 1
+                pending.append(reply.id)
+
+    def posts(self):
+        return [post for replies in self.children.values() for post in replies]
+
+    def more_link(self, post, request):
+        """URL that loads the next replies under ``post``, or None if all are shown."""
+        if post.id in self.cursors:
+            cursor = KeysetPagination().encode_cursor(self.cursors[post.id])
+        elif self.depths.get(post.id) == self.max_depth and post.replies_count:
+            cursor = None
+        else:
+            return None
+
+        url = reverse("post-replies", kwargs={"pk": post.id}, request=request)
+        if cursor is not None:
+            url = replace_query_param(url, KeysetPagination.cursor_query_param, cursor)
+        return url
@@ -0,0 +1,77 @@
+"""
+Full-text search over posts.
+
+``Post.search_vector`` is filled by a database trigger (see migration 0010)
+and GIN-indexed; usernames are matched with ``icontains``, which a trigram
+index on ``UPPER(auth_user.username)`` serves (migration 0017).  The two
+are combined as a UNION of post ids, each half using its own index: an OR
+across the author join can use neither and scans every post.
+
+Headlines are built from raw user text, so the database marks matches with
+control characters and ``highlight_html`` escapes the snippet before it
+turns them into ``<mark>`` tags.
+"""
+from django.contrib.auth.models import User
+from django.contrib.postgres.search import (
+    SearchHeadline, SearchQuery, SearchRank, TrigramSimilarity,
+)
+from django.db.models import F
+from django.utils.html import escape
+from rest_framework import filters
+
+# Must match the configuration used by the trigger in migration 0010.
+SEARCH_CONFIG = "simple"
+
+# Match delimiters in ``headline``; control characters, so they survive escaping.
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_STOP = "\x03"
+
+
+def search_query(terms):
+    return SearchQuery(terms, config=SEARCH_CONFIG, search_type="websearch")
+
+
+def matching(queryset, terms):
+    posts = queryset.model.objects.order_by()
+    by_text = posts.filter(search_vector=search_query(terms)).values("pk")
+    by_author = posts.filter(
+        author_id__in=User.objects.filter(username__icontains=terms).values("pk")
+    ).values("pk")
+    return queryset.filter(pk__in=by_text.union(by_author))
+
+
+def ranked_search(queryset, terms):
+    """Matching posts, best first, with a highlighted ``headline`` snippet."""
+    query = search_query(terms)
+    return matching(queryset, terms).annotate(
+        rank=SearchRank(F("search_vector"), query) + TrigramSimilarity("author__username", terms),
+        headline=SearchHeadline(
+            "description",
+            query,
+            config=SEARCH_CONFIG,
+            start_sel=HIGHLIGHT_START,
+            stop_sel=HIGHLIGHT_STOP,
+            max_fragments=2,
+        ),
+    ).order_by("-rank", "-created_at", "-id")
+
+
+def highlight_html(headline):
+    """An escaped ``headline`` with its matches wrapped in ``<mark>``."""
+    if headline is None:
+        return None
+    return (
+        escape(headline)
+        .replace(HIGHLIGHT_START, "<mark>")
+        .replace(HIGHLIGHT_STOP, "</mark>")
+    )
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """Drop-in for SearchFilter on ``?search=`` backed by the indexes above."""
+
+    def filter_queryset(self, request, queryset, view):
+        terms = request.query_params.get(self.search_param, "").strip()
+        if not terms:
+            return queryset
+        return matching(queryset, terms)
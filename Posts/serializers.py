@@ -1,11 +1,103 @@
+from django.conf import settings
+from django.db import models
 from rest_framework import serializers
-from .models import Post, Media, Like
+from . import fragments, likebuffer, search, uploads as upload_sessions
+from .models import Post, Media, MediaVariant, Like, UploadSession
+from .replies import ReplyTree
+
+
+def resolve_viewer_state(context, posts):
+    """
+    Find which of ``posts`` the requesting user liked or reposted, with two
+    set queries, and remember the answer in the serializer context so every
+    row of a page is a set lookup.
+    """
+    state = context.setdefault(
+        "viewer_state", {"resolved": set(), "liked": set(), "reposted": set()}
+    )
+    post_ids = {post.id for post in posts} - state["resolved"]
+    request = context.get("request")
+    user = getattr(request, "user", None)
+
+    if post_ids and user is not None and user.is_authenticated:
+        state["liked"].update(
+            Like.objects.filter(user=user, post_id__in=post_ids)
+            .values_list("post_id", flat=True)
+        )
+        state["reposted"].update(
+            Post.objects.filter(author=user, type=Post.REPOST, parent_id__in=post_ids)
+            .values_list("parent_id", flat=True)
+        )
+    state["resolved"] |= post_ids
+    return state
+
+
+def resolve_like_buffer(context, posts):
+    """
+    Look up the write-behind likes (Posts/likebuffer.py) still pending on
+    ``posts``, once per page, so counts and the viewer's own like include them.
+    """
+    state = context.setdefault("like_buffer", {"resolved": set(), "pending": {}})
+    post_ids = {post.id for post in posts} - state["resolved"]
+    if post_ids:
+        request = context.get("request")
+        user = getattr(request, "user", None)
+        user_id = user.id if user is not None and user.is_authenticated else None
+        state["pending"].update(likebuffer.pending(post_ids, user_id))
+    state["resolved"] |= post_ids
+    return state
+
+
+def load_fragments(context, posts):
+    """Fetch the cached viewer-independent payloads for ``posts`` into the context."""
+    known = context.setdefault("fragments", {})
+    missing = [post for post in posts if post.id not in known]
+    if missing:
+        known.update(fragments.get_many(missing, build_fragments))
+    return known
+
+
+def resolve_posts(context, posts):
+    """
+    Everything the serializers look up per post, fetched for all of
+    ``posts`` at once: one fragment MGET, the viewer's likes and reposts,
+    and the pending buffered likes.  Pass a whole reply tree so nested
+    children lists find their posts already resolved.
+    """
+    load_fragments(context, posts)
+    resolve_viewer_state(context, posts)
+    resolve_like_buffer(context, posts)
+
+
+def build_fragments(posts):
+    return {post.id: dict(PostFragmentSerializer(post).data) for post in posts}
+
+
+class PostListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        posts = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        resolve_posts(self.context, posts)
+        return super().to_representation(posts)
+
+class MediaVariantSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MediaVariant
+        fields = ['name', 'file', 'width', 'height']
 
 class MediaSerializer(serializers.ModelSerializer):
+    status = serializers.SerializerMethodField()
+    variants = MediaVariantSerializer(many=True, read_only=True)
+
     class Meta:
         model = Media
-        fields = ['id', 'file', 'media_type']
-        read_only_fields = ['id', 'media_type']
+        fields = ['id', 'file', 'media_type', 'status', 'width', 'height', 'duration', 'poster', 'variants']
+        read_only_fields = ['id', 'media_type', 'width', 'height', 'duration', 'poster']
+
+    def get_status(self, obj):
+        # Clients only need to know whether the variants are there yet.
+        if obj.status in (Media.READY, Media.FAILED):
+            return obj.status
+        return Media.PROCESSING
 
 class PostSerializer(serializers.ModelSerializer):
     avatar_url = serializers.ImageField(source='author.profile.profile_image',read_only=True)
@@ -30,11 +122,18 @@ class PostSerializer(serializers.ModelSerializer):
         required=False,
         help_text="List of image/video files"
     )
+    upload_ids = serializers.PrimaryKeyRelatedField(
+        queryset=UploadSession.objects.filter(status=UploadSession.COMPLETE),
+        many=True,
+        write_only=True,
+        required=False,
+        help_text="Finalized chunked upload sessions to attach"
+    )
     
-    comments_count = serializers.SerializerMethodField(read_only=True)
+    comments_count = serializers.IntegerField(source='replies_count', read_only=True)
     reposts_count = serializers.SerializerMethodField(read_only=True)
 
-    likes_count = serializers.IntegerField(source='likes.count', read_only=True)
+    likes_count = serializers.IntegerField(read_only=True)
     
     liked_by_user     = serializers.SerializerMethodField(read_only=True)
     reposted_by_user  = serializers.SerializerMethodField(read_only=True)
@@ -46,30 +145,43 @@ class PostSerializer(serializers.ModelSerializer):
             'id', 'avatar_url', 'display_name', 'username',
             'created_at', 'type', 'parent', 'description',
             'posted_media',
-            'uploads',
+            'uploads', 'upload_ids',
             'comments_count',
             'likes_count',
             'reposts_count', 'liked_by_user', 'reposted_by_user',
         ]
         read_only_fields = ['id']
+        list_serializer_class = PostListSerializer
+    def to_representation(self, instance):
+        fragment = load_fragments(self.context, [instance])[instance.id]
+        data = {}
+        for field in self._readable_fields:
+            if field.field_name in fragment:
+                data[field.field_name] = fragment[field.field_name]
+                continue
+            attribute = field.get_attribute(instance)
+            data[field.field_name] = None if attribute is None else field.to_representation(attribute)
+
+        buffered = resolve_like_buffer(self.context, [instance])["pending"].get(instance.id)
+        if buffered is not None:
+            delta, liked = buffered
+            data['likes_count'] += delta
+            if liked is not None and 'liked_by_user' in data:
+                data['liked_by_user'] = liked
+        return fragments.absolutize(data, self.context.get('request'))
+
     def get_reposts_count(self, obj):
-        reposts = obj.children.filter(type=Post.REPOST).count()
-        quotes  = obj.children.filter(type=Post.QUOTE).count()
-        return reposts + quotes
+        return obj.reposts_count + obj.quotes_count
         
-    def get_comments_count(self, obj):
-        return obj.children.filter(type=Post.REPLY).count()
     def get_display_name(self, obj):
         user = obj.author
         return f"{user.first_name} {user.last_name}".strip() or user.username
     
     def get_liked_by_user(self, obj):
-        user= self.context['request'].user
-        return obj.likes.filter(user=user).exists()
+        return obj.id in resolve_viewer_state(self.context, [obj])["liked"]
     
     def get_reposted_by_user(self, obj):
-        user = self.context['request'].user
-        return obj.children.filter(author=user, type=Post.REPOST).exists()
+        return obj.id in resolve_viewer_state(self.context, [obj])["reposted"]
 
     def validate_uploads(self, files):
         MAX_FILES = 4
@@ -85,28 +197,95 @@ class PostSerializer(serializers.ModelSerializer):
                 )
 
         return files
+
+    def validate_upload_ids(self, sessions):
+        user = self.context['request'].user
+        if any(session.user_id != user.id for session in sessions):
+            raise serializers.ValidationError("Unknown upload session.")
+        return sessions
     
     def validate(self, data):
         post_type=data.get('type') or (self.instance.type if self.instance else None)
         parent = data.get('parent') if 'parent' in data else (self.instance.parent if self.instance else None)
         if post_type == 'repost' and not parent:
             raise serializers.ValidationError("A repost must have a parent post.")
+        if len(data.get('uploads', [])) + len(data.get('upload_ids', [])) > 4:
+            raise serializers.ValidationError(
+                {"uploads": "You can upload up to 4 media items (photos or videos)."}
+            )
         return data
     
     def create(self, validated_data):
         uploads = validated_data.pop('uploads', [])
+        sessions = validated_data.pop('upload_ids', [])
         post = Post.objects.create(**validated_data)
         for f in uploads:
             kind = 'video' if f.content_type.startswith('video/') else 'photo'
             Media.objects.create(post=post, file=f, media_type=kind)
+        for session in sessions:
+            upload_sessions.attach(session, post)
         return post
     
+class PostFragmentSerializer(PostSerializer):
+    """The part of a PostSerializer payload that is the same for every viewer."""
+
+    class Meta(PostSerializer.Meta):
+        fields = [
+            name for name in PostSerializer.Meta.fields
+            if name not in fragments.VIEWER_FIELDS and name not in ('uploads', 'upload_ids')
+        ]
+
+    def to_representation(self, instance):
+        return serializers.ModelSerializer.to_representation(self, instance)
+
+
+class PostSearchSerializer(PostSerializer):
+    rank = serializers.FloatField(read_only=True)
+    headline = serializers.SerializerMethodField()
+
+    class Meta(PostSerializer.Meta):
+        fields = PostSerializer.Meta.fields + ['rank', 'headline']
+
+    def get_headline(self, obj):
+        return search.highlight_html(getattr(obj, "headline", None))
+
+
 class PostDetailSerializer(PostSerializer):
     children = serializers.SerializerMethodField()
+    more_replies = serializers.SerializerMethodField()
+
+    def get_reply_tree(self, obj):
+        tree = self.context.get('reply_tree')
+        if tree is None:
+            tree = self.context['reply_tree'] = ReplyTree(obj)
+            resolve_posts(self.context, [obj, *tree.posts()])
+        return tree
 
     def get_children(self, obj):
-        replies = obj.children.filter(type=Post.REPLY)
+        replies = self.get_reply_tree(obj).children.get(obj.id, [])
         return PostDetailSerializer(replies, many=True, context=self.context).data
 
+    def get_more_replies(self, obj):
+        return self.get_reply_tree(obj).more_link(obj, self.context.get('request'))
+
     class Meta(PostSerializer.Meta):
-        fields = PostSerializer.Meta.fields + ['children']
\ No newline at end of file
+        fields = PostSerializer.Meta.fields + ['children', 'more_replies']
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'content_type', 'media_type', 'size', 'received', 'status', 'created_at']
+        read_only_fields = ['id', 'media_type', 'received', 'status', 'created_at']
+
+    def validate(self, data):
+        media_type = upload_sessions.ALLOWED_TYPES.get(data['content_type'])
+        if media_type is None:
+            raise serializers.ValidationError({"content_type": "Only images and videos can be uploaded."})
+        limit = settings.UPLOAD_MAX_BYTES[media_type]
+        if data['size'] > limit:
+            raise serializers.ValidationError(
+                {"size": f"Each {media_type} must be smaller than {limit // (1024 * 1024)} MB."}
+            )
+        data['media_type'] = media_type
+        return data
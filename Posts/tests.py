@@ -1,3 +1,375 @@
-from django.test import TestCase
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django_redis import get_redis_connection
+from rest_framework.test import APITestCase
+
+from Notifications.models import Notifications
+from . import counters, fragments, likebuffer, search, timeline, uploads
+from .models import Like, Post, UploadSession
+from .pagination import KeysetPagination
+from .serializers import build_fragments
+
+
+class LikeFastPathTests(APITestCase):
+    def setUp(self):
+        author = User.objects.create_user("author", "author@example.com", "pw")
+        liker = User.objects.create_user("liker", "liker@example.com", "pw")
+        self.post = Post.objects.create(author=author, description="hello")
+        self.url = reverse("post-like", kwargs={"pk": self.post.pk})
+        # Fresh instance, so the liker's profile isn't already cached on it.
+        self.liker = User.objects.get(pk=liker.pk)
+        self.client.force_authenticate(self.liker)
+        ContentType.objects.get_for_model(Post)
+
+    def test_like_query_budget(self):
+        # post + visibility, the like statement, the media prefetch for the
+        # payload, the liker's avatar for the notification and one outbox
+        # insert for all realtime events, the last four in one transaction
+        # (a savepoint pair inside the test's own).
+        with self.assertNumQueries(7):
+            response = self.client.post(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["likes_count"], 1)
+        self.assertTrue(response.data["liked_by_user"])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertTrue(Like.objects.filter(post=self.post, user=self.liker).exists())
+        self.assertTrue(
+            Notifications.objects.get(actor=self.liker, notification_type=Notifications.POST_LIKE).active
+        )
+
+    def test_like_twice_counts_once(self):
+        self.client.post(self.url)
+        response = self.client.post(self.url)
+
+        self.assertEqual(response.data["likes_count"], 1)
+        self.assertEqual(Notifications.objects.filter(actor=self.liker).count(), 1)
+
+    def test_unlike_query_budget(self):
+        self.client.post(self.url)
+
+        with self.assertNumQueries(6):
+            response = self.client.delete(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["likes_count"], 0)
+        self.assertFalse(response.data["liked_by_user"])
+        self.assertFalse(Notifications.objects.get(actor=self.liker).active)
+
+
+@override_settings(LIKE_BUFFER_HOT_THRESHOLD=1)
+class BufferedLikeETagTests(APITestCase):
+    def setUp(self):
+        author = User.objects.create_user("hot", "hot@example.com", "pw")
+        self.liker = User.objects.create_user("fan", "fan@example.com", "pw")
+        self.post = Post.objects.create(author=author, description="hot take")
+        self.client.force_authenticate(self.liker)
+
+        redis = get_redis_connection("default")
+        keys = [*likebuffer._keys(self.post.pk).values(), f"likes:hot:{self.post.pk}"]
+        self.addCleanup(redis.delete, *keys)
+        self.addCleanup(redis.srem, likebuffer.BUFFERED_KEY, self.post.pk)
+
+    def test_buffered_like_changes_the_etag(self):
+        url = reverse("post-detail", kwargs={"pk": self.post.pk})
+        before = self.client.get(url)
+
+        self.client.post(reverse("post-like", kwargs={"pk": self.post.pk}))
+        after = self.client.get(url, HTTP_IF_NONE_MATCH=before["ETag"])
+
+        self.assertEqual(after.status_code, 200)
+        self.assertEqual(after.data["likes_count"], 1)
+        self.assertNotEqual(after["ETag"], before["ETag"])
+        self.assertNotIn("Last-Modified", after)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=after["ETag"]).status_code, 304)
+
+
+@mock.patch.object(KeysetPagination, "page_size", 2)
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("pager", "pager@example.com", "pw")
+        self.client.force_authenticate(self.user)
+        self.posts = [Post.objects.create(author=self.user, description=str(i)) for i in range(5)]
+        # Filtering by author goes through the queryset paginator, not the timeline.
+        self.url = reverse("post-list") + f"?author={self.user.pk}"
+
+    def set_created_at(self, posts, created_at):
+        Post.objects.filter(pk__in=[post.pk for post in posts]).update(created_at=created_at)
+
+    def walk(self, url):
+        ids, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [post["id"] for post in response.data["results"]]
+            url = response.data["next"]
+            pages += 1
+        return ids, pages
+
+    def test_equal_created_at_falls_back_to_id(self):
+        self.set_created_at(self.posts, timezone.now())
+
+        ids, pages = self.walk(self.url)
+
+        self.assertEqual(ids, [post.pk for post in reversed(self.posts)])
+        self.assertEqual(pages, 3)
+
+    def test_page_boundary_inside_a_tie(self):
+        now = timezone.now()
+        newest, *tied, oldest = self.posts[::-1]
+        self.set_created_at([newest], now)
+        self.set_created_at(tied, now - timedelta(seconds=1))
+        self.set_created_at([oldest], now - timedelta(seconds=2))
+
+        ids, _ = self.walk(self.url)
+
+        self.assertEqual(ids, [newest.pk, *[post.pk for post in tied], oldest.pk])
+
+    def test_ascending_order_with_ties(self):
+        self.set_created_at(self.posts, timezone.now())
+
+        ids, _ = self.walk(self.url + "&ordering=created_at")
+
+        self.assertEqual(ids, [post.pk for post in self.posts])
+
+    def test_post_created_meanwhile_does_not_shift_pages(self):
+        self.set_created_at(self.posts, timezone.now() - timedelta(minutes=1))
+        first = self.client.get(self.url).data
+
+        Post.objects.create(author=self.user, description="new")
+        ids, _ = self.walk(first["next"])
+
+        self.assertEqual([post["id"] for post in first["results"]] + ids, [post.pk for post in reversed(self.posts)])
+
+    def test_last_page_has_no_next(self):
+        Post.objects.filter(pk__in=[post.pk for post in self.posts[2:]]).delete()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIsNone(response.data["next"])
+
+    def test_invalid_cursor_is_not_found(self):
+        for cursor in ("garbage", KeysetPagination().encode_cursor([1])):
+            response = self.client.get(self.url + f"&cursor={cursor}")
+            self.assertEqual(response.status_code, 404)
+
+
+@mock.patch.object(KeysetPagination, "page_size", 2)
+@override_settings(TIMELINE_MAX_LENGTH=5)
+class TimelineFallbackTests(APITestCase):
+    def setUp(self):
+        self.viewer = User.objects.create_user("viewer", "viewer@example.com", "pw")
+        self.viewer.profile.is_private = True
+        self.viewer.profile.save()
+        self.public = User.objects.create_user("public", "public@example.com", "pw")
+        self.client.force_authenticate(self.viewer)
+
+        redis = get_redis_connection("default")
+        keys = [timeline.PUBLIC_KEY, timeline.user_key(self.viewer.pk)]
+        redis.delete(*keys)
+        self.addCleanup(redis.delete, *keys)
+
+    def post(self, author, created_at):
+        post = Post.objects.create(author=author, description="x")
+        Post.objects.filter(pk=post.pk).update(created_at=created_at)
+        return post.pk
+
+    def walk(self):
+        ids, url = [], reverse("post-list")
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [post["id"] for post in response.data["results"]]
+            url = response.data["next"]
+        return ids
+
+    def test_pages_past_the_floor_of_the_trimmed_public_key(self):
+        start = timezone.now() - timedelta(hours=1)
+        authors = [self.public] * 2 + [self.viewer] + [self.public] * 6 + [self.viewer]
+        ids = [self.post(author, start + timedelta(minutes=i)) for i, author in enumerate(authors)]
+
+        # timeline:public keeps the newest five public posts; the viewer's
+        # own key still reaches back to their older post.
+        self.assertEqual(self.walk(), ids[::-1])
+
+    def test_pages_past_the_end_of_the_timeline(self):
+        start = timezone.now() - timedelta(hours=1)
+        ids = [self.post(self.viewer, start + timedelta(minutes=i)) for i in range(8)]
+
+        self.assertEqual(self.walk(), ids[::-1])
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        author = User.objects.create_user("cached", "cached@example.com", "pw")
+        self.post = Post.objects.create(author=author, description="hello")
+        self.key = fragments.fragment_key(self.post.pk)
+        cache.delete(self.key)
+        self.addCleanup(cache.delete, self.key)
+
+    def test_fragment_built_from_an_older_row_is_not_served(self):
+        stale = Post.objects.get(pk=self.post.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            counters.bump(self.post.pk, likes_count=1)
+        # A reader that loaded the row before the write fills the cache late.
+        fragments.get_many([stale], build_fragments)
+
+        fresh = Post.objects.get(pk=self.post.pk)
+        build = mock.Mock(wraps=build_fragments)
+        fragment = fragments.get_many([fresh], build)[fresh.pk]
+
+        build.assert_called_once()
+        self.assertEqual(fragment["likes_count"], 1)
+        self.assertEqual(fragments.get_many([fresh], build_fragments)[fresh.pk]["likes_count"], 1)
+
+    def test_invalidation_waits_for_commit(self):
+        fragments.get_many([self.post], build_fragments)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            fragments.invalidate_on_commit([self.post.pk])
+            self.assertIsNotNone(cache.get(self.key))
+
+        callbacks[0]()
+        self.assertIsNone(cache.get(self.key))
+
+
+class SearchHeadlineTests(SimpleTestCase):
+    def test_user_text_is_escaped_and_matches_marked(self):
+        headline = f"a < b {search.HIGHLIGHT_START}<img src=x onerror=alert(1)>{search.HIGHLIGHT_STOP} & c"
+
+        self.assertEqual(
+            search.highlight_html(headline),
+            "a &lt; b <mark>&lt;img src=x onerror=alert(1)&gt;</mark> &amp; c",
+        )
+
+    def test_missing_headline(self):
+        self.assertIsNone(search.highlight_html(None))
+
+
+class SearchPlanTests(TestCase):
+    """Both halves of the search UNION must be able to use their indexes."""
+
+    @classmethod
+    def setUpClass(cls):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_indexes WHERE indexname = 'auth_user_username_upper_trgm_idx'")
+            if cursor.fetchone() is None:
+                raise unittest.SkipTest("needs the pg_trgm index from migration 0017")
+        super().setUpClass()
+
+    def plan(self, queryset):
+        # Tiny test tables are always cheapest to scan, so rule that out
+        # and see which indexes the planner is left with.
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            return queryset.explain()
+
+    def test_username_half_uses_trigram_index(self):
+        plan = self.plan(search.matching(Post.objects.all(), "user_42"))
+
+        self.assertIn("auth_user_username_upper_trgm_idx", plan)
+        self.assertIn("post_search_vector_idx", plan)
+
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
+
+
+class ChunkedUploadTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("uploader", "uploader@example.com", "pw")
+        self.client.force_authenticate(self.user)
+        upload_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(upload_dir.cleanup)
+        self.enterContext(override_settings(UPLOAD_SESSION_DIR=upload_dir.name))
+
+        response = self.client.post(reverse("upload-list"), {
+            "filename": "photo.png", "content_type": "image/png", "size": len(PNG_BYTES),
+        })
+        self.assertEqual(response.status_code, 201)
+        self.session = UploadSession.objects.get(pk=response.data["id"])
+        self.url = reverse("upload-detail", kwargs={"pk": self.session.pk})
+
+    def put(self, start, end, body=None):
+        body = PNG_BYTES[start:end + 1] if body is None else body
+        return self.client.put(
+            self.url, body, content_type="application/octet-stream",
+            HTTP_CONTENT_RANGE=f"bytes {start}-{end}/{len(PNG_BYTES)}",
+        )
+
+    def test_chunks_in_order_complete_the_upload(self):
+        self.assertEqual(self.put(0, 99).data["received"], 100)
+        self.assertEqual(self.put(100, len(PNG_BYTES) - 1).data["received"], len(PNG_BYTES))
+
+        response = self.client.post(reverse("upload-finalize", kwargs={"pk": self.session.pk}))
+
+        self.assertEqual(response.status_code, 200)
+        with open(uploads.partial_path(self.session), "rb") as fh:
+            self.assertEqual(fh.read(), PNG_BYTES)
+
+    def test_chunk_that_does_not_start_at_received_is_rejected(self):
+        self.put(0, 99)
+
+        response = self.put(200, 299)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["received"], 100)
+
+    def test_repeated_chunk_is_not_written_twice(self):
+        self.put(0, 99)
+
+        response = self.put(0, 99)
+
+        self.assertEqual(response.status_code, 409)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.received, 100)
+        self.assertEqual(os.path.getsize(uploads.partial_path(self.session)), 100)
+
+    def test_resume_overwrites_a_cut_off_tail(self):
+        self.put(0, 99)
+        # Bytes past ``received`` from a chunk that was never recorded.
+        with open(uploads.partial_path(self.session), "ab") as fh:
+            fh.write(b"garbage")
+
+        self.put(100, len(PNG_BYTES) - 1)
+
+        with open(uploads.partial_path(self.session), "rb") as fh:
+            self.assertEqual(fh.read(), PNG_BYTES)
+
+    def test_chunk_past_the_declared_size_is_rejected(self):
+        response = self.client.put(
+            self.url, PNG_BYTES + b"x", content_type="application/octet-stream",
+            HTTP_CONTENT_RANGE=f"bytes 0-{len(PNG_BYTES)}/*",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.received, 0)
+
+    def test_bytes_of_the_wrong_type_reset_the_session(self):
+        response = self.put(0, 99, body=b"%PDF-1.7" + bytes(92))
+
+        self.assertEqual(response.status_code, 400)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.received, 0)
+        self.assertFalse(os.path.exists(uploads.partial_path(self.session)))
+
+    def test_incomplete_upload_cannot_be_finalized(self):
+        self.put(0, 99)
+
+        response = self.client.post(reverse("upload-finalize", kwargs={"pk": self.session.pk}))
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["received"], 100)
@@ -0,0 +1,261 @@
+"""
+Materialized home timelines kept in Redis sorted sets.
+
+Posts are pushed into the timelines of their audience when they are created
+(fan-out on write).  Public authors, and private authors with more friends
+than TIMELINE_FANOUT_MAX_FRIENDS, are not fanned out: their posts live in
+shared sorted sets that get merged in when a timeline is read.
+
+Scores are microseconds since the epoch so they stay exact in a double.
+"""
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django_redis import get_redis_connection
+
+from Profile import graph
+from .models import Post
+
+PUBLIC_KEY = "timeline:public"
+PULL_AUTHORS_KEY = "timeline:pull_authors"
+
+# Keeps an empty timeline materialized so it isn't rebuilt on every read.
+EMPTY_MARKER = "0"
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Only touch timelines that are already materialized; cold ones are rebuilt
+# from the database on their next read.
+_PUSH_SCRIPT = """
+local max_len = tonumber(ARGV[1])
+for _, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        for i = 2, #ARGV, 2 do
+            redis.call('ZADD', key, ARGV[i], ARGV[i + 1])
+        end
+        redis.call('ZREMRANGEBYRANK', key, 0, -max_len - 1)
+    end
+end
+return 0
+"""
+
+# For each key, the newest ``limit`` entries at or below ARGV[1], plus every
+# entry tied on that score so the (score, id) cursor can be applied exactly.
+# Keys that reached ARGV[3] entries have been trimmed (the empty marker goes
+# first), so their oldest score is returned as a floor: below it the key no
+# longer has every post.
+_RANGE_SCRIPT = """
+local upper, limit, max_len, marker = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3]), ARGV[4]
+local ranges, floors = {}, {}
+for i, key in ipairs(KEYS) do
+    local ties = 0
+    if upper ~= '+inf' then
+        ties = redis.call('ZCOUNT', key, upper, upper)
+    end
+    ranges[i] = redis.call('ZREVRANGEBYSCORE', key, upper, '-inf', 'WITHSCORES', 'LIMIT', 0, limit + ties)
+    floors[i] = ''
+    if redis.call('ZCARD', key) >= max_len then
+        local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        if oldest[1] ~= marker then
+            floors[i] = oldest[2]
+        end
+    end
+end
+return {ranges, floors}
+"""
+
+
+def user_key(user_id):
+    return f"timeline:user:{user_id}"
+
+
+def author_key(author_id):
+    return f"timeline:author:{author_id}"
+
+
+def score_for(created_at):
+    return (created_at - EPOCH) // timedelta(microseconds=1)
+
+
+def created_at_for(score):
+    return EPOCH + timedelta(microseconds=score)
+
+
+def _redis():
+    return get_redis_connection("default")
+
+
+def _is_pull_author(conn, author_id, friend_count):
+    if friend_count > settings.TIMELINE_FANOUT_MAX_FRIENDS:
+        conn.sadd(PULL_AUTHORS_KEY, author_id)
+        return True
+    return bool(conn.sismember(PULL_AUTHORS_KEY, author_id))
+
+
+def _audience_keys(conn, author):
+    profile = author.profile
+    if not profile.is_private:
+        return {PUBLIC_KEY}
+
+    friend_ids = graph.friend_ids(author.id)
+    if _is_pull_author(conn, author.id, len(friend_ids)):
+        return {author_key(author.id), user_key(author.id)}
+    return {user_key(uid) for uid in [*friend_ids, author.id]}
+
+
+def push_post(post):
+    """Fan a newly created post (and the post it points at) out to its audience."""
+    conn = _redis()
+    keys = _audience_keys(conn, post.author)
+
+    # Replies are visible to everyone who can see the post they answer.
+    if post.type == Post.REPLY and post.parent_id:
+        keys |= _audience_keys(conn, post.parent.author)
+
+    args = [settings.TIMELINE_MAX_LENGTH, score_for(post.created_at), post.id]
+    if post.parent_id:
+        args += [score_for(post.parent.created_at), post.parent_id]
+
+    conn.register_script(_PUSH_SCRIPT)(keys=list(keys), args=args)
+
+
+def remove_post(post):
+    """
+    Drop a post from the shared timelines and its author's own one.
+    Copies in friends' timelines are skipped when the page is hydrated.
+    """
+    remove_posts(post.author_id, [post.id])
+
+
+def remove_posts(author_id, post_ids):
+    if not post_ids:
+        return
+    conn = _redis()
+    with conn.pipeline(transaction=False) as pipe:
+        for key in (PUBLIC_KEY, author_key(author_id), user_key(author_id)):
+            pipe.zrem(key, *post_ids)
+        pipe.execute()
+
+
+def forget_author(author_id):
+    """Drop everything kept for an author who is going away."""
+    conn = _redis()
+    conn.srem(PULL_AUTHORS_KEY, author_id)
+    conn.delete(author_key(author_id), user_key(author_id))
+
+
+def invalidate_users(user_ids):
+    """Forget the materialized timelines of these users; they rebuild lazily."""
+    keys = [user_key(uid) for uid in set(user_ids)]
+    if keys:
+        _redis().delete(*keys)
+
+
+def invalidate_author(user):
+    """Called when an author's audience changes shape, e.g. privacy toggles."""
+    friend_ids = graph.friend_ids(user.id)
+    conn = _redis()
+    conn.srem(PULL_AUTHORS_KEY, user.id)
+    conn.delete(PUBLIC_KEY, author_key(user.id))
+    invalidate_users([user.id, *friend_ids])
+
+
+def _source_filter(key):
+    if key == PUBLIC_KEY:
+        return (
+            Q(author__profile__is_private=False) |
+            Q(type=Post.REPLY, parent__author__profile__is_private=False)
+        )
+    if key.startswith("timeline:author:"):
+        author_id = int(key.rsplit(":", 1)[1])
+        return Q(author_id=author_id) | Q(type=Post.REPLY, parent__author_id=author_id)
+
+    user_id = int(key.rsplit(":", 1)[1])
+    authors = [*graph.friend_ids(user_id), user_id]
+    return (
+        Q(author_id__in=authors, author__profile__is_private=True) |
+        Q(type=Post.REPLY, parent__author_id__in=authors, parent__author__profile__is_private=True)
+    )
+
+
+def _rebuild(conn, key):
+    rows = (
+        Post.objects.filter(_source_filter(key))
+        .order_by("-created_at")
+        .values_list("id", "created_at", "parent_id", "parent__created_at")
+        [:settings.TIMELINE_MAX_LENGTH]
+    )
+    entries = {EMPTY_MARKER: "-inf"}
+    for post_id, created_at, parent_id, parent_created_at in rows:
+        entries[post_id] = score_for(created_at)
+        if parent_id:
+            entries[parent_id] = score_for(parent_created_at)
+
+    with conn.pipeline() as pipe:
+        pipe.delete(key)
+        pipe.zadd(key, entries)
+        pipe.zremrangebyrank(key, 0, -settings.TIMELINE_MAX_LENGTH - 1)
+        if key.startswith("timeline:user:"):
+            pipe.expire(key, settings.TIMELINE_TTL)
+        pipe.execute()
+
+
+def _read_keys(conn, user):
+    keys = [user_key(user.id), PUBLIC_KEY]
+    pull_ids = {int(uid) for uid in conn.smembers(PULL_AUTHORS_KEY)}
+    if pull_ids:
+        keys += [author_key(uid) for uid in sorted(pull_ids & graph.friend_ids(user.id))]
+    return keys
+
+
+def read_timeline(user, before=None, limit=20):
+    """
+    Return up to ``limit`` ``(post_id, score)`` pairs from the user's home
+    timeline, newest first, strictly after the ``(score, post_id)`` position
+    given as ``before``.
+
+    Only entries above the highest floor of a trimmed key are returned;
+    older than that the merge would silently miss posts, so a short result
+    means the caller has to carry on from the database.
+    """
+    conn = _redis()
+    keys = _read_keys(conn, user)
+
+    with conn.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.exists(key)
+        warm = pipe.execute()
+    for key, exists in zip(keys, warm):
+        if not exists:
+            _rebuild(conn, key)
+
+    upper = before[0] if before is not None else "+inf"
+    ranges, floors = conn.register_script(_RANGE_SCRIPT)(
+        keys=keys, args=[upper, limit, settings.TIMELINE_MAX_LENGTH, EMPTY_MARKER]
+    )
+    conn.expire(user_key(user.id), settings.TIMELINE_TTL)
+    floor = max((int(float(score)) for score in floors if score), default=None)
+
+    merged = {}
+    for entries in ranges:
+        for member, score in zip(entries[::2], entries[1::2]):
+            if member.decode() == EMPTY_MARKER:
+                continue
+            score = int(float(score))
+            if floor is None or score > floor:
+                merged[int(member)] = score
+
+    ordered = sorted(
+        ((score, post_id) for post_id, score in merged.items()
+         if before is None or (score, post_id) < tuple(before)),
+        reverse=True,
+    )
+    return [(post_id, score) for score, post_id in ordered[:limit]]
+
+
+def hydrate(post_ids):
+    """Load the posts for a page of timeline ids in one query, keeping the order."""
+    posts = Post.objects.filter(id__in=post_ids).select_related("author", "author__profile")
+    by_id = {post.id: post for post in posts}
+    return [by_id[pid] for pid in post_ids if pid in by_id]
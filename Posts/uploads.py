@@ -0,0 +1,133 @@
+"""
+Resumable chunked uploads.
+
+A client opens a session with the file's name, type and size, PUTs the
+bytes in order (each chunk says where it starts) and then finalizes.  The
+partial file lives in UPLOAD_SESSION_DIR, outside MEDIA_ROOT, and is
+checked as it grows: it can never run past the declared size, and its
+first bytes must look like a supported image or video.  A finalized
+session becomes a Media row when a post is created with its id.
+"""
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from rest_framework import serializers
+
+from .models import Media
+
+READ_SIZE = 64 * 1024
+
+# Enough of a file's head to recognise every format below.
+SNIFF_BYTES = 16
+
+ALLOWED_TYPES = {
+    "image/jpeg": "photo",
+    "image/png": "photo",
+    "image/gif": "photo",
+    "image/webp": "photo",
+    "video/mp4": "video",
+    "video/quicktime": "video",
+    "video/webm": "video",
+}
+
+# ISO-BMFF brands that are still images rather than video.
+_IMAGE_BRANDS = {b"heic", b"heix", b"mif1", b"avif"}
+
+
+def sniff(head):
+    """Guess a MIME type from the magic bytes at the start of a file."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand in _IMAGE_BRANDS:
+            return None
+        return "video/quicktime" if brand == b"qt  " else "video/mp4"
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return "video/webm"
+    return None
+
+
+def partial_path(session):
+    return os.path.join(settings.UPLOAD_SESSION_DIR, f"{session.pk}.part")
+
+
+def append(session, stream, offset, length):
+    """
+    Write ``length`` bytes from ``stream`` at ``offset`` (which must equal
+    ``session.received``) straight to the partial file.  The caller holds
+    the session's row lock, so chunks of one session never overlap.  If the client drops
+    mid-chunk, whatever arrived is kept and the client resumes from there.
+    """
+    if offset + length > session.size:
+        raise serializers.ValidationError("Chunk runs past the declared upload size.")
+
+    os.makedirs(settings.UPLOAD_SESSION_DIR, exist_ok=True)
+    path = partial_path(session)
+    written, head = 0, None
+    with open(path, "r+b" if os.path.exists(path) else "w+b") as fh:
+        # Drop the tail of an earlier chunk that was cut off before being recorded.
+        fh.seek(offset)
+        fh.truncate()
+        while written < length:
+            data = stream.read(min(READ_SIZE, length - written))
+            if not data:
+                break
+            fh.write(data)
+            written += len(data)
+
+        sniff_at = min(SNIFF_BYTES, session.size)
+        if offset < sniff_at <= offset + written:
+            fh.seek(0)
+            head = fh.read(sniff_at)
+
+    if head is not None:
+        _check_type(session, head, path)
+    session.received = offset + written
+    session.save(update_fields=["received", "content_type", "updated_at"])
+    return written
+
+
+def _check_type(session, head, path):
+    detected = sniff(head)
+    if ALLOWED_TYPES.get(detected) != session.media_type:
+        os.remove(path)
+        session.received = 0
+        session.save(update_fields=["received", "updated_at"])
+        raise serializers.ValidationError(
+            "The uploaded bytes are not a supported "
+            f"{'image' if session.media_type == 'photo' else 'video'} format."
+        )
+    session.content_type = detected
+
+
+def attach(session, post):
+    """Move a finished upload into media storage as one of ``post``'s Media."""
+    path = partial_path(session)
+    media = Media(post=post, media_type=session.media_type)
+    with open(path, "rb") as fh:
+        media.file.save(session.filename, File(fh), save=False)
+    media.save()
+    discard(session)
+    return media
+
+
+def discard(session):
+    path = partial_path(session)
+    session.delete()
+    transaction.on_commit(lambda: _remove(path))
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
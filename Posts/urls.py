@@ -1,10 +1,11 @@
 from rest_framework.routers import DefaultRouter
 from rest_framework_nested import routers
 from django.urls import include, path
-from .views import PostViewSet
+from .views import PostViewSet, UploadSessionViewSet
 
 router = DefaultRouter()
 router.register("posts", PostViewSet, basename="post")
+router.register("uploads", UploadSessionViewSet, basename="upload")
 
 urlpatterns = [
     path("", include(router.urls)),
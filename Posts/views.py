@@ -1,18 +1,32 @@
-from rest_framework import viewsets, permissions, filters, status
+import re
+
+from rest_framework import viewsets, permissions, filters, status, mixins
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 
 from django_filters.rest_framework import DjangoFilterBackend
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.db import IntegrityError, transaction
-from django.db.models import Q
+from rest_framework.pagination import PageNumberPagination
 from Notifications.serializers import NotificationsSerializer
-from events.utils import send_real_time
-
-from .models import Post, Like
+from events.utils import post_topic, send_real_time_batch, timeline_topic, user_group
+from core import conditional
+from Profile import graph
+
+from . import counters, fragments, likebuffer, likes, timeline, uploads
+from .models import Post, Like, UploadSession
+from .pagination import KeysetPagination, LikedPostsPagination
+from .replies import ReplyTree
+from .search import FullTextSearchFilter, ranked_search
+from .visibility import can_view, visible_posts
 from Notifications.models import Notifications
-from .serializers import PostDetailSerializer, PostSerializer
+from .serializers import (
+    PostDetailSerializer, PostSearchSerializer, PostSerializer, UploadSessionSerializer,
+    resolve_like_buffer, resolve_posts,
+)
 
 def get_visible_user_ids(post):
     author_profile = post.author.profile
@@ -20,115 +34,129 @@ def get_visible_user_ids(post):
     if not author_profile.is_private:
         return None 
 
-    friend_ids = list(author_profile.friends.values_list("user__id", flat=True))
-    friend_ids.append(post.author.id)
-    return friend_ids
+    return [*graph.friend_ids(post.author_id), post.author_id]
 
-def broadcast_post_create(post, request):
-    """Send a post_create event to appropriate users (filtered by privacy)."""
+def post_create_events(post, request):
+    """
+    The post_create event for whoever may see ``post``: the author's
+    timeline topic for a public author, each friend's own group for a
+    private one.
+    """
     data = PostSerializer(post, context={"request": request}).data
     data["action"] = "post_create"
 
     visible_ids = get_visible_user_ids(post)
 
     if visible_ids is None:
-        send_real_time("post_create", "events_broadcast", data)
-    else:
-        for uid in visible_ids:
-            send_real_time("post_create", f"user_{uid}", data)
+        return [("post_create", timeline_topic(post.author_id), data)]
+    return [("post_create", [user_group(uid) for uid in visible_ids], data)]
 
-def broadcast_call(post, request):
+def post_state_events(post, request):
+    post.refresh_from_db(fields=counters.COUNTER_FIELDS)
     serializer  = PostSerializer(post, context={"request": request})
-    data =serializer.data
-    
-    send_real_time(
-      event_type="post_update",
-      recipient_group="events_broadcast",
-      data={
-        "id":             data["id"],
-        "likes_count":    data["likes_count"],
-        "comments_count": data.get("comments_count", 0),
-        "reposts_count":  data.get("reposts_count", 0),
-      }
-    )
-    send_real_time(
-      event_type="post_user_update",
-      recipient_group=f"user_{request.user.id}",
-      data={
-        "id":               post.id,
+    return post_update_events(serializer.data, request)
+
+def post_update_events(data, request, counts=True):
+    """
+    A post's counters for everyone and the requester's own state for them,
+    as (event_type, group, data) triples for ``send_real_time_batch``.  The
+    relay coalesces the counters per post (events/coalesce.py).
+    ``counts=False`` skips them, for buffered likes whose flush publishes
+    them once for the whole batch.
+    """
+    events = []
+    if counts:
+        events.append(("post_update", post_topic(data["id"]), {
+          "id":             data["id"],
+          "likes_count":    data["likes_count"],
+          "comments_count": data.get("comments_count", 0),
+          "reposts_count":  data.get("reposts_count", 0),
+        }))
+    events.append(("post_user_update", f"user_{request.user.id}", {
+        "id":               data["id"],
         "liked_by_user":    data["liked_by_user"],
         "reposted_by_user": data["reposted_by_user"],
-      }
-    )
+    }))
+    return events
+
+def post_validators(request, posts, context):
+    """
+    ETag and Last-Modified for ``posts`` as the requesting user sees them,
+    from the posts' and their authors' change stamps.  Every counter change
+    touches ``Post.updated_at``, and so do the viewer's own likes and reposts.
+
+    Likes still in the write-behind buffer (Posts/likebuffer.py) only move
+    ``updated_at`` when they are flushed, so their pending state goes into
+    the ETag as well, and Last-Modified is left out while there is any.
+    The lookup is kept in ``context`` for the serializer.
+    """
+    stamps = [(post.id, post.updated_at, post.author.profile.updated_at) for post in posts]
+    pending = resolve_like_buffer(context, posts)["pending"]
+    buffered = sorted((post.id, pending[post.id]) for post in posts if post.id in pending)
+    last_modified = None
+    if not buffered:
+        last_modified = max((max(post_stamp, author_stamp) for _, post_stamp, author_stamp in stamps), default=None)
+    etag = conditional.make_etag(request.user.id, request.get_full_path(), stamps, buffered)
+    return etag, last_modified
 
 class LikeActionMixin:
     @action(detail=True, methods=["post", "delete"], url_path="like")
     def like(self, request, pk=None):
-        post = self.get_object()
-        user = request.user
-
-        # 1) Like or Unlike logic
-        if request.method == "POST":
-            try:
-                with transaction.atomic():
-                    like, created = Like.objects.get_or_create(post=post, user=user)
-            except IntegrityError:
-                like = Like.objects.get(post=post, user=user)
-        else:
-            Like.objects.filter(post=post, user=user).delete()
-
-        # ✅ 2) Skip notification logic entirely if self-like
-        if post.author != user:
-            notif_type = (
-                Notifications.COMMENT_LIKE if post.type == Post.REPLY else Notifications.POST_LIKE
-            )
-            notif, _ = Notifications.objects.get_or_create(
-                to_user=post.author,
-                actor=user,
-                notification_type=notif_type,
-                target_content_type=ContentType.objects.get_for_model(Post),
-                target_object_id=post.id,
-                defaults={"active": True},
-            )
-
-            notif_should_be_active = Like.objects.filter(post=post, user=user).exists()
-            if notif.active != notif_should_be_active:
-                notif.active = notif_should_be_active
-                notif.save(update_fields=["active"])
-                if not notif.active:
-                    send_real_time(
-                        event_type="notification_delete",
-                        recipient_group=f"user_{notif.to_user.id}",
-                        data={"id": notif.id}
-                    )
-
-            if notif.active:
-                try:
-                    payload = NotificationsSerializer(notif, context={"request": request}).data
-                    send_real_time(
-                        event_type="notification_message",
-                        recipient_group=f"user_{post.author.id}",
-                        data=payload,
-                    )
-                except Exception:
-                    pass
-
-        # 3) Always broadcast post updates
-        broadcast_call(post, request)
-
-        return Response(
-            PostSerializer(post, context={"request": request}).data,
-            status=status.HTTP_200_OK
+        # One read for the post and its visibility, one statement for the
+        # like, counter and notification; payloads come from what it returned.
+        # Posts liked faster than LIKE_BUFFER_HOT_THRESHOLD a second go
+        # through the write-behind buffer instead.
+        post = (
+            Post.objects.select_related("author__profile", "parent__author__profile")
+            .filter(pk=pk).first()
         )
+        if post is None or not can_view(request.user, post):
+            raise NotFound()
+
+        liked = request.method == "POST"
+        buffered = likebuffer.is_hot(post.id)
+        # The realtime events are written to the outbox in the like's own
+        # transaction.
+        with transaction.atomic():
+            if buffered:
+                outcome = likebuffer.toggle(post, request.user, liked=liked)
+            else:
+                outcome = likes.toggle(post, request.user, liked=liked)
+
+            context = self.get_serializer_context()
+            context["viewer_state"] = {
+                "resolved": {post.id},
+                "liked":    {post.id} if outcome["liked"] else set(),
+                "reposted": {post.id} if outcome["reposted"] else set(),
+            }
+            context["like_buffer"] = {
+                "resolved": {post.id},
+                "pending":  {post.id: (outcome["pending"], outcome["liked"])} if buffered else {},
+            }
+            data = PostSerializer(post, context=context).data
+
+            notif = outcome["notification"]
+            events = []
+            if notif is not None and not notif.active:
+                events.append(("notification_delete", f"user_{notif.to_user_id}", {"id": notif.id}))
+            elif notif is not None:
+                payload = NotificationsSerializer(
+                    notif, context={"request": request, "parent_post_id": post.parent_id or post.id}
+                ).data
+                events.append(("notification_message", f"user_{notif.to_user_id}", payload))
+
+            send_real_time_batch([*events, *post_update_events(data, request, counts=not buffered)])
+        return Response(data, status=status.HTTP_200_OK)
 
     
 class PostViewSet(LikeActionMixin, viewsets.ModelViewSet):
     queryset = Post.objects.all().select_related('author', 'author__profile')
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend]
+    filter_backends = [FullTextSearchFilter, filters.OrderingFilter, DjangoFilterBackend]
     filterset_fields=['type', 'parent', 'author', 'author__username']
     ordering_fields = ['created_at']
     search_fields = ['description', 'author__username']
+    pagination_class = KeysetPagination
 
     def get_serializer_class(self):
         if self.action == "retrieve":
@@ -138,112 +166,197 @@ class PostViewSet(LikeActionMixin, viewsets.ModelViewSet):
     
     
     def get_queryset(self):
-        user = self.request.user
-        profile = user.profile
+        final_qs = visible_posts(self.request.user)
+        return final_qs.select_related("author", "author__profile").distinct().order_by("-created_at")
 
-        friend_ids = profile.friends.values_list("user__id", flat=True)
-        visible_authors = list(friend_ids) + [user.id]
+    def list(self, request, *args, **kwargs):
+        # The plain home feed is served from the materialized timeline;
+        # searches, filters and profile pages still go through the queryset.
+        if set(request.query_params) <= {self.paginator.cursor_query_param}:
+            posts = self.timeline_page(request)
+        else:
+            posts = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+
+        context = self.get_serializer_context()
+        etag, last_modified = post_validators(request, posts, context)
+        unchanged = conditional.not_modified(request, etag, last_modified)
+        if unchanged is not None:
+            return unchanged
+
+        serializer = self.get_serializer(posts, many=True, context=context)
+        response = self.get_paginated_response(serializer.data)
+        return conditional.set_validators(response, etag, last_modified)
+
+    def timeline_page(self, request):
+        # Timeline cursors use the same (created_at, id) position as the
+        # queryset pages, so they're interchangeable.
+        paginator = self.paginator
+        paginator.request = request
+        position = paginator.decode_cursor(request, Post, paginator.ordering)
+        before = (timeline.score_for(position[0]), position[1]) if position else None
+
+        limit = paginator.page_size
+        entries = timeline.read_timeline(request.user, before=before, limit=limit + 1)
+        page = entries[:limit]
+        posts = timeline.hydrate([post_id for post_id, _ in page])
+        last = (timeline.created_at_for(page[-1][1]), page[-1][0]) if page else position
+
+        if len(entries) > limit:
+            paginator.set_next(last)
+            return posts
+
+        # Redis only keeps the newest TIMELINE_MAX_LENGTH entries per key;
+        # once they run out, or reach the floor of a trimmed key, the page
+        # carries on from the database.
+        older = self.get_queryset().order_by(*paginator.ordering)
+        if last is not None:
+            older = older.filter(paginator.keyset_filter(paginator.ordering, last))
+        need = limit - len(page)
+        rows = list(older[:need + 1])
+        posts += rows[:need]
+        if len(rows) > need:
+            paginator.set_next(paginator.position_for(rows[need - 1], paginator.ordering) if need else last)
+        else:
+            paginator.set_next(None)
+        return posts
+    
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            instance = serializer.save(author=self.request.user)
+            counters.bump_parent(instance, 1)
+            send_real_time_batch(post_create_events(instance, self.request))
+        timeline.push_post(instance)
 
-        base_qs = Post.objects.filter(
-            Q(author__id__in=visible_authors) |
-            Q(author__profile__is_private=False)
-        )
-        
-        parent_ids = base_qs.exclude(parent=None).values_list("parent", flat=True)
-        parents = Post.objects.filter(id__in=parent_ids)
+    def perform_update(self, serializer):
+        instance = serializer.save()
+        fragments.invalidate_on_commit([instance.id])
 
-        replies_to_visible = Post.objects.filter(
-            type=Post.REPLY,
-            parent__in=base_qs.values("id")
+    def retrieve(self, request, *args, **kwargs):
+        post = self.get_object()
+        context = self.get_serializer_context()
+        context["reply_tree"] = tree = ReplyTree(
+            post,
+            max_depth=self._bounded_param("depth", settings.REPLY_TREE_MAX_DEPTH),
+            per_level=self._bounded_param("limit", settings.REPLY_TREE_PAGE_SIZE),
         )
 
-        final_qs = base_qs | parents | replies_to_visible
+        etag, last_modified = post_validators(request, [post, *tree.posts()], context)
+        unchanged = conditional.not_modified(request, etag, last_modified)
+        if unchanged is not None:
+            return unchanged
 
-        return final_qs.select_related("author", "author__profile").distinct().order_by("-created_at")
+        resolve_posts(context, [post, *tree.posts()])
+        response = Response(PostDetailSerializer(post, context=context).data)
+        return conditional.set_validators(response, etag, last_modified)
 
-    
-    def perform_create(self, serializer):
-        instance = serializer.save(author=self.request.user)
-        broadcast_post_create(instance, self.request)
+    @action(detail=True, methods=['get'], url_path='replies')
+    def replies(self, request, pk=None):
+        """One more page of replies under a post, each with its own bounded subtree."""
+        post = self.get_object()
+        after = self.paginator.decode_cursor(request, Post, self.paginator.ordering)
+        context = self.get_serializer_context()
+        context["reply_tree"] = tree = ReplyTree(
+            post,
+            max_depth=self._bounded_param("depth", settings.REPLY_TREE_MAX_DEPTH),
+            per_level=self._bounded_param("limit", settings.REPLY_TREE_PAGE_SIZE),
+            after=after,
+        )
+        resolve_posts(context, tree.posts())
+        replies = tree.children.get(post.id, [])
+        return Response({
+            "next": tree.more_link(post, request),
+            "results": PostDetailSerializer(replies, many=True, context=context).data,
+        })
+
+    def _bounded_param(self, name, maximum):
+        try:
+            value = int(self.request.query_params.get(name, maximum))
+        except ValueError:
+            return maximum
+        return min(max(value, 1), maximum)
 
-        
     @action(detail=False, methods=['get'], url_path='liked')
     def liked(self, request):
-        likes_qs = Like.objects.filter(user=request.user).order_by('-liked_at')
-        post_ids = likes_qs.values_list('post_id', flat=True)
-        qs = Post.objects.filter(pk__in=post_ids) \
-                         .select_related('author', 'author__profile') \
-                         .distinct()
-        page = self.paginate_queryset(qs)
-        serializer = PostSerializer(page or qs, many=True, context={"request": request})
-        return self.get_paginated_response(serializer.data)
+        # Walks like_user_liked_at_id_idx and joins the posts of one page only.
+        likes = Like.objects.filter(user=request.user) \
+                            .select_related('post', 'post__author', 'post__author__profile')
+        paginator = LikedPostsPagination()
+        posts = [like.post for like in paginator.paginate_queryset(likes, request, view=self)]
+        serializer = PostSerializer(posts, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        terms = request.query_params.get('q', '').strip()
+        if not terms:
+            return Response({"q": "This query parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        qs = self.filter_queryset(visible_posts(request.user))
+        qs = ranked_search(qs, terms).select_related('author', 'author__profile')
+
+        paginator = PageNumberPagination()
+        page = paginator.paginate_queryset(qs, request, view=self)
+        serializer = PostSearchSerializer(page, many=True, context={"request": request})
+        return paginator.get_paginated_response(serializer.data)
         
     @action(detail=True, methods=['post'], url_path='repost')
     def repost(self, request, pk=None):
         post = self.get_object()
         user = request.user
 
-        try:
-            with transaction.atomic():
-                repost_obj, created = Post.objects.get_or_create(
-                    author=user,
-                    parent=post,
-                    type=Post.REPOST,
-                    defaults={"description": ""},
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    repost_obj, created = Post.objects.get_or_create(
+                        author=user,
+                        parent=post,
+                        type=Post.REPOST,
+                        defaults={"description": ""},
+                    )
+                    if created:
+                        counters.bump_parent(repost_obj, 1)
+            except IntegrityError:
+                repost_obj = Post.objects.get(author=user, parent=post, type=Post.REPOST)
+                created = False
+
+            events = []
+            if post.author != user:
+                notif_type = Notifications.POST_REPOST
+                notif, _ = Notifications.objects.get_or_create(
+                    to_user=post.author,
+                    actor=user,
+                    notification_type=notif_type,
+                    target_content_type=ContentType.objects.get_for_model(Post),
+                    target_object_id=post.id,
+                    defaults={"active": True},
                 )
-        except IntegrityError:
-            repost_obj = Post.objects.get(author=user, parent=post, type=Post.REPOST)
-            created = False
-
-        if post.author != user:
-            notif_type = Notifications.POST_REPOST
-            notif, _ = Notifications.objects.get_or_create(
-                to_user=post.author,
-                actor=user,
-                notification_type=notif_type,
-                target_content_type=ContentType.objects.get_for_model(Post),
-                target_object_id=post.id,
-                defaults={"active": True},
-            )
 
-            if created:
-                if not notif.active:
-                    notif.active = True
-                    notif.save(update_fields=["active"])
-                try:
+                if created:
+                    if not notif.active:
+                        notif.active = True
+                        notif.save(update_fields=["active"])
                     payload = NotificationsSerializer(notif, context={"request": request}).data
-                    send_real_time(
-                        event_type="notification_message",
-                        recipient_group=f"user_{post.author.id}",
-                        data=payload,
-                    )
-                except Exception:
-                    pass
-            else:
-                if notif.active:
+                    events.append(("notification_message", f"user_{post.author.id}", payload))
+                elif notif.active:
                     notif.active = False
                     notif.save(update_fields=["active"])
-                    send_real_time(
-                                        event_type="notification_delete",
-                                        recipient_group=f"user_{notif.to_user.id}",
-                                        data={"id": notif.id}
-                                    )
+                    events.append(("notification_delete", f"user_{notif.to_user.id}", {"id": notif.id}))
+
+            if created:
+                events += post_create_events(repost_obj, request)
+            else:
+                repost_id = repost_obj.id
+                timeline.remove_post(repost_obj)
+                repost_obj.delete()
+                counters.bump_parent(repost_obj, -1)
+                events.append(("post_delete", post_topic(repost_id), {"id": repost_id}))
+            events += post_state_events(post, request)
+            send_real_time_batch(events)
 
         if created:
-            broadcast_post_create(repost_obj, request)
-            broadcast_call(post, request)
+            timeline.push_post(repost_obj)
             return Response(PostSerializer(repost_obj, context={"request": request}).data, status=status.HTTP_201_CREATED)
-        else:
-            repost_id = repost_obj.id
-            repost_obj.delete()
-
-            send_real_time(
-                event_type="post_delete",
-                recipient_group="events_broadcast",
-                data={"id": repost_id}
-            )
-            broadcast_call(post, request)
-            return Response(status=status.HTTP_200_OK)
+        return Response(status=status.HTTP_200_OK)
 
     
     @action(detail=True, methods=['post'], url_path='quote', parser_classes=[MultiPartParser, FormParser])
@@ -251,13 +364,18 @@ class PostViewSet(LikeActionMixin, viewsets.ModelViewSet):
         parent = self.get_object()
         serializer = PostSerializer(data=request.data, context={"request": request})
         serializer.is_valid(raise_exception=True)
-        quote_post = serializer.save(
-            author=request.user,
-            parent=parent,
-            type=Post.QUOTE,
-        )
-        broadcast_post_create(quote_post, request)
-        broadcast_call(parent, request)
+        with transaction.atomic():
+            quote_post = serializer.save(
+                author=request.user,
+                parent=parent,
+                type=Post.QUOTE,
+            )
+            counters.bump_parent(quote_post, 1)
+            send_real_time_batch([
+                *post_create_events(quote_post, request),
+                *post_state_events(parent, request),
+            ])
+        timeline.push_post(quote_post)
         data = PostSerializer(quote_post, context={"request": request}).data
         return Response(data, status=status.HTTP_201_CREATED)
 
@@ -267,32 +385,127 @@ class PostViewSet(LikeActionMixin, viewsets.ModelViewSet):
         parent = self.get_object()
         print(f"[BACKEND] Creating reply. Parent id: {parent.id}, type: {parent.type}")
         content = request.data.get('content', '').strip()
-        reply_post = Post.objects.create(
-            author=request.user,
-            parent=parent,
-            type=Post.REPLY,
-            description=content
-        )
-        data = PostSerializer(reply_post, context={"request": request}).data
-        send_real_time(
-            event_type="post_create",
-            recipient_group="events_broadcast",
-            data=data
-        )
-        broadcast_call(parent, request)
+        with transaction.atomic():
+            reply_post = Post.objects.create(
+                author=request.user,
+                parent=parent,
+                type=Post.REPLY,
+                description=content
+            )
+            counters.bump_parent(reply_post, 1)
+            data = PostSerializer(reply_post, context={"request": request}).data
+            send_real_time_batch([
+                ("post_create", post_topic(parent.id), data),
+                *post_state_events(parent, request),
+            ])
+        timeline.push_post(reply_post)
         return Response(data, status=status.HTTP_201_CREATED)
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
         post_id = instance.id
         parent = instance.parent
-        self.perform_destroy(instance)
-        send_real_time(
-            event_type="post_delete",
-            recipient_group="events_broadcast",
-            data={"id": post_id}
-        )
-        if parent is not None:
-            broadcast_call(parent, request)
+        timeline.remove_post(instance)
+        with transaction.atomic():
+            self.perform_destroy(instance)
+            counters.bump_parent(instance, -1)
+            events = [("post_delete", post_topic(post_id), {"id": post_id})]
+            if parent is not None:
+                events += post_state_events(parent, request)
+            send_real_time_batch(events)
+            fragments.invalidate_on_commit([post_id])
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+|\*)$")
+
+
+class UploadSessionViewSet(
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet
+):
+    """
+    Resumable uploads: POST to open a session, PUT the bytes in order with
+    ``Content-Range: bytes <start>-<end>/<size>`` (or ``?offset=``), GET the
+    session to learn where to resume, then POST ``finalize/``.  Pass the
+    session ids as ``upload_ids`` when creating the post.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = UploadSession.objects.filter(user=self.request.user)
+        if self.action in ("update", "partial_update"):
+            queryset = queryset.select_for_update()
+        return queryset
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def update(self, request, *args, **kwargs):
+        # The session row stays locked until the chunk is on disk, so two
+        # PUTs for the same range can't both pass the offset check and
+        # write over each other.
+        with transaction.atomic():
+            session = self.get_object()
+            try:
+                return self.append_chunk(request, session)
+            except ValidationError as exc:
+                # Keep what append() reset after a rejected file type.
+                rejected = exc
+        raise rejected
+
+    def append_chunk(self, request, session):
+        if session.status != UploadSession.UPLOADING:
+            return Response({"error": "Upload is already finalized"}, status=status.HTTP_409_CONFLICT)
+
+        try:
+            offset, length = self.chunk_range(request, session)
+        except ValueError:
+            return Response({"error": "Invalid Content-Range"}, status=status.HTTP_400_BAD_REQUEST)
+        if length > settings.UPLOAD_CHUNK_MAX_BYTES:
+            return Response({"error": "Chunk is too large"}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        if offset != session.received:
+            return Response(
+                {"error": "Chunk does not start where the upload left off", "received": session.received},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        # request.data is never touched, so the body goes to disk as it is read.
+        uploads.append(session, request.stream, offset, length)
+        return Response(self.get_serializer(session).data)
+
+    def chunk_range(self, request, session):
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+        header = request.headers.get("Content-Range")
+        if header:
+            match = CONTENT_RANGE_RE.match(header)
+            if not match:
+                raise ValueError(header)
+            start, end, total = match.groups()
+            if total != "*" and int(total) != session.size:
+                raise ValueError(header)
+            offset, length = int(start), int(end) - int(start) + 1
+        else:
+            offset = int(request.query_params.get("offset", session.received))
+        if length <= 0 or offset < 0 or request.stream is None:
+            raise ValueError(length)
+        return offset, length
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        session = self.get_object()
+        if session.received != session.size:
+            return Response(
+                {"error": "Upload is incomplete", "received": session.received},
+                status=status.HTTP_409_CONFLICT,
+            )
+        session.status = UploadSession.COMPLETE
+        session.save(update_fields=["status", "updated_at"])
+        return Response(self.get_serializer(session).data)
 
-        return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+    def perform_destroy(self, instance):
+        uploads.discard(instance)
@@ -0,0 +1,48 @@
+from django.db.models import Q
+
+from Profile import graph
+from .models import Post
+
+
+def visible_posts(user):
+    """
+    Posts ``user`` may see: everything by themselves, their friends and
+    public authors, the posts those point at, and replies to any of them.
+    """
+    visible_authors = [*graph.friend_ids(user.id), user.id]
+
+    base_qs = Post.objects.filter(
+        Q(author__id__in=visible_authors) |
+        Q(author__profile__is_private=False)
+    )
+
+    parent_ids = base_qs.exclude(parent=None).values_list("parent", flat=True)
+    parents = Post.objects.filter(id__in=parent_ids)
+
+    replies_to_visible = Post.objects.filter(
+        type=Post.REPLY,
+        parent__in=base_qs.values("id")
+    )
+
+    return base_qs | parents | replies_to_visible
+
+
+def can_view(user, post):
+    """
+    Whether ``user`` may see ``post``, the single-post counterpart of
+    ``visible_posts``.  Expects ``post`` loaded with its author's profile
+    and its parent's; the common cases never touch the database.
+    """
+    def author_visible(author):
+        return (
+            not author.profile.is_private
+            or author.id == user.id
+            or graph.are_friends(author.id, user.id)
+        )
+
+    if author_visible(post.author):
+        return True
+    if post.type == Post.REPLY and post.parent_id and author_visible(post.parent.author):
+        return True
+    # Posts that a visible post points at are visible too.
+    return visible_posts(user).filter(pk=post.pk).exists()
@@ -0,0 +1,125 @@
+"""
+Cached friend and block sets per user.
+
+Each set lives in Redis (``graph:friends:<id>``, ``graph:blocks:<id>``)
+behind a short-lived in-process LRU.  A set is loaded from the database the
+first time it's needed and then kept current incrementally by the m2m
+signals on ``Profile.friends`` and ``Profile.blocked_users``.
+"""
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from core.lru import LRUCache
+from .models import Profile
+
+FRIENDS = "friends"
+BLOCKS = "blocks"
+
+# Redis can't hold an empty set, so every loaded set carries this member.
+LOADED_MARKER = "-"
+
+# Only edit sets that are already loaded; cold ones reload from the database.
+_UPDATE_SCRIPT = """
+local op = ARGV[1]
+for i, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        redis.call(op, key, ARGV[i + 1])
+    end
+end
+return 0
+"""
+
+_local = LRUCache(maxsize=settings.GRAPH_LOCAL_CACHE_SIZE, ttl=settings.GRAPH_LOCAL_CACHE_TTL)
+
+
+def _key(kind, user_id):
+    return f"graph:{kind}:{user_id}"
+
+
+def _redis():
+    return get_redis_connection("default")
+
+
+def _from_db(kind, user_id):
+    if kind == FRIENDS:
+        rows = Profile.objects.filter(user_id=user_id).values_list("friends__user_id", flat=True)
+    else:
+        rows = Profile.objects.filter(user_id=user_id).values_list("blocked_users__id", flat=True)
+    return frozenset(uid for uid in rows if uid is not None)
+
+
+def _members(kind, user_id):
+    cached = _local.get((kind, user_id))
+    if cached is not None:
+        return cached
+
+    conn = _redis()
+    key = _key(kind, user_id)
+    raw = conn.smembers(key)
+    if raw:
+        members = frozenset(int(m) for m in raw if m != LOADED_MARKER.encode())
+    else:
+        members = _from_db(kind, user_id)
+        with conn.pipeline() as pipe:
+            pipe.sadd(key, LOADED_MARKER, *members)
+            pipe.expire(key, settings.GRAPH_TTL)
+            pipe.execute()
+
+    _local.set((kind, user_id), members)
+    return members
+
+
+def friend_ids(user_id):
+    return _members(FRIENDS, user_id)
+
+
+def blocked_ids(user_id):
+    """Users that ``user_id`` has blocked."""
+    return _members(BLOCKS, user_id)
+
+
+def are_friends(user_id, other_id):
+    return other_id in friend_ids(user_id)
+
+
+def is_blocked(user_id, other_id):
+    """True if either user has blocked the other."""
+    return other_id in blocked_ids(user_id) or user_id in blocked_ids(other_id)
+
+
+def _update(op, pairs):
+    """Apply SADD/SREM for ``(kind, owner_id, member_id)`` triples to loaded sets."""
+    pairs = list(pairs)
+    if not pairs:
+        return
+    keys = [_key(kind, owner) for kind, owner, _ in pairs]
+    _redis().register_script(_UPDATE_SCRIPT)(keys=keys, args=[op, *(member for _, _, member in pairs)])
+    for kind, owner, _ in pairs:
+        _local.pop((kind, owner))
+
+
+def add_friends(user_id, other_ids):
+    _update("SADD", [pair for other in other_ids
+                     for pair in ((FRIENDS, user_id, other), (FRIENDS, other, user_id))])
+
+
+def remove_friends(user_id, other_ids):
+    _update("SREM", [pair for other in other_ids
+                     for pair in ((FRIENDS, user_id, other), (FRIENDS, other, user_id))])
+
+
+def add_blocks(user_id, blocked):
+    _update("SADD", [(BLOCKS, user_id, other) for other in blocked])
+
+
+def remove_blocks(user_id, blocked):
+    _update("SREM", [(BLOCKS, user_id, other) for other in blocked])
+
+
+def forget(kind, user_ids):
+    """Drop cached sets so they reload from the database on next use."""
+    user_ids = set(user_ids)
+    if user_ids:
+        _redis().delete(*(_key(kind, uid) for uid in user_ids))
+    for uid in user_ids:
+        _local.pop((kind, uid))
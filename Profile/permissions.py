@@ -1,23 +1,17 @@
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 
+from . import graph
+
 class IsOwnerOrReadOnly(BasePermission):
 
     def has_object_permission(self, request, view, obj):
         user = request.user
-        
-        if user in obj.blocked_users.all():
-            return False
-
-        try:
-            your_profile = user.profile
-        except AttributeError:
-            your_profile = None
 
-        if your_profile and obj.user in your_profile.blocked_users.all():
+        if user.is_authenticated and graph.is_blocked(obj.user_id, user.id):
             return False
 
         if request.method in SAFE_METHODS:
-            if getattr(obj, 'is_private', False) and obj.user != user:
+            if getattr(obj, 'is_private', False) and obj.user_id != user.id:
                 return False
             return True
-        return obj.user == user
+        return obj.user_id == user.id
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from .models import Profile
-from Friendship.models import FriendRequest
+from Posts import fragments, timeline
+from . import graph
 
 class ProfileSerializer(serializers.ModelSerializer):
     name = serializers.CharField(required=False, allow_blank=True)
@@ -47,7 +48,7 @@ class ProfileSerializer(serializers.ModelSerializer):
         return image
         
     def get_friends_count(self, obj):
-        return obj.friends.count()
+        return len(graph.friend_ids(obj.user_id))
     
     def to_representation(self, instance):
         data = super().to_representation(instance)
@@ -62,14 +63,19 @@ class ProfileSerializer(serializers.ModelSerializer):
     
     def update(self, instance, validated_data):
         name = validated_data.pop('name', None)
+        was_private = instance.is_private
         
         profile = super().update(instance, validated_data)
+        if profile.is_private != was_private:
+            timeline.invalidate_author(instance.user)
         
         if name is not None:
             parts = name.strip().split(None, 1)
             instance.user.first_name = parts[0]
             instance.user.last_name  = parts[1] if len(parts) > 1 else ''
             instance.user.save()
+        if name is not None or 'profile_image' in validated_data:
+            fragments.invalidate_author(instance.user_id)
         return profile
     
     def get_are_friends(self, obj):
@@ -77,10 +83,4 @@ class ProfileSerializer(serializers.ModelSerializer):
         if not request or not request.user.is_authenticated:
             return False
 
-        user = request.user
-        return FriendRequest.objects.filter(
-            active=False,
-            status=FriendRequest.STATUS_ACCEPTED,
-            from_user__in=[user, obj.user],
-            to_user__in=[user, obj.user]
-        ).exists()
\ No newline at end of file
+        return graph.are_friends(request.user.id, obj.user_id)
\ No newline at end of file
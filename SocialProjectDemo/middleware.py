@@ -1,34 +1,90 @@
-import jwt
+"""
+WebSocket authentication from the ``access_token`` cookie.
+
+A reconnect storm replays the same handshakes over and over, so both
+halves of the work are cached: a validated token maps to its user id in
+an in-process LRU (until the token's own expiry at the latest), and the
+user is read from the Redis cache, together with the database on a miss,
+in one thread hop.
+
+The user object deliberately has no in-process tier. ``forget_user`` runs
+in whichever process saved the user, so a copy held by another Daphne
+process would keep a deactivated account connecting until it expired;
+the Redis entry is shared, and dropping it after a password change,
+deactivation or deletion takes effect everywhere at once. The token LRU
+only remembers that a signature was valid, which the account change does
+not affect, and the user is still loaded after it.
+"""
+import time
+
 from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
 from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
-from django.contrib.auth.models import AnonymousUser
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from core.lru import LRUCache
+
+COOKIE_NAME = b"access_token="
+
+_authenticator = JWTAuthentication()
+_tokens = LRUCache(maxsize=settings.WS_AUTH_LOCAL_CACHE_SIZE, ttl=settings.WS_AUTH_LOCAL_CACHE_TTL)
+
+
+def user_cache_key(user_id):
+    return f"ws:user:{user_id}"
+
+
+def forget_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
 
 @database_sync_to_async
-def get_user(validated_token):
-    user = JWTAuthentication().get_user(validated_token)
-    return user or AnonymousUser()
+def load_user(user_id):
+    key = user_cache_key(user_id)
+    user = cache.get(key)
+    if user is None:
+        user = User.objects.filter(pk=user_id, is_active=True).first()
+        if user is not None:
+            cache.set(key, user, settings.WS_AUTH_CACHE_TTL)
+    return user
+
+
+def cookie_token(headers):
+    """The ``access_token`` cookie from raw ASGI headers, without parsing the rest."""
+    for name, value in headers:
+        if name != b"cookie":
+            continue
+        start = value.find(COOKIE_NAME)
+        while start != -1:
+            if start == 0 or value[start - 1] in b"; ":
+                start += len(COOKIE_NAME)
+                end = value.find(b";", start)
+                token = value[start:end] if end != -1 else value[start:]
+                return token.strip().decode("latin-1") or None
+            start = value.find(COOKIE_NAME, start + 1)
+    return None
+
+
+async def authenticate(raw_token):
+    claims = _tokens.get(raw_token)
+    if claims is None or claims[1] <= time.time():
+        try:
+            token = _authenticator.get_validated_token(raw_token)
+        except (InvalidToken, TokenError):
+            return AnonymousUser()
+        claims = (token[api_settings.USER_ID_CLAIM], token["exp"])
+        _tokens.set(raw_token, claims)
+
+    user = await load_user(claims[0])
+    return user if user is not None else AnonymousUser()
+
 
 class JwtCookieMiddleware(BaseMiddleware):
     async def __call__(self, scope, receive, send):
-        headers = dict(scope["headers"])
-        cookie_header = headers.get(b"cookie", b"").decode()
-        access_token = None
-        for part in cookie_header.split(";"):
-            name, *val = part.strip().split("=")
-            if name == "access_token" and val:
-                access_token = val[0]
-                break
-
-        if access_token:
-            try:
-                validated_token = JWTAuthentication().get_validated_token(access_token)
-                scope["user"] = await get_user(validated_token)
-            except (InvalidToken, TokenError):
-                scope["user"] = AnonymousUser()
-        else:
-            scope["user"] = AnonymousUser()
-
+        raw_token = cookie_token(scope["headers"])
+        scope["user"] = await authenticate(raw_token) if raw_token else AnonymousUser()
         return await super().__call__(scope, receive, send)
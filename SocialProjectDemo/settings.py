@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "django_filters",
     "rest_framework",
     'rest_framework_simplejwt',
@@ -53,7 +54,9 @@ INSTALLED_APPS = [
     "Friendship",
     "Notifications.apps.NotificationsConfig",
     "accounts.apps.AccountsConfig",
-    "channels"
+    "channels",
+    "core.apps.CoreConfig",
+    "events",
 ]
 
 MIDDLEWARE = [
@@ -145,6 +148,12 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+STORAGES = {
+    # Deduplicated, content-addressed files: URLs never change content.
+    "default": {"BACKEND": "core.storage.ContentAddressedStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
 
 CORS_ALLOW_CREDENTIALS = True
 CORS_ALLOWED_ORIGINS = [
@@ -235,3 +244,85 @@ LOGGING = {
 # SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 # SECURE_SSL_REDIRECT = not DEBUG
 # APPEND_SLASH = False
+
+# Home timelines (Posts/timeline.py)
+TIMELINE_MAX_LENGTH = 800
+TIMELINE_FANOUT_MAX_FRIENDS = 1000
+TIMELINE_TTL = 7 * 24 * 60 * 60
+
+# Reply trees on the post detail endpoint (Posts/replies.py)
+REPLY_TREE_MAX_DEPTH = 3
+REPLY_TREE_PAGE_SIZE = 5
+
+# Cached viewer-independent post payloads (Posts/fragments.py)
+POST_FRAGMENT_TTL = 10 * 60
+
+# Cached friend/block sets (Profile/graph.py)
+GRAPH_TTL = 24 * 60 * 60
+GRAPH_LOCAL_CACHE_SIZE = 10000
+GRAPH_LOCAL_CACHE_TTL = 5
+
+# Post media processing (Posts/media.py)
+MEDIA_VARIANT_WIDTHS = {"small": 320, "medium": 720, "large": 1280}
+MEDIA_VARIANT_QUALITY = 80
+MEDIA_POSTER_AT = 1.0
+MEDIA_PROCESSING_TIMEOUT = 10 * 60
+MEDIA_PROCESSING_POLL_INTERVAL = 2
+
+# Resumable chunked uploads (Posts/uploads.py)
+UPLOAD_SESSION_DIR = BASE_DIR / "upload_sessions"
+UPLOAD_MAX_BYTES = {"photo": 20 * 1024 * 1024, "video": 256 * 1024 * 1024}
+UPLOAD_CHUNK_MAX_BYTES = 16 * 1024 * 1024
+UPLOAD_SESSION_TTL = 24 * 60 * 60
+
+# Media delivery (core/media.py). Set one of these to hand the bytes to the
+# front proxy: an nginx internal location prefix such as "/protected-media/"
+# (aliased to MEDIA_ROOT), or the header name Apache/lighttpd expect.
+MEDIA_ACCEL_REDIRECT = os.getenv("MEDIA_ACCEL_REDIRECT", "")
+MEDIA_SENDFILE_HEADER = os.getenv("MEDIA_SENDFILE_HEADER", "")
+
+# Content-addressed media storage (core/storage.py, core/blobs.py)
+BLOB_GC_GRACE = 24 * 60 * 60
+
+# Background account deletion (accounts/purge.py)
+ACCOUNT_PURGE_BATCH_SIZE = 500
+ACCOUNT_PURGE_POLL_INTERVAL = 5
+ACCOUNT_PURGE_TIMEOUT = 30 * 60
+
+# Write-behind likes for hot posts (Posts/likebuffer.py)
+LIKE_BUFFER_HOT_THRESHOLD = 50
+LIKE_BUFFER_HOT_TTL = 60
+LIKE_BUFFER_FLUSH_INTERVAL_MS = 250
+
+# Coalesced post_update broadcasts (events/coalesce.py)
+POST_UPDATE_COALESCE_WINDOW_MS = 250
+POST_UPDATE_COALESCE_POLL_MS = 50
+
+# WebSocket topic subscriptions (events/consumers.py)
+WS_MAX_SUBSCRIPTIONS = 500
+
+# Transactional outbox for realtime events (events/outbox.py)
+OUTBOX_BATCH_SIZE = 500
+OUTBOX_POLL_INTERVAL = 0.1
+OUTBOX_MAX_ATTEMPTS = 10
+OUTBOX_MAX_BACKOFF = 5 * 60
+OUTBOX_METRICS_INTERVAL = 5
+
+# Per-user event streams for resuming WebSockets (events/streams.py)
+EVENT_STREAM_MAXLEN = 1000
+EVENT_STREAM_TTL = 24 * 60 * 60
+EVENT_STREAM_REPLAY_MAX = 500
+
+# Cached WebSocket authentication (SocialProjectDemo/middleware.py)
+WS_AUTH_CACHE_TTL = 5 * 60
+WS_AUTH_LOCAL_CACHE_SIZE = 10000
+WS_AUTH_LOCAL_CACHE_TTL = 10
+
+# Per-socket outbound queues (events/sendqueue.py)
+WS_SEND_QUEUE_SIZE = 256
+WS_SEND_QUEUE_COALESCE = ("post_update",)
+WS_SEND_QUEUE_DROPPABLE = ("post_update", "post_create")
+WS_SEND_QUEUE_METRICS_INTERVAL = 10
+# Frames an acking client may have unacknowledged before the writer waits.
+WS_SEND_WINDOW = 64
+WS_RESYNC_CLOSE_CODE = 4000
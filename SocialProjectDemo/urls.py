@@ -1,9 +1,9 @@
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 from django.conf import settings
-from django.conf.urls.static import static
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from core.views import health_check  
+from core.media import serve_media
+from core.views import health_check, metrics
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -13,7 +13,8 @@ urlpatterns = [
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/', include('Posts.urls')),
     path("health/", health_check),
+    path("metrics/", metrics),
     path('api/', include('Notifications.urls')),
     path('api/', include('Friendship.urls')),
-
-]+ static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    re_path(r"^%s(?P<path>.+)$" % settings.MEDIA_URL.lstrip("/"), serve_media),
+]
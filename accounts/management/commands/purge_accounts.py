@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from accounts import purge as purges
+from accounts.models import AccountPurge
+
+
+class Command(BaseCommand):
+    help = "Delete the data of accounts queued for deletion, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.ACCOUNT_PURGE_BATCH_SIZE)
+        parser.add_argument("--once", action="store_true", help="Drain the queue and exit instead of polling.")
+        parser.add_argument("--retry-failed", action="store_true", help="Queue failed purges again first.")
+
+    def handle(self, *args, batch_size, once, retry_failed, **options):
+        if retry_failed:
+            requeued = AccountPurge.objects.filter(status=AccountPurge.FAILED).update(
+                status=AccountPurge.PENDING, error=""
+            )
+            self.stdout.write(f"Re-queued {requeued} failed purges")
+
+        while True:
+            purge = purges.claim()
+            if purge is None:
+                if once:
+                    break
+                time.sleep(settings.ACCOUNT_PURGE_POLL_INTERVAL)
+                continue
+
+            self.stdout.write(f"Purging user {purge.user_id_snapshot} ({purge.pk})")
+            purges.run(purge, batch_size=batch_size, report=self.report)
+            style = self.style.SUCCESS if purge.status == AccountPurge.DONE else self.style.ERROR
+            self.stdout.write(style(f"  {purge.status} {purge.progress} {purge.error}".rstrip()))
+
+    def report(self, purge):
+        self.stdout.write(f"  {purge.stage}: {purge.progress}")
@@ -0,0 +1,269 @@
+"""
+Background removal of deleted accounts.
+
+``AccountMeView.delete`` only deactivates the user, blacklists their
+refresh tokens and queues an AccountPurge.  The ``purge_accounts`` worker
+then removes the data stage by stage, in small transactions of raw deletes,
+so no per-row signals or WebSocket sends fire.  What those signals would
+have kept in sync (counters, blob refcounts, caches, notification stamps)
+is fixed up here in bulk.  Every stage can be re-run, so a crashed or failed
+purge picks up where it stopped.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Now
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from core import blobs
+from Friendship.models import FriendRequest
+from Notifications import stamps
+from Notifications.models import Notifications
+from Posts import counters, fragments, timeline, uploads
+from Posts.models import Like, Media, MediaVariant, Post, UploadSession
+from Profile import graph
+from Profile.models import Profile
+from .models import AccountPurge
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("tokens", "notifications", "likes", "posts", "friendships", "uploads", "profile", "user")
+
+# The user's posts and everything that hangs off them (replies, reposts and
+# quotes by anyone cascade with their parent), with the depth of each row.
+SUBTREE_SQL = """
+WITH RECURSIVE subtree (id, parent_id, depth) AS (
+    SELECT id, parent_id, 0 FROM {table} WHERE author_id = %s
+  UNION ALL
+    SELECT child.id, child.parent_id, subtree.depth + 1
+    FROM {table} child JOIN subtree ON child.parent_id = subtree.id
+)
+SELECT id, parent_id, max(depth) FROM subtree GROUP BY id, parent_id
+"""
+
+MAX_POST_PASSES = 5
+
+
+def request_purge(user):
+    """Deactivate ``user`` right away and queue the removal of their data."""
+    with transaction.atomic():
+        user.is_active = False
+        user.save(update_fields=["is_active"])
+        blacklist_tokens(user.id)
+        return AccountPurge.objects.create(user=user, user_id_snapshot=user.id)
+
+
+def blacklist_tokens(user_id):
+    token_ids = OutstandingToken.objects.filter(
+        user_id=user_id, blacklistedtoken__isnull=True
+    ).values_list("id", flat=True)
+    created = BlacklistedToken.objects.bulk_create(
+        [BlacklistedToken(token_id=token_id) for token_id in token_ids],
+        ignore_conflicts=True,
+        batch_size=1000,
+    )
+    return len(created)
+
+
+def claim():
+    """Take the oldest queued purge, or one whose worker stopped reporting."""
+    stale = timezone.now() - timedelta(seconds=settings.ACCOUNT_PURGE_TIMEOUT)
+    with transaction.atomic():
+        purge = (
+            AccountPurge.objects.select_for_update(skip_locked=True)
+            .filter(Q(status=AccountPurge.PENDING) | Q(status=AccountPurge.RUNNING, updated_at__lt=stale))
+            .order_by("created_at")
+            .first()
+        )
+        if purge is not None:
+            purge.status = AccountPurge.RUNNING
+            purge.save(update_fields=["status", "updated_at"])
+    return purge
+
+
+def run(purge, batch_size=None, report=None):
+    purger = Purger(purge, batch_size or settings.ACCOUNT_PURGE_BATCH_SIZE, report)
+    try:
+        for stage in STAGES:
+            purge.stage = stage
+            purge.save(update_fields=["stage", "updated_at"])
+            getattr(purger, stage)()
+    except Exception as exc:
+        logger.exception("Purge %s of user %s failed", purge.pk, purge.user_id_snapshot)
+        purge.status = AccountPurge.FAILED
+        purge.error = repr(exc)
+        purge.save(update_fields=["status", "error", "updated_at"])
+        return purge
+
+    purge.status = AccountPurge.DONE
+    purge.stage = ""
+    purge.finished_at = timezone.now()
+    purge.save(update_fields=["status", "stage", "finished_at", "updated_at"])
+    return purge
+
+
+def _raw_delete(queryset):
+    """DELETE without collecting rows or sending signals."""
+    return queryset._raw_delete(queryset.db)
+
+
+def _delete_files(names):
+    # Shared blobs only lose a reference (gc_blobs removes them); files
+    # under legacy names are unlinked here.
+    default_avatar = Profile._meta.get_field("profile_image").default
+    for name in names:
+        if name and name != default_avatar:
+            default_storage.delete(name)
+
+
+class Purger:
+    def __init__(self, purge, batch_size, report=None):
+        self.purge = purge
+        self.user_id = purge.user_id_snapshot
+        self.batch_size = batch_size
+        self.report = report
+
+    def count(self, key, amount):
+        progress = self.purge.progress
+        progress[key] = progress.get(key, 0) + amount
+        self.purge.save(update_fields=["progress", "updated_at"])
+        if self.report:
+            self.report(self.purge)
+
+    def refresh_counters(self, post_ids):
+        """Recount posts that lost likes or children to the purge."""
+        post_ids = list(post_ids)
+        if post_ids:
+            posts = Post.objects.filter(id__in=post_ids)
+            counters.recount(posts)
+            posts.update(updated_at=Now())
+            fragments.invalidate_on_commit(post_ids)
+
+    def tokens(self):
+        self.count("tokens", blacklist_tokens(self.user_id))
+
+    def notifications(self):
+        rows_qs = Notifications.objects.filter(Q(to_user_id=self.user_id) | Q(actor_id=self.user_id))
+        while True:
+            with transaction.atomic():
+                rows = list(rows_qs.values_list("id", "to_user_id")[:self.batch_size])
+                if not rows:
+                    return
+                _raw_delete(Notifications.objects.filter(id__in=[row[0] for row in rows]))
+                stamps.touch(to_user for _, to_user in rows if to_user != self.user_id)
+            self.count("notifications", len(rows))
+
+    def likes(self):
+        while True:
+            with transaction.atomic():
+                rows = list(Like.objects.filter(user_id=self.user_id).values_list("id", "post_id")[:self.batch_size])
+                if not rows:
+                    return
+                _raw_delete(Like.objects.filter(id__in=[row[0] for row in rows]))
+                self.refresh_counters({post_id for _, post_id in rows})
+            self.count("likes", len(rows))
+
+    def subtree(self):
+        with connection.cursor() as cursor:
+            cursor.execute(SUBTREE_SQL.format(table=connection.ops.quote_name(Post._meta.db_table)), [self.user_id])
+            return cursor.fetchall()
+
+    def posts(self):
+        post_ct = ContentType.objects.get_for_model(Post)
+        # Someone may reply to a post while it is being purged; the chunk
+        # holding that post then fails its FK check and the tree is re-read.
+        for _ in range(MAX_POST_PASSES):
+            rows = self.subtree()
+            if not rows:
+                return
+            doomed = {row[0] for row in rows}
+            # Deepest first, so every row goes in the same chunk as its
+            # children or a later one.
+            rows.sort(key=lambda row: (-row[2], row[0]))
+            try:
+                for start in range(0, len(rows), self.batch_size):
+                    self.delete_posts(rows[start:start + self.batch_size], doomed, post_ct)
+            except IntegrityError:
+                logger.warning("Purge %s: posts changed underneath, re-reading", self.purge.pk)
+        raise RuntimeError("Posts kept changing during the purge")
+
+    def delete_posts(self, chunk, doomed, post_ct):
+        ids = [row[0] for row in chunk]
+        outside_parents = {parent for _, parent, _ in chunk if parent and parent not in doomed}
+        with transaction.atomic():
+            media = Media.objects.filter(post_id__in=ids)
+            names = [name for pair in media.values_list("file", "poster") for name in pair if name]
+            variants = MediaVariant.objects.filter(media__post_id__in=ids)
+            names += list(variants.values_list("file", flat=True))
+
+            notifs = Notifications.objects.filter(target_content_type=post_ct, target_object_id__in=ids)
+            stamps.touch(notifs.values_list("to_user_id", flat=True))
+
+            _raw_delete(variants)
+            _raw_delete(media)
+            _raw_delete(Like.objects.filter(post_id__in=ids))
+            _raw_delete(notifs)
+            _raw_delete(Post.objects.filter(id__in=ids))
+            blobs.adjust(names, -1)
+            self.refresh_counters(outside_parents)
+
+            transaction.on_commit(lambda: _delete_files(names))
+            transaction.on_commit(lambda: timeline.remove_posts(self.user_id, ids))
+            transaction.on_commit(lambda: fragments.invalidate(ids))
+        self.purge.progress["files"] = self.purge.progress.get("files", 0) + len(names)
+        self.count("posts", len(ids))
+
+    def friendships(self):
+        requests = FriendRequest.objects.filter(Q(from_user_id=self.user_id) | Q(to_user_id=self.user_id))
+        while True:
+            ids = list(requests.values_list("id", flat=True)[:self.batch_size])
+            if not ids:
+                break
+            _raw_delete(FriendRequest.objects.filter(id__in=ids))
+            self.count("friend_requests", len(ids))
+
+        profile_id = Profile.objects.filter(user_id=self.user_id).values_list("id", flat=True).first()
+        if profile_id is None:
+            return
+        friends = Profile.friends.through.objects.filter(Q(from_profile_id=profile_id) | Q(to_profile_id=profile_id))
+        blocks = Profile.blocked_users.through.objects.filter(Q(profile_id=profile_id) | Q(user_id=self.user_id))
+        with transaction.atomic():
+            friend_ids = list(
+                Profile.friends.through.objects.filter(from_profile_id=profile_id)
+                .values_list("to_profile__user_id", flat=True)
+            )
+            blockers = list(blocks.filter(user_id=self.user_id).values_list("profile__user_id", flat=True))
+            _raw_delete(friends)
+            _raw_delete(blocks)
+            transaction.on_commit(lambda: graph.forget(graph.FRIENDS, [self.user_id, *friend_ids]))
+            transaction.on_commit(lambda: graph.forget(graph.BLOCKS, [self.user_id, *blockers]))
+            transaction.on_commit(lambda: timeline.invalidate_users(friend_ids))
+        self.count("friends", len(friend_ids))
+
+    def uploads(self):
+        sessions = list(UploadSession.objects.filter(user_id=self.user_id))
+        for session in sessions:
+            uploads.discard(session)
+        self.count("uploads", len(sessions))
+
+    def profile(self):
+        with transaction.atomic():
+            profile = Profile.objects.filter(user_id=self.user_id).first()
+            if profile is None:
+                return
+            names = [profile.profile_image.name, profile.cover_image.name]
+            blobs.adjust(names, -1)
+            _raw_delete(Profile.objects.filter(pk=profile.pk))
+            transaction.on_commit(lambda: _delete_files(names))
+            transaction.on_commit(lambda: timeline.forget_author(self.user_id))
+
+    def user(self):
+        # Whatever is left is small: tokens, admin log entries.
+        User.objects.filter(pk=self.user_id).delete()
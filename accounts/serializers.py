@@ -10,6 +10,7 @@ from django.core.exceptions import ValidationError as DjangoValidationError
 
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
+from rest_framework.reverse import reverse
 from Profile.models import GENDER_CHOICES
 
 import datetime
@@ -17,6 +18,7 @@ import datetime
 from accounts.validators import FirstNameValidator, LastNameValidator, StrongPasswordValidator
 from accounts.validators import UsernameValidator
 from accounts.utils import get_user_or_error
+from accounts.models import AccountPurge
 
 User = get_user_model()
     
@@ -42,6 +44,20 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields=['id', 'username']
 
 
+class AccountPurgeSerializer(serializers.ModelSerializer):
+    status_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = AccountPurge
+        # The status URL is public, so ``error`` (an internal exception) stays
+        # in the database and the logs.
+        fields = ['id', 'status', 'stage', 'progress', 'created_at', 'finished_at', 'status_url']
+        read_only_fields = fields
+
+    def get_status_url(self, obj):
+        return reverse('accounts_api:account-purge', kwargs={'pk': obj.pk}, request=self.context.get('request'))
+
+
 class ForgotPwRequestSerializer( serializers.Serializer):
     identifier = serializers.CharField(
         required=True,
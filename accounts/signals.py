@@ -1,9 +1,11 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
+from django.db import transaction
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from Profile.models import Profile
 from django.core.mail import send_mail
 from django.db.models.signals import post_save
+from SocialProjectDemo.middleware import forget_user
 
 
 @receiver(post_save, sender=User)
@@ -22,3 +24,11 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     instance.profile.save()
+
+
+@receiver(post_save, sender=User, dispatch_uid="ws_auth_forget_on_save")
+@receiver(post_delete, sender=User, dispatch_uid="ws_auth_forget_on_delete")
+def forget_cached_ws_user(sender, instance, **kwargs):
+    """Password changes, deactivation and deletion must reach WebSocket auth."""
+    user_id = instance.pk
+    transaction.on_commit(lambda: forget_user(user_id))
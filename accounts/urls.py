@@ -6,6 +6,7 @@ from rest_framework.reverse import reverse
 
 from .views import (
     AccountMeView,
+    AccountPurgeView,
     CheckEmailView,
     CheckUsernameView,
     PasswordChangeView,
@@ -48,4 +49,5 @@ urlpatterns = [
     path('reset-password/',     ResetPasswordView.as_view(),     name='reset-password'),
     path("change_password/", PasswordChangeView.as_view(), name="change-password"),
     path('me/', AccountMeView.as_view(), name='accounts-me'),
+    path('purges/<uuid:pk>/', AccountPurgeView.as_view(), name='account-purge'),
 ]
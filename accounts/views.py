@@ -1,4 +1,3 @@
-from django.db import transaction
 from django.shortcuts import render
 from django.contrib.auth.models import User
 
@@ -9,19 +8,18 @@ from rest_framework import status
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework_simplejwt.token_blacklist.models import OutstandingToken, BlacklistedToken
 
+from .models import AccountPurge
+from .purge import request_purge
 from .serializers import (
-    PasswordChangeSerializer, SignInSerializer, SignUpSerializer,
+    AccountPurgeSerializer, PasswordChangeSerializer, SignInSerializer, SignUpSerializer,
     ForgotPwRequestSerializer, ForgotPwVerifySerializer, ResetPasswordSerializer, UserSerializer
 )
-from Profile.models import Profile
-from Posts.models import Post
 
 class AccountMeView(APIView):
     """
     GET  /api/accounts/me/    --> return the authenticated user's data
-    DELETE /api/accounts/me/   --> delete the authenticated user's account
+    DELETE /api/accounts/me/   --> deactivate the account and queue its deletion (202)
     """
     permission_classes = [IsAuthenticated]
 
@@ -29,33 +27,20 @@ class AccountMeView(APIView):
         serializer = UserSerializer(request.user, context={"request": request})
         return Response(serializer.data, status=status.HTTP_200_OK)
     
-    @transaction.atomic
     def delete(self, request, *args, **kwargs):
-        user = request.user
-
-        for outstanding_token in OutstandingToken.objects.filter(user=user):
-            BlacklistedToken.objects.get_or_create(token=outstanding_token)
-        try:
-            profile = Profile.objects.filter(user=user).first() 
-        except Profile.DoesNotExist:
-            profile = None
-        
-        if profile:
-            if profile.profile_image and profile.profile_image.name != "profile_images/default.jpg":
-                 profile.profile_image.delete(save=False)
-            if profile.cover_image:
-                profile.cover_image.delete(save=False)
-                
-        for post in Post.objects.filter(author=user):
-            for media in post.posted_media.all():
-                if media.file:
-                    media.file.delete(save=False) 
-                media.delete()
-                
-                
-        user.delete()
-
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        # The account is deactivated now; purge_accounts removes the data.
+        purge = request_purge(request.user)
+        serializer = AccountPurgeSerializer(purge, context={"request": request})
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+
+class AccountPurgeView(generics.RetrieveAPIView):
+    """
+    GET /api/accounts/purges/<id>/ --> progress of a queued account deletion
+    """
+    permission_classes = [AllowAny]
+    queryset = AccountPurge.objects.all()
+    serializer_class = AccountPurgeSerializer
 
 class MyTokenObtainPairView(TokenObtainPairView):
     def post(self, request, *args, **kwargs):
@@ -0,0 +1,259 @@
+"""
+Reference counting for ContentAddressedStorage blobs.
+
+Every file field listed in TRACKED_FIELDS adjusts ``Blob.refcount`` on
+save and delete, in the same transaction as the row change.  Writes that
+skip signals (``QuerySet.update``, raw SQL) can leave counts off, so
+``gc_blobs`` recounts from the tables before collecting, and it re-checks
+every candidate before removing its file.
+
+``register`` runs in the uploader's transaction but the file is already on
+disk, so a rollback leaves a file without a row.  ``track_untracked`` gives
+such files a row with no references, which ``collect`` then removes like
+any other unused blob.
+"""
+import os
+import time
+from collections import Counter
+from datetime import timedelta
+from itertools import islice
+
+from django.apps import apps
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Now
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+
+from core.storage import INCOMING_DIR, hashed_digest
+from .models import Blob
+
+TRACKED_FIELDS = {
+    "Posts.Media": ("file", "poster"),
+    "Posts.MediaVariant": ("file",),
+    "Profile.Profile": ("profile_image", "cover_image"),
+}
+
+
+def register(name, size):
+    """Create or refresh the row of a blob that was just stored."""
+    Blob.objects.bulk_create(
+        [Blob(name=name, size=size)],
+        update_conflicts=True,
+        unique_fields=["name"],
+        update_fields=["updated_at"],
+    )
+
+
+def adjust(names, delta):
+    """Add ``delta`` to the refcount of each blob name, once per occurrence."""
+    by_count = {}
+    for name, count in Counter(n for n in names if hashed_digest(n)).items():
+        by_count.setdefault(count, []).append(name)
+    for count, group in by_count.items():
+        Blob.objects.filter(name__in=group).update(
+            refcount=F("refcount") + delta * count, updated_at=Now()
+        )
+
+
+def _names(instance, fields):
+    return [getattr(instance, field).name for field in fields]
+
+
+def _tracked(sender, update_fields):
+    fields = TRACKED_FIELDS[sender._meta.label]
+    if update_fields is not None:
+        fields = tuple(field for field in fields if field in update_fields)
+    return fields
+
+
+def remember_old_names(sender, instance, raw=False, update_fields=None, **kwargs):
+    fields = _tracked(sender, update_fields)
+    old = None
+    if fields and instance.pk is not None and not raw:
+        old = sender._default_manager.filter(pk=instance.pk).values_list(*fields).first()
+    instance._blob_names = (fields, list(old or ()))
+
+
+def count_saved_names(sender, instance, raw=False, **kwargs):
+    fields, old = getattr(instance, "_blob_names", ((), []))
+    if raw or not fields:
+        return
+    new = _names(instance, fields)
+    adjust(list((Counter(old) - Counter(new)).elements()), -1)
+    adjust(list((Counter(new) - Counter(old)).elements()), 1)
+
+
+def release_deleted_names(sender, instance, **kwargs):
+    adjust(_names(instance, TRACKED_FIELDS[sender._meta.label]), -1)
+
+
+def connect_signals():
+    for label in TRACKED_FIELDS:
+        model = apps.get_model(label)
+        uid = f"blobs_{label}"
+        pre_save.connect(remember_old_names, sender=model, dispatch_uid=f"{uid}_pre_save")
+        post_save.connect(count_saved_names, sender=model, dispatch_uid=f"{uid}_post_save")
+        post_delete.connect(release_deleted_names, sender=model, dispatch_uid=f"{uid}_post_delete")
+
+
+def referenced(names=None):
+    """Counter of blob names referenced by the tracked fields (optionally only ``names``)."""
+    counts = Counter()
+    for label, fields in TRACKED_FIELDS.items():
+        model = apps.get_model(label)
+        for field in fields:
+            rows = model._default_manager.exclude(**{field: ""}).exclude(**{f"{field}__isnull": True})
+            if names is not None:
+                rows = rows.filter(**{f"{field}__in": names})
+            counts.update(
+                name for name in rows.values_list(field, flat=True).iterator() if hashed_digest(name)
+            )
+    return counts
+
+
+def reconcile(batch_size=1000):
+    """Recount every blob from the tables; returns the number of rows corrected."""
+    counts = referenced()
+    known = set(Blob.objects.values_list("name", flat=True))
+    Blob.objects.bulk_create(
+        [
+            Blob(name=name, size=default_storage.size(name))
+            for name in counts if name not in known and default_storage.exists(name)
+        ],
+        ignore_conflicts=True,
+        batch_size=batch_size,
+    )
+
+    corrected = 0
+    last_id = 0
+    while True:
+        batch = list(Blob.objects.filter(id__gt=last_id).order_by("id")[:batch_size])
+        if not batch:
+            return corrected
+        last_id = batch[-1].id
+        stale = [blob for blob in batch if blob.refcount != counts.get(blob.name, 0)]
+        for blob in stale:
+            blob.refcount = counts.get(blob.name, 0)
+            blob.updated_at = timezone.now()
+        Blob.objects.bulk_update(stale, ["refcount", "updated_at"])
+        corrected += len(stale)
+
+
+def _stored_files(root):
+    for directory, subdirs, files in os.walk(root):
+        if directory == root and INCOMING_DIR in subdirs:
+            subdirs.remove(INCOMING_DIR)
+        for filename in files:
+            path = os.path.join(directory, filename)
+            yield os.path.relpath(path, root).replace(os.sep, "/"), path
+
+
+def track_untracked(grace, batch_size=1000, dry_run=False):
+    """
+    Give stored blobs without a row (their upload's transaction rolled back)
+    an unreferenced row so ``collect`` removes them once it is due, and drop
+    spooled uploads older than ``grace``.  The insert waits on an upload of
+    the same bytes that has not committed yet, so a row it is about to
+    commit is never duplicated.  Returns the number of files found.
+    """
+    root = default_storage.location
+    cutoff = time.time() - grace
+
+    incoming = os.path.join(root, INCOMING_DIR)
+    if not dry_run and os.path.isdir(incoming):
+        for entry in os.scandir(incoming):
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+
+    found = 0
+    candidates = ((name, path) for name, path in _stored_files(root) if hashed_digest(name))
+    while True:
+        batch = dict(islice(candidates, batch_size))
+        if not batch:
+            return found
+        known = set(Blob.objects.filter(name__in=list(batch)).values_list("name", flat=True))
+        untracked = [name for name in batch if name not in known]
+        found += len(untracked)
+        if not dry_run:
+            Blob.objects.bulk_create(
+                [Blob(name=name, size=os.path.getsize(batch[name])) for name in untracked],
+                ignore_conflicts=True,
+            )
+
+
+def collect(grace, batch_size=500, dry_run=False):
+    """
+    Remove blobs nobody has referenced for ``grace`` seconds.  Candidate rows
+    stay locked while their files are removed, so a concurrent upload of the
+    same bytes waits in ``register`` and then stores the file again.
+    """
+    cutoff = timezone.now() - timedelta(seconds=grace)
+    removed, freed = 0, 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                Blob.objects.select_for_update(skip_locked=True)
+                .filter(refcount__lte=0, updated_at__lt=cutoff, id__gt=last_id)
+                .order_by("id")[:batch_size]
+            )
+            if not batch:
+                return removed, freed
+            last_id = batch[-1].id
+
+            still_used = referenced([blob.name for blob in batch])
+            doomed = [blob for blob in batch if blob.name not in still_used]
+            for blob in batch:
+                if blob.name in still_used:
+                    Blob.objects.filter(id=blob.id).update(refcount=still_used[blob.name])
+            if dry_run:
+                removed += len(doomed)
+                freed += sum(blob.size for blob in doomed)
+                continue
+
+            Blob.objects.filter(id__in=[blob.id for blob in doomed]).delete()
+            for blob in doomed:
+                default_storage.purge(blob.name)
+            removed += len(doomed)
+            freed += sum(blob.size for blob in doomed)
+
+
+def adopt(batch_size=100):
+    """
+    Move files stored under legacy (pre content-addressing) names into the
+    blob store and point every row at the blob.  Duplicates collapse into a
+    single file.  Field defaults such as the stock avatar are left alone.
+    Returns ``(files adopted, distinct blobs they became)``.
+    """
+    legacy = set()
+    skip = set()
+    for label, fields in TRACKED_FIELDS.items():
+        model = apps.get_model(label)
+        for field in fields:
+            default = model._meta.get_field(field).default
+            if isinstance(default, str):
+                skip.add(default)
+            legacy.update(
+                name for name in model._default_manager.values_list(field, flat=True).distinct().iterator()
+                if name and not hashed_digest(name)
+            )
+
+    adopted, blobs = 0, set()
+    pending = sorted(legacy - skip)
+    for start in range(0, len(pending), batch_size):
+        for name in pending[start:start + batch_size]:
+            if not default_storage.exists(name):
+                continue
+            with default_storage.open(name, "rb") as fh:
+                blob_name = default_storage.save(name, fh)
+            with transaction.atomic():
+                for label, fields in TRACKED_FIELDS.items():
+                    model = apps.get_model(label)
+                    for field in fields:
+                        model._default_manager.filter(**{field: name}).update(**{field: blob_name})
+            default_storage.delete(name)
+            adopted += 1
+            blobs.add(blob_name)
+    return adopted, len(blobs)
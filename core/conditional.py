@@ -0,0 +1,42 @@
+"""
+Conditional GET helpers for DRF views.
+
+Views compute cheap validators (an ETag digest of version stamps and a
+Last-Modified time) before serializing, return the 304 from
+``not_modified`` when the client already has that version, and otherwise
+attach the validators to the full response.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def _timestamp(last_modified):
+    if last_modified is None:
+        return None
+    if hasattr(last_modified, "timestamp"):
+        last_modified = last_modified.timestamp()
+    return int(last_modified)
+
+
+def not_modified(request, etag, last_modified=None):
+    """A 304 response if the request's validators still match, otherwise None."""
+    response = get_conditional_response(request, etag=etag, last_modified=_timestamp(last_modified))
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified=None):
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(_timestamp(last_modified))
+    # Payloads are per viewer: let clients keep them but always revalidate.
+    response["Cache-Control"] = "private, no-cache"
+    return response
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import blobs
+
+
+class Command(BaseCommand):
+    help = "Recount media blob references and delete blobs nothing has used for the grace period."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--adopt", action="store_true",
+            help="First move files with legacy names into the deduplicated blob store.",
+        )
+        parser.add_argument("--grace", type=int, default=settings.BLOB_GC_GRACE, help="Seconds a blob must be unused.")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true", help="Report what would be deleted.")
+
+    def handle(self, *args, adopt, grace, batch_size, dry_run, **options):
+        if adopt:
+            adopted, distinct = blobs.adopt()
+            self.stdout.write(f"Adopted {adopted} legacy files as {distinct} blobs")
+
+        corrected = blobs.reconcile(batch_size=batch_size)
+        self.stdout.write(f"Corrected {corrected} refcounts")
+
+        untracked = blobs.track_untracked(grace, dry_run=dry_run)
+        self.stdout.write(f"Found {untracked} stored files without a blob row")
+
+        removed, freed = blobs.collect(grace, batch_size=batch_size, dry_run=dry_run)
+        verb = "Would remove" if dry_run else "Removed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {removed} blobs ({freed / (1024 * 1024):.1f} MB)"))
@@ -0,0 +1,202 @@
+"""
+Media file delivery.
+
+Replaces ``django.conf.urls.static`` for MEDIA_URL.  Files of private
+authors are only handed to the author and their friends.  Single byte
+ranges are answered with 206 so video seeking doesn't refetch the file.
+Content-hashed names (see core.storage) are cached as immutable for a
+year.  When MEDIA_ACCEL_REDIRECT or MEDIA_SENDFILE_HEADER is set, the
+bytes are left to the front proxy and Django only checks access.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from core.storage import hashed_digest
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+READ_SIZE = 64 * 1024
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+_jwt = JWTAuthentication()
+
+
+def _request_user(request):
+    """The JWT user from the Authorization header or the access_token cookie."""
+    if request.user.is_authenticated:
+        return request.user
+    header = _jwt.get_header(request)
+    raw_token = _jwt.get_raw_token(header) if header else request.COOKIES.get("access_token")
+    if not raw_token:
+        return None
+    try:
+        return _jwt.get_user(_jwt.get_validated_token(raw_token))
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None
+
+
+def _private_authors(name):
+    """
+    None if ``name`` is public, else the ids of the private authors whose
+    posts use it.  Identical uploads share one content-addressed blob, so
+    a name is public as soon as any post using it is public.  Post media
+    that no row refers to any more is not served.
+    """
+    if not name.startswith("post_media/"):
+        return None
+
+    from Posts.models import Media, MediaVariant
+
+    # One lookup per column, each on its own index; an OR across the
+    # variants join can use none of them.
+    lookups = (
+        Media.objects.filter(file=name)
+        .values_list("post__author_id", "post__author__profile__is_private"),
+        Media.objects.filter(poster=name)
+        .values_list("post__author_id", "post__author__profile__is_private"),
+        MediaVariant.objects.filter(file=name)
+        .values_list("media__post__author_id", "media__post__author__profile__is_private"),
+    )
+    authors = set()
+    for lookup in lookups:
+        for author_id, is_private in lookup.order_by().distinct():
+            if not is_private:
+                return None
+            authors.add(author_id)
+    if not authors:
+        raise Http404
+    return authors
+
+
+def _can_view(request, author_ids):
+    from Profile import graph
+
+    user = _request_user(request)
+    if user is None:
+        return False
+    return user.id in author_ids or any(graph.are_friends(author_id, user.id) for author_id in author_ids)
+
+
+def parse_range(header, size):
+    """
+    ``(start, end)`` for a single ``bytes=`` range, None when the whole file
+    should be sent, ValueError when the range can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    start, end = match.groups()
+    if start == "":
+        length = int(end)
+        if length == 0:
+            raise ValueError(header)
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def _if_range_matches(request, etag, mtime):
+    if_range = request.headers.get("If-Range")
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(mtime)
+
+
+def _read(path, start, length):
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        while length > 0:
+            chunk = fh.read(min(READ_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@require_safe
+def serve_media(request, path):
+    name = posixpath.normpath(path).lstrip("/")
+    if name.startswith("."):
+        raise Http404
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, name)
+        st = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404
+
+    author_ids = _private_authors(name)
+    if author_ids is not None and not _can_view(request, author_ids):
+        # Same answer as a missing file, so private media can't be probed.
+        raise Http404
+
+    digest = hashed_digest(name)
+    etag = f'"{digest}"' if digest else f'"{st.st_size:x}-{int(st.st_mtime):x}"'
+    scope = "private" if author_ids is not None else "public"
+    if digest:
+        cache_control = f"{scope}, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        cache_control = f"{scope}, no-cache"
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(st.st_mtime))
+    if response is None:
+        response = _file_response(request, name, full_path, st, etag)
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(st.st_mtime)
+    response["Cache-Control"] = cache_control
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+def _file_response(request, name, full_path, st, etag):
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+    if settings.MEDIA_ACCEL_REDIRECT:
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = settings.MEDIA_ACCEL_REDIRECT + quote(name)
+        return response
+    if settings.MEDIA_SENDFILE_HEADER:
+        response = HttpResponse(content_type=content_type)
+        response[settings.MEDIA_SENDFILE_HEADER] = full_path
+        return response
+
+    size = st.st_size
+    byte_range = None
+    if "Range" in request.headers and _if_range_matches(request, etag, st.st_mtime):
+        try:
+            byte_range = parse_range(request.headers["Range"], size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+    if byte_range is None:
+        # FileResponse goes through wsgi.file_wrapper (sendfile) where available.
+        return FileResponse(open(full_path, "rb"), content_type=content_type)
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(_read(full_path, start, length), status=206, content_type=content_type)
+    response["Content-Length"] = str(length)
+    response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return response
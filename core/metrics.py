@@ -0,0 +1,49 @@
+"""
+Counters and gauges shared by every web and worker process.
+
+They live in one Redis hash so the numbers add up across processes; the
+/metrics/ endpoint returns a snapshot.  Recording a metric never raises.
+"""
+import logging
+
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = "metrics"
+
+
+def _redis():
+    return get_redis_connection("default")
+
+
+def incr(name, amount=1):
+    incr_many({name: amount})
+
+
+def incr_many(amounts):
+    try:
+        with _redis().pipeline(transaction=False) as pipe:
+            for name, amount in amounts.items():
+                if isinstance(amount, float):
+                    pipe.hincrbyfloat(METRICS_KEY, name, amount)
+                elif amount:
+                    pipe.hincrby(METRICS_KEY, name, amount)
+            pipe.execute()
+    except Exception:
+        logger.warning("Could not record metrics %s", list(amounts), exc_info=True)
+
+
+def gauge(name, value):
+    try:
+        _redis().hset(METRICS_KEY, name, value)
+    except Exception:
+        logger.warning("Could not record gauge %s", name, exc_info=True)
+
+
+def snapshot():
+    values = {}
+    for name, raw in _redis().hgetall(METRICS_KEY).items():
+        number = float(raw)
+        values[name.decode()] = int(number) if number.is_integer() else number
+    return dict(sorted(values.items()))
@@ -0,0 +1,19 @@
+from django.db import models
+
+
+class Blob(models.Model):
+    """One stored file of ContentAddressedStorage and how many rows point at it."""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.IntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['refcount', 'updated_at'], name='core_blob_gc_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return self.name
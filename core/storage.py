@@ -0,0 +1,93 @@
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+# <upload_to>/<2-char shard>/<64 hex digest><ext>
+HASHED_NAME_RE = re.compile(r"(?:^|/)[0-9a-f]{2}/([0-9a-f]{64})(?:\.[A-Za-z0-9]+)?$")
+
+# Uploads are spooled here, inside the storage root so the final rename
+# stays on one filesystem.
+INCOMING_DIR = ".incoming"
+
+
+def hashed_digest(name):
+    """The content digest embedded in a stored name, or None for legacy names."""
+    match = HASHED_NAME_RE.search(name or "")
+    return match.group(1) if match else None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every file under a digest of its bytes, once per upload
+    directory, so the same meme uploaded twice is one file on disk and a
+    media URL always refers to the same content.
+
+    Files are hashed while they are spooled to disk.  A ``core.Blob`` row
+    tracks every stored file.  ``delete`` leaves blobs alone because other
+    rows may share them: they are reference-counted by core.blobs and
+    removed by the ``gc_blobs`` command.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+
+        incoming = self.path(INCOMING_DIR)
+        os.makedirs(incoming, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=incoming)
+        try:
+            digest = hashlib.blake2b(digest_size=32)
+            size = 0
+            with os.fdopen(fd, "wb") as out:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+
+            hexdigest = digest.hexdigest()
+            directory = posixpath.dirname(name)
+            extension = posixpath.splitext(name)[1].lower()
+            blob_name = posixpath.join(directory, hexdigest[:2], f"{hexdigest}{extension}")
+            self.validate_blob_name(blob_name, max_length)
+
+            # Claim the row first: it waits on a gc_blobs run that is deleting
+            # this blob, so the file below is never removed after the check.
+            from core.blobs import register
+            register(blob_name, size)
+
+            full_path = self.path(blob_name)
+            if os.path.exists(full_path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                os.replace(tmp_path, full_path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(full_path, self.file_permissions_mode)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return blob_name
+
+    def validate_blob_name(self, name, max_length):
+        if max_length is not None and len(name) > max_length:
+            raise SuspiciousFileOperation(
+                f"Storage can not find an available filename for {name!r}: "
+                f"it is longer than {max_length} characters."
+            )
+
+    def delete(self, name):
+        if hashed_digest(name) is None:
+            super().delete(name)
+
+    def purge(self, name):
+        """Actually remove a blob; only gc_blobs calls this."""
+        super().delete(name)
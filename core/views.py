@@ -1,8 +1,11 @@
+from django.contrib.admin.views.decorators import staff_member_required
 from django.http import JsonResponse
 from django.views.decorators.http import require_GET
 from django.db import connections
 from django.db.utils import OperationalError
 
+from core import metrics as metrics_store
+
 @require_GET
 def health_check(request):
     db_conn = connections["default"]
@@ -11,3 +14,8 @@ def health_check(request):
     except OperationalError:
         return JsonResponse({"status": "error", "db": "unreachable"}, status=503)
     return JsonResponse({"status": "ok"})
+
+@require_GET
+@staff_member_required
+def metrics(request):
+    return JsonResponse(metrics_store.snapshot())
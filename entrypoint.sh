@@ -7,6 +7,11 @@ until pg_isready -h "$DB_HOST" -p "$DB_PORT" -U "$DB_USER"; do
 done
 echo ">>> Postgres is up!"
 
+# Workers pass their own command (see docker-compose.yml); web migrates first.
+if [ "$#" -gt 0 ]; then
+  exec "$@"
+fi
+
 echo ">>> Applying Django migrations..."
 python manage.py migrate --noinput
 
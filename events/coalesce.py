@@ -0,0 +1,151 @@
+"""
+Coalesced ``post_update`` broadcasts.
+
+Counter updates for a post are not sent to its topic straight away.  They
+are parked in Redis, where later updates for the same post replace
+earlier ones, and the ``coalesce_post_updates`` worker sends the
+latest counters once the post's first parked update is
+``POST_UPDATE_COALESCE_WINDOW_MS`` old.  A post getting hundreds of
+interactions a second therefore costs one group send per window.
+
+Requests write their updates to the outbox like any other event; the
+relay parks them here, and drops what is parked for a post once its
+``post_delete`` comes through.
+
+``events:post_update:latest``  hash of post id -> latest payload (JSON)
+``events:post_update:due``     sorted set of post id -> first parked at (ms)
+"""
+import json
+import logging
+import time
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from core import metrics
+from .utils import deliver, message, post_topic
+
+logger = logging.getLogger(__name__)
+
+LATEST_KEY = "events:post_update:latest"
+DUE_KEY = "events:post_update:due"
+
+# NX keeps the first parked time, so a busy post still goes out every window.
+_PARK_SCRIPT = """
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[2], 'NX', ARGV[3], ARGV[1])
+redis.call('HINCRBY', KEYS[3], 'post_update.queued', 1)
+return 0
+"""
+
+_TAKE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1], 'WITHSCORES', 'LIMIT', 0, ARGV[2])
+local taken = {}
+for i = 1, #due, 2 do
+    local payload = redis.call('HGET', KEYS[1], due[i])
+    redis.call('HDEL', KEYS[1], due[i])
+    redis.call('ZREM', KEYS[2], due[i])
+    if payload then
+        table.insert(taken, due[i])
+        table.insert(taken, payload)
+        table.insert(taken, due[i + 1])
+    end
+end
+return taken
+"""
+
+# Puts back what a failed send took, unless a newer update was parked
+# since; the earlier parked time wins, so the post is still due.
+_RESTORE_SCRIPT = """
+for i = 1, #ARGV, 3 do
+    redis.call('HSETNX', KEYS[1], ARGV[i], ARGV[i + 1])
+    local parked = redis.call('ZSCORE', KEYS[2], ARGV[i])
+    if not parked or tonumber(parked) > tonumber(ARGV[i + 2]) then
+        redis.call('ZADD', KEYS[2], ARGV[i + 2], ARGV[i])
+    end
+end
+return 0
+"""
+
+
+def _redis():
+    return get_redis_connection("default")
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def queue_post_update(data):
+    """Park the latest counters for ``data["id"]``; they go out within one window."""
+    park_post_updates([data])
+
+
+def park_post_updates(updates):
+    """``queue_post_update`` for several payloads, in one round trip."""
+    conn = _redis()
+    park = conn.register_script(_PARK_SCRIPT)
+    parked_at = _now_ms()
+    with conn.pipeline(transaction=False) as pipe:
+        for data in updates:
+            park(
+                keys=[LATEST_KEY, DUE_KEY, metrics.METRICS_KEY],
+                args=[data["id"], json.dumps(data), parked_at],
+                client=pipe,
+            )
+        pipe.execute()
+
+
+def discard_post_updates(post_ids):
+    """Drop parked updates, e.g. because the posts were just deleted."""
+    with _redis().pipeline() as pipe:
+        pipe.hdel(LATEST_KEY, *post_ids)
+        pipe.zrem(DUE_KEY, *post_ids)
+        pipe.execute()
+
+
+def send_due(window_ms=None, batch_size=1000):
+    """
+    Send every parked update whose window has passed, one message per post
+    and one batch for all of them.  Returns how many were sent; when the
+    send fails they are parked again for the next call.
+    """
+    window_ms = settings.POST_UPDATE_COALESCE_WINDOW_MS if window_ms is None else window_ms
+    now = _now_ms()
+    taken = _redis().register_script(_TAKE_SCRIPT)(
+        keys=[LATEST_KEY, DUE_KEY],
+        args=[now - window_ms, batch_size],
+    )
+    due = list(zip(taken[::3], taken[1::3], taken[2::3]))
+    if due:
+        try:
+            deliver([
+                ([post_topic(post_id.decode())], message("post_update", json.loads(payload)))
+                for post_id, payload, _ in due
+            ])
+        except Exception:
+            logger.warning("Could not send %d post updates, parking them again", len(due), exc_info=True)
+            _redis().register_script(_RESTORE_SCRIPT)(
+                keys=[LATEST_KEY, DUE_KEY],
+                args=[value for entry in due for value in entry],
+            )
+            metrics.incr("post_update.failed", len(due))
+            return 0
+    sent_at = _now_ms()
+    delays = [sent_at - int(parked_at) for _, _, parked_at in due]
+
+    if delays:
+        metrics.incr_many({
+            "post_update.sent": len(delays),
+            "post_update.delay_ms_total": sum(delays),
+        })
+        metrics.gauge("post_update.delay_ms_max", max(delays))
+        _record_ratio()
+    return len(delays)
+
+
+def _record_ratio():
+    """Parked updates per update actually sent, since the counters were reset."""
+    queued, sent = _redis().hmget(metrics.METRICS_KEY, "post_update.queued", "post_update.sent")
+    if sent and int(sent):
+        metrics.gauge("post_update.coalescing_ratio", round(int(queued or 0) / int(sent), 2))
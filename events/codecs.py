@@ -0,0 +1,73 @@
+"""
+Wire formats for ``/ws/events/``, chosen per connection by subprotocol.
+
+``events.json``              JSON text frames (also the default)
+``events.msgpack``           msgpack binary frames
+``events.json+deflate``      JSON, raw-deflated, in binary frames
+``events.msgpack+deflate``   msgpack, raw-deflated, in binary frames
+
+Daphne does not negotiate the permessage-deflate extension, so the
+compressed variants deflate each frame themselves (``inflateRaw`` on the
+client).  A group message reaches every consumer of a process as the same
+dict, so ``frame`` keeps the encodings on it and each one is computed
+once per process instead of once per socket.
+"""
+import json
+import zlib
+
+import msgpack
+
+JSON = "json"
+MSGPACK = "msgpack"
+
+SUBPROTOCOLS = {
+    "events.json": (JSON, False),
+    "events.msgpack": (MSGPACK, False),
+    "events.json+deflate": (JSON, True),
+    "events.msgpack+deflate": (MSGPACK, True),
+}
+DEFAULT = (JSON, False)
+
+COMPRESSION_LEVEL = 6
+
+_FRAMES = "_frames"
+
+
+def negotiate(offered):
+    """The first subprotocol the client offered that we speak, or None for plain JSON."""
+    for name in offered:
+        if name in SUBPROTOCOLS:
+            return name
+    return None
+
+
+def encode(payload, codec):
+    """``(text, bytes)`` for ``websocket.send``; exactly one of them is set."""
+    fmt, deflate = codec
+    if fmt == MSGPACK:
+        data = msgpack.packb(payload, use_bin_type=True)
+    else:
+        data = json.dumps(payload, separators=(",", ":"))
+        if not deflate:
+            return data, None
+        data = data.encode()
+    if deflate:
+        compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+        data = compressor.compress(data) + compressor.flush()
+    return None, data
+
+
+def decode(text, data, codec):
+    """Parse a frame from the client; clients never compress what they send."""
+    if data is not None and codec[0] == MSGPACK:
+        return msgpack.unpackb(data, raw=False)
+    return json.loads(text if text is not None else data)
+
+
+def frame(event, payload, codec):
+    """``encode(payload, codec)``, remembered on the group message ``event``."""
+    frames = event.setdefault(_FRAMES, {})
+    encoded = frames.get(codec)
+    if encoded is None:
+        encoded = frames[codec] = encode(payload, codec)
+    return encoded
@@ -1,31 +1,226 @@
+import asyncio
 import logging
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+
+from Posts.models import Post
+from Posts.visibility import can_view
+from . import codecs, sendqueue, streams
+from .utils import post_topic, timeline_topic, user_group
 
 logger = logging.getLogger(__name__)
 
+
+@database_sync_to_async
+def visible_post_ids(user, post_ids):
+    posts = Post.objects.filter(pk__in=post_ids).select_related("author__profile", "parent__author__profile")
+    return [post.id for post in posts if can_view(user, post)]
+
+
+def parse_ids(value):
+    if not isinstance(value, list):
+        return []
+    return [item for item in value if isinstance(item, int) and not isinstance(item, bool)]
+
+
 class EventConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Per-user events arrive on the user's own group.  Everything else is
+    opt-in: the client subscribes to the posts it has on screen and the
+    timelines it shows, and gets only their events::
+
+        {"type": "subscribe",   "posts": [12, 15], "timelines": [3]}
+        {"type": "unsubscribe", "posts": [12]}
+
+    Each request is answered with the topics that were actually added or
+    removed; posts the user may not see are left out.
+
+    Events on the user's own group carry a ``seq``.  A client reconnecting
+    to ``/ws/events/?last_seq=<n>`` gets the events it missed replayed, or a
+    ``resync_required`` frame if they are no longer all kept.  Either way a
+    ``hello`` frame with the current ``seq`` follows.  Live events arrive
+    in order; one that skips ahead has the gap filled from the stream first.
+
+    Frames are JSON text unless the client asks for another format with a
+    subprotocol (events/codecs.py).  They go out through a bounded queue
+    per socket (events/sendqueue.py); a socket that falls too far behind is
+    closed with ``WS_RESYNC_CLOSE_CODE`` and should reconnect with its
+    ``last_seq``.  Only clients that acknowledge what they received can
+    fall behind visibly::
+
+        {"type": "ack", "frames": 120}
+    """
+
     async def connect(self):
         user = self.scope["user"]
         if user.is_anonymous:
             return await self.close()
 
-        self.broadcast_group = "events_broadcast"
-        self.user_group = f"user_{user.id}"
+        self.user_group = user_group(user.id)
+        self.window = sendqueue.SendWindow(settings.WS_SEND_WINDOW)
+        # The user's own new posts come in like anyone else's.
+        self.topics = {timeline_topic(user.id)}
 
-        await self.accept()
-        await self.channel_layer.group_add(self.broadcast_group, self.channel_name)
+        subprotocol = codecs.negotiate(self.scope.get("subprotocols", []))
+        self.codec = codecs.SUBPROTOCOLS.get(subprotocol, codecs.DEFAULT)
+        await self.accept(subprotocol=subprotocol)
         await self.channel_layer.group_add(self.user_group, self.channel_name)
+        for topic in self.topics:
+            await self.channel_layer.group_add(topic, self.channel_name)
+        # Join first and replay second, so nothing falls in between; live
+        # events the replay already covered are dropped by their seq.
+        await self.resume(self.last_seq())
+        self.queue = sendqueue.SendQueue(settings.WS_SEND_QUEUE_SIZE)
+        self.closing = False
+        self.writer = asyncio.create_task(self.write())
 
         logger.info(f"WebSocket CONNECTED: user={user.id}")
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.broadcast_group, self.channel_name)
-        await self.channel_layer.group_discard(self.user_group, self.channel_name)
+        if hasattr(self, "writer"):
+            self.writer.cancel()
+        if hasattr(self, "user_group"):
+            await self.channel_layer.group_discard(self.user_group, self.channel_name)
+            for topic in self.topics:
+                await self.channel_layer.group_discard(topic, self.channel_name)
         logger.info(f"WebSocket DISCONNECTED: code={close_code}")
 
+    def last_seq(self):
+        values = parse_qs(self.scope.get("query_string", b"").decode()).get("last_seq")
+        try:
+            return int(values[0]) if values else None
+        except ValueError:
+            return None
+
+    async def resume(self, last_seq):
+        latest = await sync_to_async(streams.current)(self.user_group)
+        # The highest seq this socket has delivered, or that the client
+        # already had when it connected.
+        self.seq = latest
+        if last_seq is not None and last_seq != latest:
+            missed = await sync_to_async(streams.replay)(self.user_group, last_seq)
+            if missed == streams.RESYNC:
+                await self.send_json({"type": "resync_required", "data": {"seq": latest}})
+            else:
+                for seq, payload in missed:
+                    await self.send_json({**payload, "seq": seq})
+                    self.seq = max(self.seq, seq)
+        await self.send_json({"type": "hello", "data": {"seq": self.seq}})
+
+    async def catch_up(self):
+        """Fill a gap in the live events from the stream, or ask the client to resync."""
+        missed = await sync_to_async(streams.replay)(self.user_group, self.seq)
+        if missed == streams.RESYNC:
+            self.seq = await sync_to_async(streams.current)(self.user_group)
+            return await self.send_json({"type": "resync_required", "data": {"seq": self.seq}})
+        for seq, payload in missed:
+            await self.send_json({**payload, "seq": seq})
+            self.seq = seq
+
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        try:
+            content = codecs.decode(text_data, bytes_data, self.codec)
+        except (TypeError, ValueError):
+            return await self.send_json({"type": "error", "data": {"detail": "Malformed message."}})
+        await self.receive_json(content, **kwargs)
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        if text_data is not None or bytes_data is not None:
+            self.window.sent_frame()
+        await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+
+    async def send_json(self, content, close=False):
+        frame = codecs.encode(content, self.codec)
+        if hasattr(self, "queue") and not close:
+            return await self.enqueue(frame)
+        await self.send(text_data=frame[0], bytes_data=frame[1], close=close)
+
+    async def enqueue(self, frame, coalesce_key=None, droppable=False):
+        if self.closing:
+            return
+        try:
+            self.queue.put(frame, coalesce_key=coalesce_key, droppable=droppable)
+        except sendqueue.Overflow:
+            sendqueue.stats.count("ws.queue.overflow_closes")
+            logger.warning("WebSocket send queue full, closing: user=%s", self.scope["user"].id)
+            self.closing = True
+            self.writer.cancel()
+            await self.close(code=settings.WS_RESYNC_CLOSE_CODE)
+
+    async def write(self):
+        while True:
+            await self.window.wait()
+            text, data = await self.queue.get()
+            try:
+                await self.send(text_data=text, bytes_data=data)
+            except Exception as e:
+                logger.exception("Failed to send WS frame: %s", e)
+            if sendqueue.stats.due():
+                await sync_to_async(sendqueue.stats.flush)()
+
+    async def receive_json(self, content, **kwargs):
+        kind = content.get("type") if isinstance(content, dict) else None
+        if kind == "ack":
+            self.window.ack(content.get("frames"))
+        elif kind == "subscribe":
+            await self.subscribe(parse_ids(content.get("posts")), parse_ids(content.get("timelines")))
+        elif kind == "unsubscribe":
+            await self.unsubscribe(parse_ids(content.get("posts")), parse_ids(content.get("timelines")))
+        else:
+            await self.send_json({"type": "error", "data": {"detail": "Unknown message type."}})
+
+    async def subscribe(self, post_ids, timeline_ids):
+        room = settings.WS_MAX_SUBSCRIPTIONS - len(self.topics)
+        post_ids = [pid for pid in dict.fromkeys(post_ids) if post_topic(pid) not in self.topics][:max(room, 0)]
+        if post_ids:
+            post_ids = await visible_post_ids(self.scope["user"], post_ids)
+        room -= len(post_ids)
+        # Only public authors publish to their timeline topic; a private
+        # author's posts go to each friend's own group, so no check is needed.
+        timeline_ids = [
+            uid for uid in dict.fromkeys(timeline_ids) if timeline_topic(uid) not in self.topics
+        ][:max(room, 0)]
+
+        added = [post_topic(pid) for pid in post_ids] + [timeline_topic(uid) for uid in timeline_ids]
+        for topic in added:
+            await self.channel_layer.group_add(topic, self.channel_name)
+        self.topics.update(added)
+        await self.send_json({"type": "subscribed", "data": {"posts": post_ids, "timelines": timeline_ids}})
+
+    async def unsubscribe(self, post_ids, timeline_ids):
+        own = timeline_topic(self.scope["user"].id)
+        post_ids = [pid for pid in dict.fromkeys(post_ids) if post_topic(pid) in self.topics]
+        timeline_ids = [
+            uid for uid in dict.fromkeys(timeline_ids)
+            if timeline_topic(uid) in self.topics and timeline_topic(uid) != own
+        ]
+        removed = [post_topic(pid) for pid in post_ids] + [timeline_topic(uid) for uid in timeline_ids]
+        for topic in removed:
+            await self.channel_layer.group_discard(topic, self.channel_name)
+        self.topics.difference_update(removed)
+        await self.send_json({"type": "unsubscribed", "data": {"posts": post_ids, "timelines": timeline_ids}})
+
     async def event_message(self, event):
         payload = {"type": event["event_type"], "data": event["data"]}
+        if "seq" in event:
+            if event["seq"] > self.seq + 1:
+                # An earlier event is late or was lost; the stream has it.
+                await self.catch_up()
+            if event["seq"] <= self.seq:
+                return
+            self.seq = event["seq"]
+            payload["seq"] = event["seq"]
+        kind = event["event_type"]
+        coalesce_key = None
+        if kind in settings.WS_SEND_QUEUE_COALESCE and isinstance(event["data"], dict):
+            coalesce_key = (kind, event["data"].get("id"))
+        droppable = kind in settings.WS_SEND_QUEUE_DROPPABLE and "seq" not in event
         try:
-            await self.send_json(payload)
+            frame = codecs.frame(event, payload, self.codec)
         except Exception as e:
-            logger.exception("Failed to send WS payload %r: %s", payload, e)
+            return logger.exception("Failed to encode WS payload %r: %s", payload, e)
+        await self.enqueue(frame, coalesce_key=coalesce_key, droppable=droppable)
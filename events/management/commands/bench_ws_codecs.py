@@ -0,0 +1,122 @@
+import statistics
+import time
+import zlib
+
+from django.core.management.base import BaseCommand
+
+from events import codecs
+
+SAMPLE_POST = {
+    "id": 184467,
+    "avatar_url": "https://social.example.com/media/profile_images/3f/3f9a0c8e1b2d4e5f60718293a4b5c6d7e8f90a1b2c3d4e5f6a7b8c9d0e1f2a3b.webp",
+    "display_name": "Ana Popescu",
+    "username": "ana.popescu",
+    "created_at": "2026-10-18T12:04:55Z",
+    "type": "post",
+    "parent": None,
+    "description": (
+        "Sunset over the old harbour tonight, the light was unreal. "
+        "Coffee after at the usual place if anyone is around #sunset #travel"
+    ),
+    "posted_media": [
+        {
+            "id": 99120 + i,
+            "file": f"https://social.example.com/media/post_media/a{i}/a{i}77c0e3d1f2a4b5c6d7e8f90a1b2c3d4e5f6a7b8c9d0e1f2a3b4c5d6e7f8091.jpg",
+            "media_type": "photo",
+            "status": "ready",
+            "width": 4032,
+            "height": 3024,
+            "duration": None,
+            "poster": None,
+            "variants": [
+                {
+                    "name": name,
+                    "file": f"https://social.example.com/media/post_media/variants/{name}/b{i}c0e3d1f2a4b5c6d7e8f90a1b2c3d4e5f6a7b8c9d0e1f2a3b4c5d6e7f80.webp",
+                    "width": width,
+                    "height": width * 3 // 4,
+                }
+                for name, width in (("small", 320), ("medium", 720), ("large", 1280))
+            ],
+        }
+        for i in range(3)
+    ],
+    "comments_count": 12,
+    "likes_count": 348,
+    "reposts_count": 9,
+    "liked_by_user": False,
+    "reposted_by_user": False,
+}
+
+SAMPLE_NOTIFICATION = {
+    "id": 5512093,
+    "actor": "mihai.ionescu",
+    "actor_avatar": "https://social.example.com/media/profile_images/7c/7c1d2e3f4a5b6c7d8e9f0a1b2c3d4e5f6a7b8c9d0e1f2a3b4c5d6e7f8a9b0c1d.webp",
+    "notification_type": "post_like",
+    "message": "mihai.ionescu liked your post.",
+    "target_type": "post",
+    "target_id": 184467,
+    "parent_post_id": 184467,
+    "created_at": "2026-10-18T12:05:02.118392Z",
+    "is_read": False,
+    "active": True,
+}
+
+SAMPLE_UPDATE = {"id": 184467, "likes_count": 349, "comments_count": 12, "reposts_count": 9}
+
+PAYLOADS = {
+    "post_create": {"type": "post_create", "data": SAMPLE_POST},
+    "notification": {"type": "notification_message", "data": SAMPLE_NOTIFICATION, "seq": 1043},
+    "post_update": {"type": "post_update", "data": SAMPLE_UPDATE},
+}
+
+
+class Command(BaseCommand):
+    help = "Compare frame size and encode/decode CPU of the /ws/events/ wire formats."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=20000)
+        parser.add_argument("--consumers", type=int, default=200, help="Sockets per process sharing one group message.")
+
+    def handle(self, *args, repeat, consumers, **options):
+        for kind, payload in PAYLOADS.items():
+            self.stdout.write(f"\n{kind}")
+            baseline = None
+            for name, codec in codecs.SUBPROTOCOLS.items():
+                text, data = codecs.encode(payload, codec)
+                size = len(text.encode()) if text is not None else len(data)
+                baseline = baseline or size
+                encode_us = self.time(repeat, lambda: codecs.encode(payload, codec))
+                decode_us = self.time(repeat, lambda: self.decode(text, data, codec))
+                self.stdout.write(
+                    f"  {name:<24} {size:6d} B ({size / baseline:5.0%})  "
+                    f"encode {encode_us:6.2f} us  decode {decode_us:6.2f} us"
+                )
+
+        self.stdout.write(f"\npost_create to {consumers} sockets in one process")
+        for name, codec in codecs.SUBPROTOCOLS.items():
+            per_socket = self.time(max(repeat // consumers, 10), lambda: [
+                codecs.encode(PAYLOADS["post_create"], codec) for _ in range(consumers)
+            ])
+            shared = self.time(max(repeat // consumers, 10), lambda: [
+                codecs.frame(event, PAYLOADS["post_create"], codec)
+                for event in [{}] for _ in range(consumers)
+            ])
+            self.stdout.write(
+                f"  {name:<24} per socket {per_socket / 1000:7.2f} ms   once per message {shared / 1000:7.2f} ms"
+            )
+
+    def decode(self, text, data, codec):
+        if codec[1]:
+            data = zlib.decompress(data, -zlib.MAX_WBITS)
+            if codec[0] == codecs.JSON:
+                return codecs.decode(data.decode(), None, codec)
+        return codecs.decode(text, data, codec)
+
+    def time(self, repeat, run):
+        samples = []
+        for _ in range(5):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                run()
+            samples.append((time.perf_counter() - start) / repeat * 1_000_000)
+        return statistics.median(samples)
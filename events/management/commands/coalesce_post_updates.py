@@ -0,0 +1,25 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from events import coalesce
+
+
+class Command(BaseCommand):
+    help = "Send the parked post_update broadcasts, one per post per coalescing window."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--window", type=int, default=None,
+            help="Milliseconds to collect updates for a post (default: POST_UPDATE_COALESCE_WINDOW_MS).",
+        )
+        parser.add_argument("--once", action="store_true", help="Send what is due and exit instead of polling.")
+
+    def handle(self, *args, window, once, **options):
+        while True:
+            sent = coalesce.send_due(window)
+            if once:
+                break
+            if not sent:
+                time.sleep(settings.POST_UPDATE_COALESCE_POLL_MS / 1000)
@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from events import outbox
+from events.models import OutboxEvent
+
+
+class Command(BaseCommand):
+    help = "Send the realtime events written to the outbox to the channel layer."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.OUTBOX_BATCH_SIZE)
+        parser.add_argument("--once", action="store_true", help="Drain the outbox and exit instead of polling.")
+        parser.add_argument("--retry-dead", action="store_true", help="Give events that ran out of attempts another go first.")
+
+    def handle(self, *args, batch_size, once, retry_dead, **options):
+        if retry_dead:
+            revived = OutboxEvent.objects.filter(attempts__gte=settings.OUTBOX_MAX_ATTEMPTS).update(attempts=0)
+            self.stdout.write(f"Re-queued {revived} events")
+
+        reported = 0.0
+        while True:
+            sent = outbox.relay(batch_size)
+            if time.monotonic() - reported >= settings.OUTBOX_METRICS_INTERVAL:
+                outbox.record_backlog()
+                reported = time.monotonic()
+            if sent:
+                continue
+            if once:
+                break
+            time.sleep(settings.OUTBOX_POLL_INTERVAL)
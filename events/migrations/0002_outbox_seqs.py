@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 14:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0001_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='seqs',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
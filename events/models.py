@@ -1,3 +1,31 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class OutboxEvent(models.Model):
+    """
+    A realtime event, written in the same transaction as the change it
+    announces and sent to its groups by the relay_outbox worker.
+    """
+    event_type = models.CharField(max_length=50)
+    groups = models.JSONField()
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    # {group: seq} for the user groups, once the relay has numbered it, so
+    # a retried delivery keeps its place in each user's stream.
+    seqs = models.JSONField(null=True, blank=True)
+
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['available_at', 'id'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} -> {', '.join(self.groups)}"
@@ -0,0 +1,118 @@
+"""
+Relay for the realtime outbox.
+
+``send_real_time`` and friends only insert ``OutboxEvent`` rows in the
+caller's transaction.  ``relay`` claims the oldest deliverable rows, sends
+them to the channel layer as one batch (``utils.group_send_many``),
+numbering the ones for user groups in their stream (``streams.number``),
+and deletes them.  A batch that cannot be sent stays in the table and is
+retried with exponential backoff; after ``OUTBOX_MAX_ATTEMPTS`` the rows
+are kept for inspection but no longer retried.
+
+``post_update`` rows are not sent but parked with the coalescer
+(events/coalesce.py), which sends the latest counters per post once per
+window; a ``post_delete`` drops whatever is parked for its post.
+
+Several relays can run side by side.  Each holds a lock per user whose
+events it claimed while it numbers and sends them, so one user's events
+go out in the order of their seqs.  A row keeps the seqs it was given,
+and a retry sends it under the same ones.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from core import metrics
+from . import coalesce, streams
+from .models import OutboxEvent
+from .utils import deliver, message
+
+logger = logging.getLogger(__name__)
+
+# First key of the two-key advisory locks the relay takes per user.
+USER_LOCK_NAMESPACE = 7001
+
+
+def _deliverable(now):
+    return OutboxEvent.objects.filter(available_at__lte=now, attempts__lt=settings.OUTBOX_MAX_ATTEMPTS)
+
+
+def backoff(attempts):
+    return timedelta(seconds=min(2 ** attempts, settings.OUTBOX_MAX_BACKOFF))
+
+
+def relay(batch_size):
+    """Send one batch of due events; returns how many were sent."""
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            _deliverable(now).select_for_update(skip_locked=True).order_by("id")[:batch_size]
+        )
+        if not events:
+            return 0
+
+        lock_users(events)
+        updates = [event.data for event in events if event.event_type == "post_update"]
+        deleted = [event.data["id"] for event in events if event.event_type == "post_delete"]
+        outgoing = [event for event in events if event.event_type != "post_update"]
+        sends = [(event.groups, message(event.event_type, event.data)) for event in outgoing]
+        try:
+            if updates:
+                coalesce.park_post_updates(updates)
+            if deleted:
+                coalesce.discard_post_updates(deleted)
+            fresh = [index for index, event in enumerate(outgoing) if event.seqs is None]
+            for index, seqs in zip(fresh, streams.number([sends[index] for index in fresh])):
+                outgoing[index].seqs = seqs
+            deliver(streams.numbered(sends, [event.seqs for event in outgoing]))
+        except Exception as exc:
+            logger.warning("Could not relay %d outbox events", len(events), exc_info=True)
+            for event in events:
+                event.attempts += 1
+                event.available_at = now + backoff(event.attempts)
+                event.last_error = repr(exc)
+            OutboxEvent.objects.bulk_update(events, ["seqs", "attempts", "available_at", "last_error"])
+            metrics.incr("outbox.failed", len(events))
+            return 0
+
+        sent = OutboxEvent.objects.filter(id__in=[event.id for event in events])
+        sent._raw_delete(sent.db)
+
+    metrics.incr_many({"outbox.sent": len(events), "outbox.batches": 1})
+    metrics.gauge("outbox.delivery_lag_ms", int((timezone.now() - events[0].created_at).total_seconds() * 1000))
+    return len(events)
+
+
+def lock_users(events):
+    """Wait for the per-user locks of every user group in ``events``, in id order."""
+    if connection.vendor != "postgresql":
+        return
+    user_ids = sorted({
+        int(group[len(streams.USER_GROUP_PREFIX):])
+        for event in events
+        for group in event.groups
+        if streams.is_user_group(group)
+    })
+    if user_ids:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_advisory_xact_lock(%s, user_id) FROM unnest(%s::integer[]) AS user_id",
+                [USER_LOCK_NAMESPACE, user_ids],
+            )
+
+
+def record_backlog():
+    """Gauge how many events are waiting and how old the oldest one is."""
+    now = timezone.now()
+    backlog = _deliverable(now).aggregate(pending=Count("id"), oldest=Min("created_at"))
+    oldest = backlog["oldest"]
+    metrics.gauge("outbox.pending", backlog["pending"])
+    metrics.gauge("outbox.lag_ms", int((now - oldest).total_seconds() * 1000) if oldest else 0)
+    metrics.gauge(
+        "outbox.dead",
+        OutboxEvent.objects.filter(attempts__gte=settings.OUTBOX_MAX_ATTEMPTS).count(),
+    )
@@ -0,0 +1,146 @@
+"""
+Bounded outbound queues for ``EventConsumer``.
+
+Each socket reads its channel-layer messages straight into its own queue
+and a writer task sends them on, so a slow client backs up here, under
+our policy, instead of in channels_redis where messages are silently
+dropped once the channel is at capacity:
+
+* events listed in ``WS_SEND_QUEUE_COALESCE`` replace a queued event of
+  the same type for the same post, in place (only the latest counters
+  matter);
+* when the queue is full, the oldest event listed in
+  ``WS_SEND_QUEUE_DROPPABLE`` makes room;
+* anything else (notifications, numbered per-user events, deletes) is
+  never dropped; when there is no room for it the socket has fallen too
+  far behind and ``Overflow`` tells the consumer to close it so the
+  client resumes or resyncs.
+
+The writer cannot tell a slow socket by how long ``send`` takes: under
+Daphne it hands the frame to Twisted, which buffers without limit, and
+returns at once.  What the server can observe are acknowledgements, so a
+client that sends ``{"type": "ack", "frames": <n>}`` (the number of frames
+it has received on this socket) gets a ``SendWindow``: at most
+``WS_SEND_WINDOW`` frames in flight, after which the writer waits and the
+queue above fills.  Clients that never ack are not flow-controlled and a
+stalled one of them is not detected.
+"""
+import asyncio
+import itertools
+import os
+import socket
+import time
+import weakref
+from collections import OrderedDict
+
+from django.conf import settings
+
+from core import metrics
+
+
+class Overflow(Exception):
+    pass
+
+
+class SendQueue:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._droppable = OrderedDict()
+        self._ids = itertools.count()
+        self._ready = asyncio.Event()
+        stats.queues.add(self)
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, frame, coalesce_key=None, droppable=False):
+        if coalesce_key is not None and coalesce_key in self._items:
+            self._items[coalesce_key] = frame
+            stats.count("ws.queue.coalesced")
+            return
+
+        if len(self._items) >= self.maxsize:
+            if self._droppable:
+                victim, _ = self._droppable.popitem(last=False)
+                del self._items[victim]
+                stats.count("ws.queue.dropped")
+            elif droppable:
+                stats.count("ws.queue.dropped")
+                return
+            else:
+                raise Overflow()
+
+        key = coalesce_key if coalesce_key is not None else next(self._ids)
+        self._items[key] = frame
+        if droppable:
+            self._droppable[key] = None
+        stats.observe(len(self._items))
+        self._ready.set()
+
+    async def get(self):
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        key, frame = self._items.popitem(last=False)
+        self._droppable.pop(key, None)
+        return frame
+
+
+class SendWindow:
+    """Frames sent but not yet acknowledged; unlimited until the client first acks."""
+
+    def __init__(self, size):
+        self.size = size
+        self.sent = 0
+        self.acked = None
+        self._open = asyncio.Event()
+        self._open.set()
+
+    def sent_frame(self):
+        self.sent += 1
+        if self.acked is not None and self.sent - self.acked >= self.size:
+            self._open.clear()
+
+    def ack(self, frames):
+        if not isinstance(frames, int) or isinstance(frames, bool):
+            return
+        self.acked = max(self.acked or 0, min(frames, self.sent))
+        if self.sent - self.acked < self.size:
+            self._open.set()
+
+    async def wait(self):
+        if not self._open.is_set():
+            stats.count("ws.window.full")
+            await self._open.wait()
+
+
+class QueueStats:
+    """Per-process counters, written to the metrics hash every few seconds."""
+
+    def __init__(self):
+        self.queues = weakref.WeakSet()
+        self.counts = {}
+        self.depth_max = 0
+        self.flushed_at = time.monotonic()
+        self.process = f"{socket.gethostname()}-{os.getpid()}"
+
+    def count(self, name):
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def observe(self, depth):
+        self.depth_max = max(self.depth_max, depth)
+
+    def due(self):
+        return time.monotonic() - self.flushed_at >= settings.WS_SEND_QUEUE_METRICS_INTERVAL
+
+    def flush(self):
+        counts, self.counts = self.counts, {}
+        depth_max, self.depth_max = self.depth_max, 0
+        self.flushed_at = time.monotonic()
+        metrics.incr_many(counts)
+        metrics.gauge(f"ws.queue.depth.{self.process}", sum(len(queue) for queue in list(self.queues)))
+        metrics.gauge(f"ws.queue.depth_max.{self.process}", depth_max)
+
+
+stats = QueueStats()
@@ -0,0 +1,123 @@
+"""
+Numbered per-user event streams, so a reconnecting socket can catch up.
+
+Every event the relay sends to a ``user_<id>`` group gets the next number
+in that user's sequence (``events:seq:<group>``) and is kept in a capped
+Redis stream (``events:stream:<group>``) under the id ``0-<seq>``.  A
+client that reconnects with the last number it saw gets exactly the
+events after it, or is told to resync when those have been trimmed away.
+"""
+import json
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from core import metrics
+
+USER_GROUP_PREFIX = "user_"
+
+# KEYS are (seq key, stream key) pairs, ARGV the payloads then maxlen and ttl.
+_APPEND_SCRIPT = """
+local maxlen = ARGV[#ARGV - 1]
+local ttl = ARGV[#ARGV]
+local seqs = {}
+for i = 1, #KEYS, 2 do
+    local seq = redis.call('INCR', KEYS[i])
+    redis.call('XADD', KEYS[i + 1], 'MAXLEN', '~', maxlen, '0-' .. seq, 'event', ARGV[(i + 1) / 2])
+    redis.call('EXPIRE', KEYS[i], ttl)
+    redis.call('EXPIRE', KEYS[i + 1], ttl)
+    table.insert(seqs, seq)
+end
+return seqs
+"""
+
+RESYNC = "resync"
+
+
+def _redis():
+    return get_redis_connection("default")
+
+
+def _seq_key(group):
+    return f"events:seq:{group}"
+
+
+def _stream_key(group):
+    return f"events:stream:{group}"
+
+
+def is_user_group(group):
+    return group.startswith(USER_GROUP_PREFIX)
+
+
+def number(sends):
+    """
+    Give every message bound for a user group its place in that user's
+    stream.  ``sends`` are ``(groups, message)`` pairs; returns one
+    ``{group: seq}`` per send, empty when it has no user groups.
+    """
+    seqs = [{} for _ in sends]
+    appends = [
+        (index, group, message)
+        for index, (groups, message) in enumerate(sends)
+        for group in groups
+        if is_user_group(group)
+    ]
+    if not appends:
+        return seqs
+
+    keys, payloads = [], []
+    for _, group, message in appends:
+        keys += [_seq_key(group), _stream_key(group)]
+        payloads.append(json.dumps({"type": message["event_type"], "data": message["data"]}))
+    assigned = _redis().register_script(_APPEND_SCRIPT)(
+        keys=keys,
+        args=[*payloads, settings.EVENT_STREAM_MAXLEN, settings.EVENT_STREAM_TTL],
+    )
+    for (index, group, _), seq in zip(appends, assigned):
+        seqs[index][group] = seq
+    return seqs
+
+
+def numbered(sends, seqs):
+    """
+    ``sends`` ready for ``group_send_many``: a message for several user
+    groups is split, since each user numbers it differently, and keeps the
+    order of ``sends``.
+    """
+    out = []
+    for (groups, message), group_seqs in zip(sends, seqs):
+        other = [group for group in groups if group not in group_seqs]
+        if other:
+            out.append((other, message))
+        out += [([group], {**message, "seq": seq}) for group, seq in group_seqs.items()]
+    return out
+
+
+def current(group):
+    return int(_redis().get(_seq_key(group)) or 0)
+
+
+def replay(group, last_seq):
+    """
+    The events in ``group`` after ``last_seq`` as ``[(seq, payload)]``, or
+    ``RESYNC`` when some of them are gone or there are too many to replay.
+    """
+    conn = _redis()
+    latest = int(conn.get(_seq_key(group)) or 0)
+    if last_seq == latest:
+        return []
+    if last_seq > latest:
+        # The sequence expired and started over; the client can't catch up.
+        metrics.incr("events.resync")
+        return RESYNC
+
+    limit = settings.EVENT_STREAM_REPLAY_MAX
+    entries = conn.xrange(_stream_key(group), min=f"0-{last_seq + 1}", max="+", count=limit + 1)
+    missed = [(int(entry_id.split(b"-")[1]), json.loads(fields[b"event"])) for entry_id, fields in entries]
+    if not missed or missed[0][0] != last_seq + 1 or len(missed) > limit:
+        metrics.incr("events.resync")
+        return RESYNC
+
+    metrics.incr("events.replayed", len(missed))
+    return missed
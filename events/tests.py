@@ -1,3 +1,297 @@
-from django.test import TestCase
+import json
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from . import coalesce, outbox, streams
+from .consumers import EventConsumer
+from .models import OutboxEvent
+from .utils import message, send_real_time, send_real_time_many
+
+
+class RedisTestMixin:
+    groups = ()
+
+    def setUp(self):
+        super().setUp()
+        self.redis = get_redis_connection("default")
+        self.clear()
+        self.addCleanup(self.clear)
+
+    def clear(self):
+        for group in self.groups:
+            self.redis.delete(streams._seq_key(group), streams._stream_key(group))
+
+
+class StreamTests(RedisTestMixin, SimpleTestCase):
+    groups = ("user_901", "user_902")
+
+    def append(self, group, *kinds):
+        sends = [([group], message(kind, {"n": i})) for i, kind in enumerate(kinds)]
+        return streams.number(sends)
+
+    def test_numbers_each_user_separately(self):
+        seqs = streams.number([
+            (["user_901", "user_902", "post_1"], message("post_create", {})),
+            (["user_901"], message("notification_message", {})),
+        ])
+
+        self.assertEqual(seqs, [{"user_901": 1, "user_902": 1}, {"user_901": 2}])
+        self.assertEqual(streams.current("user_901"), 2)
+
+    def test_numbered_splits_user_groups_and_keeps_order(self):
+        sends = [(["user_901", "post_1"], message("post_create", {})), (["post_2"], message("post_update", {}))]
+
+        out = streams.numbered(sends, [{"user_901": 7}, {}])
+
+        self.assertEqual([groups for groups, _ in out], [["post_1"], ["user_901"], ["post_2"]])
+        self.assertEqual(out[1][1]["seq"], 7)
+        self.assertNotIn("seq", out[0][1])
+
+    def test_replay_returns_events_after_last_seq(self):
+        self.append("user_901", "a", "b", "c")
+
+        missed = streams.replay("user_901", 1)
+
+        self.assertEqual([(seq, payload["type"]) for seq, payload in missed], [(2, "b"), (3, "c")])
+        self.assertEqual(streams.replay("user_901", 3), [])
+
+    def test_replay_asks_for_resync_when_events_are_trimmed(self):
+        self.append("user_901", "a", "b", "c")
+        self.redis.xtrim(streams._stream_key("user_901"), maxlen=1, approximate=False)
+
+        self.assertEqual(streams.replay("user_901", 0), streams.RESYNC)
+
+    def test_replay_asks_for_resync_after_the_sequence_restarted(self):
+        self.append("user_901", "a")
+
+        self.assertEqual(streams.replay("user_901", 5), streams.RESYNC)
+
+    @override_settings(EVENT_STREAM_REPLAY_MAX=2)
+    def test_replay_asks_for_resync_when_too_far_behind(self):
+        self.append("user_901", "a", "b", "c")
+
+        self.assertEqual(streams.replay("user_901", 0), streams.RESYNC)
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class ResumeTests(RedisTestMixin, SimpleTestCase):
+    groups = ("user_903",)
+
+    def setUp(self):
+        super().setUp()
+        self.user = User(id=903, username="resume")
+
+    def append(self, *kinds):
+        streams.number([(["user_903"], message(kind, {})) for kind in kinds])
+
+    async def connect(self, query=""):
+        communicator = WebsocketCommunicator(EventConsumer.as_asgi(), f"/ws/events/{query}")
+        communicator.scope["user"] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def live(self, seq, kind="notification_message"):
+        await get_channel_layer().group_send(
+            "user_903", {**message(kind, {}), "seq": seq},
+        )
+
+    async def frames(self, communicator):
+        frames = []
+        while not await communicator.receive_nothing(timeout=0.05):
+            frames.append(await communicator.receive_json_from())
+        return [(frame["type"], frame.get("seq", frame.get("data", {}).get("seq"))) for frame in frames]
+
+    def test_reconnect_replays_missed_events(self):
+        self.append("a", "b", "c")
+
+        async def run():
+            communicator = await self.connect("?last_seq=1")
+            frames = await self.frames(communicator)
+            await communicator.disconnect()
+            return frames
+
+        self.assertEqual(async_to_sync(run)(), [("b", 2), ("c", 3), ("hello", 3)])
+
+    def test_reconnect_after_trim_asks_for_resync(self):
+        self.append("a", "b", "c")
+        self.redis.xtrim(streams._stream_key("user_903"), maxlen=1, approximate=False)
+
+        async def run():
+            communicator = await self.connect("?last_seq=0")
+            frames = await self.frames(communicator)
+            await communicator.disconnect()
+            return frames
+
+        self.assertEqual(async_to_sync(run)(), [("resync_required", 3), ("hello", 3)])
+
+    def test_live_events_already_seen_are_dropped(self):
+        self.append("a", "b")
+
+        async def run():
+            communicator = await self.connect("?last_seq=2")
+            await self.frames(communicator)
+            await self.live(2)
+            await self.live(3)
+            frames = await self.frames(communicator)
+            await communicator.disconnect()
+            return frames
+
+        self.assertEqual(async_to_sync(run)(), [("notification_message", 3)])
+
+    def test_gap_in_live_events_is_filled_from_the_stream(self):
+        self.append("a")
+
+        async def run():
+            communicator = await self.connect()
+            await self.frames(communicator)
+            # 2 and 3 are numbered, but 3 reaches the socket before 2.
+            self.append("b", "c")
+            await self.live(3, "c")
+            await self.live(2, "b")
+            frames = await self.frames(communicator)
+            await communicator.disconnect()
+            return frames
+
+        self.assertEqual(async_to_sync(run)(), [("b", 2), ("c", 3)])
+
+
+@override_settings(
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+    WS_SEND_WINDOW=2,
+    WS_SEND_QUEUE_SIZE=3,
+)
+class SendWindowTests(RedisTestMixin, SimpleTestCase):
+    groups = ("user_906",)
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(EventConsumer.as_asgi(), "/ws/events/")
+        communicator.scope["user"] = User(id=906, username="window")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual((await communicator.receive_json_from())["type"], "hello")
+        return communicator
+
+    async def push(self, *seqs):
+        for seq in seqs:
+            await get_channel_layer().group_send("user_906", {**message("notification_message", {}), "seq": seq})
+
+    async def received(self, communicator):
+        frames = []
+        while not await communicator.receive_nothing(timeout=0.05):
+            output = await communicator.receive_output()
+            if output["type"] == "websocket.close":
+                frames.append(("close", output["code"]))
+            else:
+                frames.append(json.loads(output["text"])["seq"])
+        return frames
+
+    def test_client_that_acks_gets_at_most_a_window_in_flight(self):
+        async def run():
+            communicator = await self.connect()
+            await communicator.send_json_to({"type": "ack", "frames": 1})
+            await self.push(1, 2, 3, 4)
+            first = await self.received(communicator)
+            await communicator.send_json_to({"type": "ack", "frames": 3})
+            second = await self.received(communicator)
+            await communicator.disconnect()
+            return first, second
+
+        self.assertEqual(async_to_sync(run)(), ([1, 2], [3, 4]))
+
+    def test_client_that_stops_acking_is_closed_when_the_queue_fills(self):
+        async def run():
+            communicator = await self.connect()
+            await communicator.send_json_to({"type": "ack", "frames": 1})
+            await self.push(1, 2, 3, 4, 5, 6)
+            return await self.received(communicator)
+
+        # 1 and 2 fill the window, 3-5 the queue, and 6 has no room.
+        self.assertEqual(async_to_sync(run)(), [1, 2, ("close", 4000)])
+
+    def test_client_that_never_acks_is_not_held_back(self):
+        async def run():
+            communicator = await self.connect()
+            await self.push(1, 2, 3, 4, 5, 6)
+            frames = await self.received(communicator)
+            await communicator.disconnect()
+            return frames
+
+        self.assertEqual(async_to_sync(run)(), [1, 2, 3, 4, 5, 6])
+
+
+class OutboxRelayTests(RedisTestMixin, TestCase):
+    groups = ("user_904", "user_905")
+
+    def test_relay_sends_and_deletes(self):
+        send_real_time("notification_message", "user_904", {"id": 1})
+        send_real_time_many("post_create", ["user_904", "user_905", "timeline_3"], {"id": 2})
+
+        with mock.patch("events.outbox.deliver") as deliver:
+            self.assertEqual(outbox.relay(10), 2)
+
+        sends = deliver.call_args.args[0]
+        self.assertEqual(
+            [(groups, sent.get("seq")) for groups, sent in sends],
+            [(["user_904"], 1), (["timeline_3"], None), (["user_904"], 2), (["user_905"], 1)],
+        )
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_failed_batch_is_retried_later_under_the_same_seqs(self):
+        send_real_time("notification_message", "user_904", {"id": 1})
+
+        with mock.patch("events.outbox.deliver", side_effect=ConnectionError("down")):
+            self.assertEqual(outbox.relay(10), 0)
+
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.attempts, 1)
+        self.assertEqual(event.seqs, {"user_904": 1})
+        self.assertGreater(event.available_at, timezone.now())
+        self.assertIn("down", event.last_error)
+
+        # Not due yet.
+        with mock.patch("events.outbox.deliver") as deliver:
+            self.assertEqual(outbox.relay(10), 0)
+        deliver.assert_not_called()
+
+        OutboxEvent.objects.update(available_at=timezone.now())
+        with mock.patch("events.outbox.deliver") as deliver:
+            self.assertEqual(outbox.relay(10), 1)
+
+        self.assertEqual(deliver.call_args.args[0][0][1]["seq"], 1)
+        self.assertEqual(streams.current("user_904"), 1)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_post_updates_are_parked_and_dropped_on_delete(self):
+        self.addCleanup(coalesce.discard_post_updates, [906, 907])
+        send_real_time("post_update", "post_906", {"id": 906, "likes_count": 1})
+        send_real_time("post_update", "post_906", {"id": 906, "likes_count": 2})
+        send_real_time("post_update", "post_907", {"id": 907, "likes_count": 1})
+        send_real_time("post_delete", "post_907", {"id": 907})
+
+        with mock.patch("events.outbox.deliver") as deliver:
+            self.assertEqual(outbox.relay(10), 4)
+
+        self.assertEqual([sent["event_type"] for _, sent in deliver.call_args.args[0]], ["post_delete"])
+        latest = self.redis.hgetall(coalesce.LATEST_KEY)
+        self.assertEqual(json.loads(latest[b"906"])["likes_count"], 2)
+        self.assertNotIn(b"907", latest)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=2)
+    def test_events_stop_retrying_after_max_attempts(self):
+        send_real_time("notification_message", "user_904", {"id": 1})
+
+        for _ in range(3):
+            OutboxEvent.objects.update(available_at=timezone.now())
+            with mock.patch("events.outbox.deliver", side_effect=ConnectionError("down")):
+                outbox.relay(10)
+
+        self.assertEqual(OutboxEvent.objects.get().attempts, 2)
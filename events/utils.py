@@ -1,12 +1,154 @@
+import time
+from collections import defaultdict
+
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
+from channels_redis.core import RedisChannelLayer
+
+from .models import OutboxEvent
+
+# channels_redis' group_send script, for many channel keys at once; it also
+# trims expired messages, which group_send does in a separate round trip.
+# Messages are scored a microsecond apart: channels_redis prefixes each
+# one with random bytes, so equal scores would pop in random order.
+_SEND_MANY_SCRIPT = """
+local over_capacity = 0
+local current_time = tonumber(ARGV[#ARGV - 1])
+local expiry = tonumber(ARGV[#ARGV])
+for i = 1, #KEYS do
+    redis.call('ZREMRANGEBYSCORE', KEYS[i], 0, current_time - expiry)
+    if redis.call('ZCOUNT', KEYS[i], '-inf', '+inf') < tonumber(ARGV[i + #KEYS]) then
+        redis.call('ZADD', KEYS[i], string.format('%.6f', current_time + (i - 1) * 0.000001), ARGV[i])
+        redis.call('EXPIRE', KEYS[i], expiry)
+    else
+        over_capacity = over_capacity + 1
+    end
+end
+return over_capacity
+"""
+SCORE_STEP = 0.000001
+
+_last_score = 0.0
+
+
+def user_group(user_id):
+    """Everything addressed to one user: notifications, their own post state."""
+    return f"user_{user_id}"
+
+
+def post_topic(post_id):
+    """Counter updates, deletes and new replies for one post."""
+    return f"post_{post_id}"
+
+
+def timeline_topic(user_id):
+    """New posts by one public author."""
+    return f"timeline_{user_id}"
+
 
 def send_real_time(event_type: str, recipient_group: str, data: dict):
-    async_to_sync(get_channel_layer().group_send)(
-        recipient_group,
-        {
-            "type": "event_message",   
-            "event_type": event_type,
-            "data": data,
-        }
-    )
\ No newline at end of file
+    """
+    Queue an event for ``recipient_group``.  It is written to the outbox in
+    the caller's transaction and sent by the relay_outbox worker once that
+    commits, so rolled-back changes are never announced.
+    """
+    OutboxEvent.objects.create(event_type=event_type, groups=[recipient_group], data=data)
+
+
+def send_real_time_many(event_type: str, recipient_groups, data: dict):
+    """Queue one payload for many groups, as a single outbox row."""
+    recipient_groups = list(recipient_groups)
+    if recipient_groups:
+        OutboxEvent.objects.create(event_type=event_type, groups=recipient_groups, data=data)
+
+
+def send_real_time_each(event_type: str, payloads):
+    """Queue a different payload for each group; ``payloads`` is (group, data) pairs."""
+    send_real_time_batch((event_type, group, data) for group, data in payloads)
+
+
+def send_real_time_batch(events):
+    """
+    Queue several events with one INSERT; ``events`` is (event_type, groups,
+    data) triples, where ``groups`` is one group name or a list of them.
+    """
+    events = [
+        OutboxEvent(event_type=event_type, groups=[groups] if isinstance(groups, str) else list(groups), data=data)
+        for event_type, groups, data in events
+    ]
+    if events:
+        OutboxEvent.objects.bulk_create(events)
+
+
+def message(event_type, data):
+    return {"type": "event_message", "event_type": event_type, "data": data}
+
+
+def deliver(sends):
+    """Send ``(groups, message)`` pairs right away, bypassing the outbox."""
+    async_to_sync(group_send_many)(sends)
+
+
+async def group_send_many(sends):
+    """
+    Deliver ``sends``, a list of ``(groups, message)``, in one batch: the
+    members of every group are read with one pipeline per Redis shard, each
+    message is serialized once per receiving process rather than per group,
+    and all of it is queued with one script call per shard.  Layers other
+    than RedisChannelLayer fall back to plain group_send.
+    """
+    layer = get_channel_layer()
+    sends = [(list(groups), message) for groups, message in sends]
+    if not isinstance(layer, RedisChannelLayer):
+        for groups, message in sends:
+            for group in groups:
+                await layer.group_send(group, message)
+        return
+
+    members = await _group_members(layer, {group for groups, _ in sends for group in groups})
+
+    batches = defaultdict(lambda: ([], [], []))
+    for groups, message in sends:
+        channels = list(dict.fromkeys(channel for group in groups for channel in members[group]))
+        if not channels:
+            continue
+        by_connection, key_messages, key_capacities = layer._map_channel_keys_to_connection(channels, message)
+        for index, channel_keys in by_connection.items():
+            keys, messages, capacities = batches[index]
+            for key in channel_keys:
+                keys.append(key)
+                messages.append(key_messages[key])
+                capacities.append(key_capacities[key])
+
+    for index, (keys, messages, capacities) in batches.items():
+        await layer.connection(index).eval(
+            _SEND_MANY_SCRIPT, len(keys), *keys, *messages, *capacities, _score_base(len(keys)), layer.expiry
+        )
+
+
+def _score_base(count):
+    """Where a batch of ``count`` messages starts: after this process's previous batch."""
+    global _last_score
+    base = max(time.time(), _last_score + SCORE_STEP)
+    _last_score = base + count * SCORE_STEP
+    return base
+
+
+async def _group_members(layer, groups):
+    by_connection = defaultdict(list)
+    for group in groups:
+        assert layer.valid_group_name(group), "Group name not valid"
+        by_connection[layer.consistent_hash(group)].append(group)
+
+    members = {}
+    cutoff = int(time.time()) - layer.group_expiry
+    for index, shard_groups in by_connection.items():
+        pipe = layer.connection(index).pipeline()
+        for group in shard_groups:
+            key = layer._group_key(group)
+            pipe.zremrangebyscore(key, min=0, max=cutoff)
+            pipe.zrange(key, 0, -1)
+        replies = await pipe.execute()
+        for group, names in zip(shard_groups, replies[1::2]):
+            members[group] = [name.decode("utf8") for name in names]
+    return members